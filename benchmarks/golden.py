@@ -0,0 +1,259 @@
+# Runs the whole stamper over a set of reference clips with hand-checked
+# TWB CSVs, and reports how accurate it was and how fast, per clip and
+# overall. Compared against a saved baseline, it fails if either accuracy or
+# speed got worse by more than a tolerance.
+#
+# python -m benchmarks.golden [--corpus DIR] [--save-baseline]
+#
+# The corpus directory has a corpus.json listing the clips:
+#
+#   [
+#     {"video": "wednesday_1.mp4", "expected": "wednesday_1.csv", "preset": "FULLSCREEN_1080P"},
+#     ...
+#   ]
+#
+# Paths are relative to the corpus directory. "settings" can override any
+# preset setting for a clip (eg. {"NETPLAY": false}). Each expected CSV is
+# the TWB CSV for the clip as it should be, with the URL column carrying each
+# set's ?t= timestamp.
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+
+from utils.capture_pool import CapturePool
+from utils.presets import load_presets, settings_from_preset
+from utils.shards import merge_shard_games
+from utils.stamper import Stamper
+
+DEFAULT_CORPUS_DIR = os.path.join("benchmarks", "golden")
+
+# Any URL will do, it's only there so found sets get a ?t= like the
+# expected ones
+CORPUS_URL = "https://example.com/golden"
+
+# A found set this close to an expected one counts as the same set (seconds)
+TIMESTAMP_TOLERANCE = 10
+
+# How much worse than the baseline is allowed before failing. Accuracy is in
+# absolute terms (0.01 = one percentage point), speed is relative (0.2 = 20%
+# slower).
+DEFAULT_ACCURACY_TOLERANCE = 0.01
+DEFAULT_SPEED_TOLERANCE = 0.2
+
+ACCURACY_METRICS = ["precision", "recall", "names", "teams"]
+STAGES = ["setup", "scan", "names", "teams"]
+
+
+# Seconds from the t= of a timestamped URL (12s, 12m34s or 1h23m45s), 0 if
+# there isn't one
+def url_seconds(url: str) -> int:
+    match = re.search(r'[?&]t=(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?', url)
+    if not match:
+        return 0
+    (h, m, s) = [int(part or 0) for part in match.groups()]
+    return h*3600 + m*60 + s
+
+
+# The sets in a TWB CSV, in the same shape as the stamper's games
+def read_expected(path: str):
+    with open(path, newline="") as f:
+        return [
+            dict(
+                seconds = url_seconds(row['URL']),
+                p1name  = row['P1Name'],
+                p2name  = row['P2Name'],
+                p1team  = (row['P1Char1'], row['P1Char2'], row['P1Char3']),
+                p2team  = (row['P2Char1'], row['P2Char2'], row['P2Char3']),
+            )
+            for row in csv.DictReader(f)
+        ]
+
+
+# Pair up found and expected sets by time, each one used at most once.
+# Returns a list of (found, expected).
+def match_sets(found, expected):
+    pairs = []
+    unused = list(expected)
+    for game in sorted(found, key=lambda game: game['seconds']):
+        candidates = [
+            want for want in unused
+            if abs(want['seconds'] - game['seconds']) <= TIMESTAMP_TOLERANCE
+        ]
+        if candidates:
+            want = min(candidates, key=lambda want: abs(want['seconds'] - game['seconds']))
+            unused.remove(want)
+            pairs.append((game, want))
+    return pairs
+
+
+def fraction(count, total):
+    return count / total if total else 1.0
+
+
+# Accuracy of found sets against expected ones. Names and teams are only
+# judged on sets that were found, one point per player.
+def score(found, expected):
+    pairs = match_sets(found, expected)
+    names = sum(
+        (game['p1name'] == want['p1name']) + (game['p2name'] == want['p2name'])
+        for (game, want) in pairs
+    )
+    teams = sum(
+        (tuple(game['p1team'][:3]) == want['p1team']) + (tuple(game['p2team'][:3]) == want['p2team'])
+        for (game, want) in pairs
+    )
+    return dict(
+        precision = fraction(len(pairs), len(found)),
+        recall    = fraction(len(pairs), len(expected)),
+        names     = fraction(names, 2*len(pairs)),
+        teams     = fraction(teams, 2*len(pairs)),
+    )
+
+
+# Run the stamper over one clip, returning its sets and timings. overrides
+# apply on top of every clip's own settings.
+def run_clip(corpus_dir, clip, config, overrides=None):
+    settings = settings_from_preset(config, clip.get('preset', "DEFAULT"), url=CORPUS_URL)
+    settings.update(clip.get('settings', {}))
+    settings.update(overrides or {})
+    settings['MAKE_CSV'] = False
+    capture_pool = CapturePool(os.path.join(corpus_dir, clip['video']), max_handles=2)
+    stamper = Stamper(
+        **settings,
+        capture_pool  = capture_pool,
+        start_seconds = 0,
+        total_seconds = capture_pool.total_seconds,
+        outfile_name  = None
+    )
+    started = time.perf_counter()
+    try:
+        stamper.run()
+    finally:
+        capture_pool.close()
+    wall_seconds = time.perf_counter() - started
+    games = merge_shard_games([stamper.games], settings['NETPLAY'])
+    return dict(
+        sets          = [game for game in games if not game['next_in_set']],
+        video_seconds = capture_pool.total_seconds,
+        wall_seconds  = wall_seconds,
+        stages        = stamper.stage_seconds,
+    )
+
+
+def run_corpus(corpus_dir, overrides=None):
+    with open(os.path.join(corpus_dir, "corpus.json")) as f:
+        clips = json.load(f)
+    config = load_presets()
+    results = {}
+    for clip in clips:
+        logging.info(f"Running {clip['video']}")
+        run = run_clip(corpus_dir, clip, config, overrides)
+        expected = read_expected(os.path.join(corpus_dir, clip['expected']))
+        results[clip['video']] = dict(
+            **score(run['sets'], expected),
+            found         = len(run['sets']),
+            expected      = len(expected),
+            video_seconds = run['video_seconds'],
+            wall_seconds  = run['wall_seconds'],
+            stages        = run['stages'],
+        )
+    return results
+
+
+# Everything added up over the whole corpus. Accuracy is averaged per clip so
+# a long clip doesn't drown out the rest.
+def totals(results):
+    clips = list(results.values())
+    total = {metric: sum(clip[metric] for clip in clips) / len(clips) for metric in ACCURACY_METRICS}
+    for key in ["found", "expected", "video_seconds", "wall_seconds"]:
+        total[key] = sum(clip[key] for clip in clips)
+    total['stages'] = {stage: sum(clip['stages'].get(stage, 0) for clip in clips) for stage in STAGES}
+    return total
+
+
+def print_table(results, baseline):
+    print(f"{'clip':<32}{'sets':>9}{'prec':>7}{'recall':>7}{'names':>7}{'teams':>7}{'x realtime':>12}")
+    rows = dict(results, TOTAL=totals(results))
+    for (name, result) in rows.items():
+        speed = result['video_seconds'] / result['wall_seconds'] if result['wall_seconds'] else 0
+        print(
+            f"{name[:31]:<32}{result['found']:>4}/{result['expected']:<4}"
+            f"{result['precision']:>7.2f}{result['recall']:>7.2f}{result['names']:>7.2f}{result['teams']:>7.2f}"
+            f"{speed:>12.1f}"
+        )
+        if baseline and name in baseline:
+            was = baseline[name]
+            was_speed = was['video_seconds'] / was['wall_seconds'] if was['wall_seconds'] else 0
+            print(
+                f"{'  baseline':<32}{was['found']:>4}/{was['expected']:<4}"
+                f"{was['precision']:>7.2f}{was['recall']:>7.2f}{was['names']:>7.2f}{was['teams']:>7.2f}"
+                f"{was_speed:>12.1f}"
+            )
+    total = rows['TOTAL']
+    print("\nSeconds per stage" + (" (baseline)" if baseline else "") + ":")
+    for stage in STAGES:
+        line = f"  {stage:<8}{total['stages'][stage]:8.1f}"
+        if baseline and 'TOTAL' in baseline:
+            line += f"  ({baseline['TOTAL']['stages'].get(stage, 0):.1f})"
+        print(line)
+
+
+# What got worse than the baseline by more than the tolerances, as messages
+def regressions(results, baseline, accuracy_tolerance, speed_tolerance):
+    problems = []
+    rows = dict(results, TOTAL=totals(results))
+    for (name, result) in rows.items():
+        if name not in baseline:
+            continue
+        was = baseline[name]
+        for metric in ACCURACY_METRICS:
+            if result[metric] < was[metric] - accuracy_tolerance:
+                problems.append(f"{name}: {metric} {result[metric]:.3f}, was {was[metric]:.3f}")
+        if result['wall_seconds'] > was['wall_seconds'] * (1 + speed_tolerance):
+            problems.append(f"{name}: took {result['wall_seconds']:.1f}s, was {was['wall_seconds']:.1f}s")
+    return problems
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Check accuracy and speed against a corpus of known-good clips")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help=f"corpus directory (default {DEFAULT_CORPUS_DIR})")
+    parser.add_argument("--baseline", help="baseline to compare against (default baseline.json in the corpus)")
+    parser.add_argument("--save-baseline", action="store_true", help="save this run as the new baseline")
+    parser.add_argument("--accuracy-tolerance", type=float, default=DEFAULT_ACCURACY_TOLERANCE)
+    parser.add_argument("--speed-tolerance", type=float, default=DEFAULT_SPEED_TOLERANCE)
+    parser.add_argument("--skip-stride", type=int, help="SKIP_STRIDE for every clip, to see what it does to recall")
+    args = parser.parse_args()
+
+    if not os.path.isfile(os.path.join(args.corpus, "corpus.json")):
+        sys.exit(f"ERROR: no corpus.json in {args.corpus}")
+    baseline_path = args.baseline or os.path.join(args.corpus, "baseline.json")
+    baseline = None
+    if os.path.isfile(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    overrides = {}
+    if args.skip_stride is not None:
+        overrides['SKIP_STRIDE'] = args.skip_stride
+    results = run_corpus(args.corpus, overrides)
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(dict(results, TOTAL=totals(results)), f, indent=2)
+        print(f"\nSaved baseline to {baseline_path}")
+    elif baseline:
+        problems = regressions(results, baseline, args.accuracy_tolerance, args.speed_tolerance)
+        if problems:
+            print("\nRegressions:")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print("\nNo regressions")
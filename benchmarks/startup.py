@@ -0,0 +1,78 @@
+# Measures how long the GUI takes to start up. Every run happens in a fresh
+# process so nothing is already imported or cached.
+#
+# python -m benchmarks.startup [--runs N] [--offscreen]
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# Runs inside the child process, printing when each milestone was reached as
+# time.time() so the parent can compare against when it launched the process
+CHILD_SCRIPT = r"""
+import json, time
+milestones = {"interpreter": time.time()}
+
+from PyQt6.QtCore import QObject, QEvent, QTimer
+from PyQt6.QtWidgets import QApplication
+from gui.main_window import MainWindow
+milestones["imports"] = time.time()
+
+app = QApplication([])
+window = MainWindow()
+milestones["window_created"] = time.time()
+
+def start_loading():
+    window.start_background_loading(on_ready=loading_finished)
+
+def loading_finished(seconds):
+    milestones["heavy_imports_ready"] = time.time()
+    print(json.dumps(milestones))
+    app.quit()
+
+# Same as main_gui.py: background loading starts once the window has painted
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and "first_paint" not in milestones:
+            milestones["first_paint"] = time.time()
+            QTimer.singleShot(0, start_loading)
+        return False
+
+first_paint = FirstPaint()
+window.installEventFilter(first_paint)
+window.show()
+app.exec()
+"""
+
+MILESTONES = ["interpreter", "imports", "window_created", "first_paint", "heavy_imports_ready"]
+
+
+def run_once(env):
+    launched = time.time()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT],
+        capture_output=True, text=True, env=env, check=True
+    )
+    milestones = json.loads(result.stdout.strip().splitlines()[-1])
+    return {name: milestones[name] - launched for name in MILESTONES}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark GUI startup time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--offscreen", action="store_true", help="don't actually show a window")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+
+    runs = [run_once(env) for _ in range(args.runs)]
+    print(f"Seconds since launch, median of {args.runs} runs:")
+    for name in MILESTONES:
+        times = [run[name] for run in runs]
+        print(f"  {name:<20} {statistics.median(times):6.2f}  (min {min(times):.2f}, max {max(times):.2f})")
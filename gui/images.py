@@ -0,0 +1,12 @@
+import numpy as np
+from PyQt6.QtGui import QPixmap, QImage
+
+
+# OpenCV frame (BGR) to something Qt can show. Lives here rather than in
+# utils.cv2 so the headless side never has to import Qt.
+def cv2_to_qpixmap(image):
+    height, width, channel = image.shape
+    bytesPerLine = 3 * width
+    image2 = np.require(image, np.uint8, 'C')
+    qimg = QImage(image2, width, height, bytesPerLine, QImage.Format.Format_BGR888)
+    return QPixmap(qimg)
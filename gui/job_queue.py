@@ -0,0 +1,205 @@
+import os
+import re
+
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtWidgets import (
+    QWidget, QPushButton, QLabel, QSpinBox, QTextEdit, QTableWidget,
+    QTableWidgetItem, QProgressBar, QFileDialog, QInputDialog, QAbstractItemView,
+    QVBoxLayout, QHBoxLayout
+)
+
+from utils.jobs import JobQueue, DEFAULT_MAX_JOBS
+from utils.daemon import DaemonClient
+from utils.timestamp import display_timestamp
+
+# How often to check for progress from the pool processes (ms)
+POLL_INTERVAL = 250
+
+# Table columns
+COLUMN_VIDEO    = 0
+COLUMN_PRESET   = 1
+COLUMN_STATUS   = 2
+COLUMN_PROGRESS = 3
+COLUMN_SPEED    = 4
+
+
+# Window for queueing up several videos to be processed in the background,
+# each with whatever settings were in the main window's form when it was added
+class JobQueueWindow(QWidget):
+    def __init__(self, main_window):
+        super().__init__()
+
+        self.setWindowTitle("Job queue")
+        self.main_window = main_window
+
+        # Created on first use, starting the process pool takes a moment
+        self.job_queue  = None
+        self.job_rows   = {} # job_id -> table row
+        self.job_logs   = {} # job_id -> list of output lines
+        self.job_totals = {} # job_id -> total seconds of video
+
+        self.add_button = QPushButton("Add videos with current settings...")
+        self.add_button.clicked.connect(self.add_jobs_dialog)
+        self.cancel_button = QPushButton("Cancel selected job")
+        self.cancel_button.clicked.connect(self.cancel_selected_job)
+        self.max_jobs_label = QLabel("Videos at once")
+        self.max_jobs_input = QSpinBox()
+        self.max_jobs_input.setMinimum(1)
+        self.max_jobs_input.setMaximum(os.cpu_count() or 1)
+        self.max_jobs_input.setValue(DEFAULT_MAX_JOBS)
+        self.max_jobs_input.valueChanged.connect(self.set_max_jobs)
+
+        self.button_layout = QHBoxLayout()
+        self.button_layout.addWidget(self.add_button)
+        self.button_layout.addWidget(self.cancel_button)
+        self.button_layout.addWidget(self.max_jobs_label)
+        self.button_layout.addWidget(self.max_jobs_input)
+
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(["Video", "Preset", "Status", "Progress", "Speed"])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.itemSelectionChanged.connect(self.show_selected_log)
+
+        # Output of whichever job is selected
+        self.log_text = QTextEdit()
+        self.log_text.setReadOnly(True)
+
+        self.layout = QVBoxLayout()
+        self.layout.addLayout(self.button_layout)
+        self.layout.addWidget(self.table)
+        self.layout.addWidget(self.log_text)
+        self.setLayout(self.layout)
+        self.resize(900, 600)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.poll_jobs)
+
+    def add_jobs_dialog(self):
+        (filenames, filter_info) = QFileDialog.getOpenFileNames(
+            self,
+            caption="Add video files",
+            filter="Video Files (*.mp4 *.webm *.mkv)"
+        )
+        for filename in filenames:
+            settings = self.main_window.collect_settings()
+            if settings['GAME_SIZE'] < 480:
+                self.main_window.print_output_line("### Game size must be at least 480 to queue a job")
+                return
+            settings['infile_name'] = filename
+            settings['outfile_name'] = re.sub(
+                r'\.(mp4|m4v|mov|avi|mkv|webm|wmv)$',
+                '.csv',
+                filename
+            )
+            # Every vod has its own URL, so ask for each one
+            if settings['MAKE_CSV']:
+                url, ok = QInputDialog.getText(
+                    self,
+                    "Vod URL",
+                    f"Vod URL for {os.path.basename(filename)}:",
+                    text=settings['URL']
+                )
+                if not ok:
+                    continue
+                settings['URL'] = url
+            self.add_job(settings)
+
+    def add_job(self, settings):
+        if self.job_queue is None:
+            # A running daemon already has the models loaded, so hand jobs
+            # to that if there is one
+            self.job_queue = DaemonClient.connect()
+            if self.job_queue is None:
+                self.job_queue = JobQueue(self.max_jobs_input.value())
+            else:
+                self.main_window.print_output_line(f"Sending jobs to the daemon at {self.job_queue.url}")
+            self.poll_timer.start(POLL_INTERVAL)
+        job_id = self.job_queue.submit(settings)
+
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        self.table.setItem(row, COLUMN_VIDEO, QTableWidgetItem(os.path.basename(settings['infile_name'])))
+        self.table.setItem(row, COLUMN_PRESET, QTableWidgetItem(settings['PRESET']))
+        self.table.setItem(row, COLUMN_STATUS, QTableWidgetItem("Queued"))
+        progress_bar = QProgressBar()
+        progress_bar.setValue(0)
+        self.table.setCellWidget(row, COLUMN_PROGRESS, progress_bar)
+        self.table.setItem(row, COLUMN_SPEED, QTableWidgetItem(""))
+        # Keep the job id on the row so we can find it again from a selection
+        self.table.item(row, COLUMN_VIDEO).setData(Qt.ItemDataRole.UserRole, job_id)
+
+        self.job_rows[job_id] = row
+        self.job_logs[job_id] = []
+
+    def selected_job(self):
+        rows = self.table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.table.item(rows[0].row(), COLUMN_VIDEO).data(Qt.ItemDataRole.UserRole)
+
+    def cancel_selected_job(self):
+        job_id = self.selected_job()
+        if job_id is None:
+            return
+        if self.job_queue.cancel(job_id):
+            self.set_status(job_id, "Cancelled")
+        else:
+            self.set_status(job_id, "Cancelling...")
+
+    def set_max_jobs(self):
+        if self.job_queue:
+            self.job_queue.set_max_jobs(self.max_jobs_input.value())
+
+    def set_status(self, job_id, status):
+        self.table.item(self.job_rows[job_id], COLUMN_STATUS).setText(status)
+
+    def show_selected_log(self):
+        job_id = self.selected_job()
+        if job_id is not None:
+            self.log_text.setPlainText("\n".join(self.job_logs[job_id]))
+
+    # Apply everything the pool processes have told us since last time
+    def poll_jobs(self):
+        selected_job = self.selected_job()
+        for (job_id, kind, value) in self.job_queue.poll_events():
+            # A daemon tells everyone about every job, including ones other
+            # windows (or the command line) gave it
+            if job_id not in self.job_rows:
+                continue
+            row = self.job_rows[job_id]
+            if kind == "line":
+                self.job_logs[job_id].append(value)
+                if job_id == selected_job:
+                    self.log_text.append(value)
+            elif kind == "started":
+                self.job_totals[job_id] = value
+                self.table.cellWidget(row, COLUMN_PROGRESS).setRange(0, max(value, 1))
+                self.set_status(job_id, "Running")
+            elif kind == "progress":
+                (seconds, elapsed) = value
+                total_seconds = self.job_totals[job_id]
+                progress_bar = self.table.cellWidget(row, COLUMN_PROGRESS)
+                progress_bar.setValue(seconds)
+                progress_bar.setFormat(display_timestamp(seconds, total_seconds))
+                # How many seconds of video get through per second of real time
+                if elapsed > 0:
+                    speed = seconds / elapsed
+                    self.table.item(row, COLUMN_SPEED).setText(f"{speed:.1f}x")
+            elif kind == "finished":
+                self.set_status(job_id, value)
+                if value == "Done":
+                    progress_bar = self.table.cellWidget(row, COLUMN_PROGRESS)
+                    progress_bar.setValue(progress_bar.maximum())
+
+    def closeEvent(self, event):
+        # Jobs keep running in the background while the window is hidden
+        event.ignore()
+        self.hide()
+
+    def shutdown(self):
+        self.poll_timer.stop()
+        if self.job_queue:
+            self.job_queue.shutdown()
@@ -0,0 +1,15 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from utils.heavy_imports import import_heavy_modules
+
+
+# Imports the heavy dependencies in the background after the window is shown
+class HeavyImportLoader(QThread):
+    progress = pyqtSignal(str)
+    ready    = pyqtSignal(float)
+
+    def run(self):
+        total = import_heavy_modules(
+            lambda name, seconds: self.progress.emit(f"Loaded {name} ({seconds:.1f}s)")
+        )
+        self.ready.emit(total)
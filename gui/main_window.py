@@ -3,18 +3,19 @@
 import configparser
 import os
 import re
+from urllib.parse import urlparse
 
 # qt stuff
 # from PyQt6.QtCore import QSize, QDate, Qt, QThreadPool
 from PyQt6.QtCore import QSize, QDate, Qt, QThread
 from PyQt6 import QtGui
-from PyQt6.QtGui import QPixmap, QImage
 from PyQt6.QtWidgets import (
     # high level stuff
     QMainWindow, QDialog, QMessageBox,
     # widgets
     QWidget, QPushButton, QDateEdit, QLabel, QLineEdit, QComboBox, QFileDialog,
-    QCheckBox, QDialogButtonBox, QSpinBox, QTextEdit, QSlider,
+    QInputDialog,
+    QCheckBox, QDialogButtonBox, QSpinBox, QSlider,
     # layout stuff
     QFrame, QSplitter, QVBoxLayout, QHBoxLayout
 )
@@ -23,10 +24,20 @@ from utils.cv2       import *
 from utils.dates     import infer_last_weekday, get_weekday_name
 from utils.timestamp import display_timestamp
 from utils.csv       import version_list
+from utils.capture_pool import CapturePool
+from utils.remote_source import is_url, is_growing
+from utils.stamper   import DEFAULT_OCR_THREADS
+from utils.game_state import DEFAULT_SKIP_STRIDE
+from utils.frame_cache import DEFAULT_FRAME_CACHE_MB
+from utils.hud_cache import DEFAULT_HUD_CACHE_SCALE
 
 # gui-specific functions
 from gui.dialogs import NewPresetDialog
+from gui.images import cv2_to_qpixmap
 from gui.worker import Worker
+from gui.job_queue import JobQueueWindow
+from gui.loader import HeavyImportLoader
+from gui.results import ResultsModel, ResultsView, LogConsole
 
 # Main window class
 class MainWindow(QMainWindow):
@@ -39,6 +50,11 @@ class MainWindow(QMainWindow):
         # One background thread for processing a video
         self.thread = None
 
+        # TensorFlow, Tesseract etc get loaded in the background once the
+        # window is up, processing can't start until they're ready
+        self.loader = None
+        self.heavy_imports_ready = False
+
         #######################################################################
         ### Left pane layouting (Options form)
 
@@ -64,11 +80,15 @@ class MainWindow(QMainWindow):
 
         # Input file
         self.infile_name = None
+        self.capture_pool = None
+        # The preview keeps its own decoder handle from the pool
         self.capture = None
         self.total_seconds = None
         self.infile_label = QLabel("No video file selected")
         self.infile_open_button = QPushButton("Open video file...")
         self.infile_open_button.clicked.connect(self.choose_infile)
+        self.infile_url_button = QPushButton("Open video URL...")
+        self.infile_url_button.clicked.connect(self.choose_infile_url)
         
         # Have to define display slider early because other things depend on it
         self.display_slider = QSlider(Qt.Orientation.Horizontal)
@@ -163,6 +183,9 @@ class MainWindow(QMainWindow):
         self.url_input.setEnabled(False)
         self.url_input.textChanged.connect(self.check_start_button)
 
+        # Quantized models
+        self.quantized_checkbox = QCheckBox("Use quantized models (faster on CPU)")
+
         # Start button
         self.start_button = QPushButton("Create timestamps")
         self.start_button_font = self.start_button.font()
@@ -187,6 +210,7 @@ class MainWindow(QMainWindow):
         # Mandatory stuff
         self.form_layout.addWidget(self.infile_label)
         self.form_layout.addWidget(self.infile_open_button)
+        self.form_layout.addWidget(self.infile_url_button)
         self.form_layout.addWidget(self.game_x_label)
         self.form_layout.addWidget(self.game_x_input)
         self.form_layout.addWidget(self.game_y_label)
@@ -209,6 +233,8 @@ class MainWindow(QMainWindow):
         self.form_layout.addWidget(self.version_combobox)
         self.form_layout.addWidget(self.url_label)
         self.form_layout.addWidget(self.url_input)
+        # Model options
+        self.form_layout.addWidget(self.quantized_checkbox)
         # And lastly, the start button
         self.form_layout.addWidget(self.start_button)
 
@@ -222,10 +248,18 @@ class MainWindow(QMainWindow):
         self.cancel_button = QPushButton("Cancel / Finish Early")
         self.cancel_button.setEnabled(False)
         self.cancel_button.clicked.connect(self.cancel_worker)
+        # Job queue for processing lots of videos in the background, also
+        # usable while the form is disabled
+        self.job_queue_window = JobQueueWindow(self)
+        self.job_queue_button = QPushButton("Job queue...")
+        self.job_queue_button.clicked.connect(self.job_queue_window.show)
         self.left_pane_layout = QVBoxLayout()
         self.left_pane_layout.setContentsMargins(0,0,0,0)
         self.left_pane_layout.addWidget(self.form_container)
         self.left_pane_layout.addWidget(self.cancel_button)
+        self.left_pane_layout.addWidget(self.job_queue_button)
+        self.loading_label = QLabel("Loading TensorFlow and Tesseract...")
+        self.left_pane_layout.addWidget(self.loading_label)
         self.left_pane_container = QWidget()
         self.left_pane_container.setLayout(self.left_pane_layout)
 
@@ -251,10 +285,16 @@ class MainWindow(QMainWindow):
         #######################################################################
         ### Right pane layouting (Output text console)
 
-        # Widget that displays console output, timestamp results
-        self.right_pane_text = QTextEdit()
-        self.right_pane_text.setReadOnly(True)
-        self.right_pane_text.setFixedSize(QSize(400,755))
+        # Sets found so far, click one to see it in the preview
+        self.results_model = ResultsModel()
+        self.results_view = ResultsView(self.results_model)
+        self.results_view.seekTo.connect(self.seek_to_result)
+        # Console output
+        self.right_pane_text = LogConsole()
+        self.right_pane_splitter = QSplitter(Qt.Orientation.Vertical)
+        self.right_pane_splitter.addWidget(self.results_view)
+        self.right_pane_splitter.addWidget(self.right_pane_text)
+        self.right_pane_splitter.setFixedSize(QSize(400,755))
 
         #######################################################################
         ### Main layout (Three side-by-side panes)
@@ -262,7 +302,7 @@ class MainWindow(QMainWindow):
         self.main_layout = QHBoxLayout()
         self.main_layout.addWidget(self.left_pane_container)
         self.main_layout.addWidget(self.centre_pane_container)
-        self.main_layout.addWidget(self.right_pane_text)
+        self.main_layout.addWidget(self.right_pane_splitter)
         self.main_container = QWidget()
         self.main_container.setLayout(self.main_layout)
 
@@ -298,6 +338,8 @@ class MainWindow(QMainWindow):
         if version in version_list:
             self.version_combobox.setCurrentText(version)
 
+        self.quantized_checkbox.setChecked(current_preset.get("QUANTIZED", "0") == "1")
+
     # Create new preset after confirming from dialog
     def preset_new_button_dialog(self):
         dlg = NewPresetDialog(self)
@@ -329,6 +371,11 @@ class MainWindow(QMainWindow):
 
         current_preset['VERSION'] = self.version_combobox.currentText()
 
+        if self.quantized_checkbox.isChecked():
+            current_preset['QUANTIZED'] = "1"
+        else:
+            current_preset['QUANTIZED'] = "0"
+
         self.write_presets_to_file()
 
     def write_presets_to_file(self):
@@ -358,29 +405,68 @@ class MainWindow(QMainWindow):
             filter="Video Files (*.mp4 *.webm *.mkv)"
         )
         if filename:
-            self.infile_name = filename
-            self.infile_label.setText(os.path.basename(filename))
-            self.check_start_button()
-            (self.capture, self.total_seconds) = open_capture(filename)
-            capture_width = int(self.capture.get(cv.CAP_PROP_FRAME_WIDTH))
-            self.game_size_input.setMaximum(capture_width)
-            if self.game_size_input.value() > capture_width:
-                self.game_size_input.setValue(capture_width)
-            self.display_slider.setEnabled(True)
-            self.set_slider(0)
-            self.display_slider.setRange(0, self.total_seconds)
-            # Set the default csv outfile to same path but csv extension
-            self.outfile_name = re.sub(
-                r'\.(mp4|m4v|mov|avi|mkv|webm|wmv)$',
-                '.csv',
-                self.infile_name
-            )
-            self.outfile_label.setText(os.path.basename(self.outfile_name))
-            self.preview_video_by_slider()
+            # Only the user knows for sure, a file that's just been copied
+            # over looks the same
+            growing = False
+            if is_growing(filename):
+                button = QMessageBox.question(
+                    self,
+                    "Open video file",
+                    f"\"{os.path.basename(filename)}\" was modified in the last few seconds. "
+                    "Is it still being downloaded or recorded?"
+                )
+                growing = button == QMessageBox.StandardButton.Yes
+            self.open_infile(filename, growing)
+
+    # Read the video straight off a web server (one that supports range
+    # requests, like most file hosts) instead of downloading it first
+    def choose_infile_url(self):
+        (url, ok) = QInputDialog.getText(self, "Open video URL", "Video URL:")
+        url = url.strip()
+        if ok and url:
+            if not is_url(url):
+                QMessageBox.warning(self, "Open video URL", "Needs to be an http:// or https:// URL.")
+                return
+            self.open_infile(url)
+
+    def open_infile(self, filename, growing=False):
+        self.infile_name = filename
+        self.infile_label.setText(filename if is_url(filename) else os.path.basename(filename))
+        self.check_start_button()
+        if self.capture_pool:
+            self.capture_pool.release(self.capture)
+            self.capture_pool.close()
+        # Building a seek index for a long video takes a while, the preview
+        # can do without one until then
+        self.capture_pool = CapturePool(filename, growing=growing, index_in_background=True)
+        self.capture = self.capture_pool.acquire()
+        self.total_seconds = self.capture_pool.total_seconds
+        capture_width = int(self.capture_pool.width)
+        self.game_size_input.setMaximum(capture_width)
+        if self.game_size_input.value() > capture_width:
+            self.game_size_input.setValue(capture_width)
+        self.display_slider.setEnabled(True)
+        self.set_slider(0)
+        self.display_slider.setRange(0, self.total_seconds)
+        # Set the default csv outfile to same path but csv extension. For
+        # a URL, the current directory with the same name.
+        if is_url(filename):
+            filename = os.path.basename(urlparse(filename).path) or "video"
+        self.outfile_name = re.sub(
+            r'\.(mp4|m4v|mov|avi|mkv|webm|wmv)$',
+            '',
+            filename
+        ) + '.csv'
+        self.outfile_label.setText(os.path.basename(self.outfile_name))
+        self.preview_video_by_slider()
 
     def set_display_frame(self, seconds):
         if (self.capture 
             and (self.game_size_input.value() >= 480)):
+            # Pick up the seek index once it's ready
+            if self.capture_pool.is_stale(self.capture):
+                self.capture_pool.release(self.capture)
+                self.capture = self.capture_pool.acquire()
             frame = get_frame_from_video(
                 self.capture, 
                 seconds, 
@@ -430,10 +516,27 @@ class MainWindow(QMainWindow):
             w.setEnabled(self.outfile_checkbox.isChecked())
         self.check_start_button()
 
+    # Start importing the heavy stuff. Call after the window is shown.
+    # Anything else that wants to know when it's done has to be connected
+    # before the loader starts, it can finish before start() even returns.
+    def start_background_loading(self, on_ready=None):
+        self.loader = HeavyImportLoader()
+        self.loader.progress.connect(self.loading_label.setText)
+        self.loader.ready.connect(self.background_loading_finished)
+        if on_ready is not None:
+            self.loader.ready.connect(on_ready)
+        self.loader.start()
+
+    def background_loading_finished(self, seconds):
+        self.heavy_imports_ready = True
+        self.loading_label.setText(f"Ready (loaded in {seconds:.1f}s)")
+        self.check_start_button()
+
     # Enable the start button if all required options are filled in
     def check_start_button(self):
         # Check mandatory parameters (infile, GAME_X/Y/SIZE)
-        if not (self.infile_name
+        if not (self.heavy_imports_ready
+            and self.infile_name
             and self.game_size_input.value() >= 480):
             self.start_button.setEnabled(False)
         else:
@@ -448,13 +551,29 @@ class MainWindow(QMainWindow):
                 self.start_button.setEnabled(False)
 
     def print_output_line(self, line): 
-        self.right_pane_text.append(line)
+        self.right_pane_text.append_line(line)
+
+    # Jump the preview to a found set, unless a worker's using the slider
+    def seek_to_result(self, seconds):
+        if self.display_slider.isEnabled():
+            self.set_slider(seconds)
+            self.set_display_frame(seconds)
 
     def display_frame_from_image(self, image):
         self.display_widget.setPixmap(cv2_to_qpixmap(image))
 
-    def process_video(self):
-        self.worker = Worker(
+    # Snapshot of the current options form, for handing to a worker or job.
+    # A few advanced settings only live in the preset file.
+    def collect_settings(self):
+        current_preset = self.config[self.preset_combobox.currentText()]
+        return dict(
+            OCR_THREADS   = int(current_preset.get('OCR_THREADS', DEFAULT_OCR_THREADS)),
+            SKIP_STRIDE   = int(current_preset.get('SKIP_STRIDE', DEFAULT_SKIP_STRIDE)),
+            FRAME_CACHE_MB = int(current_preset.get('FRAME_CACHE_MB', DEFAULT_FRAME_CACHE_MB)),
+            HUD_CACHE     = current_preset.get('HUD_CACHE', "0") == "1",
+            HUD_CACHE_SCALE = float(current_preset.get('HUD_CACHE_SCALE', DEFAULT_HUD_CACHE_SCALE)),
+            EXPORT_DIR    = current_preset.get('EXPORT_DIR', ""),
+            PRESET        = self.preset_combobox.currentText(),
             GAME_X        = self.game_x_input.value(),
             GAME_Y        = self.game_y_input.value(),
             GAME_SIZE     = self.game_size_input.value(),
@@ -465,7 +584,13 @@ class MainWindow(QMainWindow):
             NETPLAY       = self.netplay_checkbox.isChecked(),
             VERSION       = self.version_combobox.currentText(),
             URL           = self.url_input.text(),
-            capture       = self.capture,
+            QUANTIZED     = self.quantized_checkbox.isChecked()
+        )
+
+    def process_video(self):
+        self.worker = Worker(
+            **self.collect_settings(),
+            capture_pool  = self.capture_pool,
             start_seconds = self.display_slider.value(),
             total_seconds = self.total_seconds,
             outfile_name  = self.outfile_name
@@ -473,6 +598,8 @@ class MainWindow(QMainWindow):
         self.worker.signals.printLine.connect(self.print_output_line)
         self.worker.signals.showFrame.connect(self.display_frame_from_image)
         self.worker.signals.updateSlider.connect(self.set_slider)
+        self.worker.signals.reportGame.connect(self.results_model.add_game)
+        self.results_model.clear(self.total_seconds)
         self.worker.signals.finishWork.connect(self.worker_finished)
         self.display_slider.setEnabled(False)
         self.form_container.setEnabled(False)
@@ -493,4 +620,9 @@ class MainWindow(QMainWindow):
         self.thread.quit()
         self.form_container.setEnabled(True)
         self.set_slider(0)
-        self.display_slider.setEnabled(True)
\ No newline at end of file
+        self.display_slider.setEnabled(True)
+
+    # Stop any background jobs when the app closes
+    def closeEvent(self, event):
+        self.job_queue_window.shutdown()
+        event.accept()
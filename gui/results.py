@@ -0,0 +1,142 @@
+from PyQt6.QtCore import Qt, QTimer, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt6.QtGui import QBrush, QColor
+from PyQt6.QtWidgets import QTableView, QPlainTextEdit, QAbstractItemView, QHeaderView
+
+from utils.stamper import team_string, game_warnings
+from utils.timestamp import display_timestamp
+
+# How often buffered console lines get written out (ms)
+LOG_FLUSH_INTERVAL = 100
+
+# Oldest lines get dropped past this, so the console never gets slower the
+# longer a run goes on
+LOG_MAX_LINES = 5000
+
+# Table columns
+COLUMN_TIME     = 0
+COLUMN_P1NAME   = 1
+COLUMN_P1TEAM   = 2
+COLUMN_P2NAME   = 3
+COLUMN_P2TEAM   = 4
+COLUMN_WARNINGS = 5
+COLUMN_HEADERS  = ["Time", "P1", "P1 team", "P2", "P2 team", "Warnings"]
+
+WARNING_COLOUR = QColor(255, 230, 180)
+
+
+# The sets found so far, one row each. Qt only asks for the rows on screen,
+# so this costs the same with 5 sets or 5000.
+class ResultsModel(QAbstractTableModel):
+    def __init__(self):
+        super().__init__()
+        self.games    = []
+        self.warnings = []
+        self.total_seconds = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.games)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMN_HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return COLUMN_HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        game = self.games[index.row()]
+        warnings = self.warnings[index.row()]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == COLUMN_TIME:
+                return display_timestamp(game['seconds'], self.total_seconds)
+            if column == COLUMN_P1NAME:
+                return game['p1name']
+            if column == COLUMN_P1TEAM:
+                return team_string(*game['p1team'][:3])
+            if column == COLUMN_P2NAME:
+                return game['p2name']
+            if column == COLUMN_P2TEAM:
+                return team_string(*game['p2team'][:3])
+            if column == COLUMN_WARNINGS:
+                return str(len(warnings)) if warnings else ""
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            if column == COLUMN_TIME:
+                return "Click to show this set in the preview"
+            if warnings:
+                return "\n".join(warnings)
+        elif role == Qt.ItemDataRole.BackgroundRole:
+            if warnings:
+                return QBrush(WARNING_COLOUR)
+        return None
+
+    def clear(self, total_seconds):
+        self.beginResetModel()
+        self.games    = []
+        self.warnings = []
+        self.total_seconds = total_seconds
+        self.endResetModel()
+
+    # game is the first game of a set, as recorded by the stamper
+    def add_game(self, game):
+        row = len(self.games)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.games.append(game)
+        self.warnings.append(game_warnings(game))
+        self.endInsertRows()
+
+
+# Table of found sets. Clicking a row asks for the preview to jump to it.
+class ResultsView(QTableView):
+    seekTo = pyqtSignal(int)
+
+    def __init__(self, model: ResultsModel):
+        super().__init__()
+        self.setModel(model)
+        self.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.verticalHeader().setVisible(False)
+        # Sizing to contents would look at every row, every time one's added
+        self.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.horizontalHeader().setStretchLastSection(True)
+        self.clicked.connect(self.row_clicked)
+        model.rowsInserted.connect(self.follow_new_rows)
+
+    def row_clicked(self, index):
+        self.seekTo.emit(self.model().games[index.row()]['seconds'])
+
+    # Keep the newest set in view, unless somebody's scrolled up to look at
+    # an older one
+    def follow_new_rows(self):
+        scroll_bar = self.verticalScrollBar()
+        if scroll_bar.value() >= scroll_bar.maximum() - 1:
+            QTimer.singleShot(0, self.scrollToBottom)
+
+
+# Console output. Lines are buffered as they come in and written out in one
+# go on a timer, rather than redrawing the console for every single one.
+class LogConsole(QPlainTextEdit):
+    def __init__(self):
+        super().__init__()
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(LOG_MAX_LINES)
+        self.pending = []
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(LOG_FLUSH_INTERVAL)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start()
+
+    def append_line(self, line):
+        self.pending.append(line)
+
+    def flush(self):
+        if not self.pending:
+            return
+        lines = "\n".join(self.pending)
+        self.pending = []
+        self.appendPlainText(lines)
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
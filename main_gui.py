@@ -1,3 +1,4 @@
+from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import QApplication
 from gui.main_window import MainWindow
 
@@ -6,4 +7,6 @@ if __name__ == "__main__":
     app = QApplication([])
     window = MainWindow()
     window.show()
+    # Let the window paint first, then load the slow stuff in the background
+    QTimer.singleShot(0, window.start_background_loading)
     app.exec()
\ No newline at end of file
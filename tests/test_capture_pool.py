@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv = pytest.importorskip("cv2")
+
+import utils.capture_pool as capture_pool_module
+from utils.capture_pool import CapturePool
+from utils.seek_index import SeekIndex
+
+FPS    = 2
+FRAMES = 10
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = str(tmp_path / "video.avi")
+    writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*"MJPG"), FPS, (64, 36))
+    for frame in range(FRAMES):
+        writer.write(np.full((36, 64, 3), frame * 20, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+# Stands in for ffprobe, handing over an index only once told to
+@pytest.fixture
+def slow_index(monkeypatch):
+    go = threading.Event()
+    pts = np.arange(FRAMES) / FPS
+    index = SeekIndex(pts, pts[::4])
+
+    def load_seek_index(filename):
+        go.wait(timeout=5)
+        return index
+
+    monkeypatch.setattr(capture_pool_module, "load_seek_index", load_seek_index)
+    return (go, index)
+
+
+def test_usable_before_index_is_ready(video, slow_index):
+    (go, index) = slow_index
+    capture_pool = CapturePool(video, max_handles=2, index_in_background=True)
+    try:
+        assert capture_pool.index is None
+        assert not capture_pool.index_ready.is_set()
+        assert capture_pool.total_seconds == FRAMES // FPS
+        with capture_pool.handle() as capture:
+            assert capture.read()[0]
+    finally:
+        go.set()
+        capture_pool.close()
+
+
+def test_handles_switch_over_to_index(video, slow_index):
+    (go, index) = slow_index
+    capture_pool = CapturePool(video, max_handles=2, index_in_background=True)
+    try:
+        capture = capture_pool.acquire()
+        go.set()
+        assert capture_pool.index_ready.wait(timeout=5)
+        assert capture_pool.index is index
+        assert capture_pool.is_stale(capture)
+        capture_pool.release(capture)
+        capture = capture_pool.acquire()
+        assert not capture_pool.is_stale(capture)
+        assert capture.index is index
+        capture_pool.release(capture)
+    finally:
+        capture_pool.close()
+
+
+def test_index_up_front_by_default(video, slow_index):
+    (go, index) = slow_index
+    go.set()
+    capture_pool = CapturePool(video, max_handles=2)
+    try:
+        assert capture_pool.index is index
+        assert capture_pool.index_ready.is_set()
+    finally:
+        capture_pool.close()
@@ -0,0 +1,91 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from utils.game_state import GameTracker
+
+GAME_SIZE = 320
+HEIGHT    = 180
+STRIDE    = 5
+
+FULL    = np.zeros(4)
+DRAINED = np.array([50.0, 0, 0, 0])
+
+
+def random_image(seed):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (HEIGHT, GAME_SIZE, 3), dtype=np.uint8)
+
+
+# image with weight of it swapped for noise. 0.1 correlates about 0.99 with
+# the original HUD, 0.4 about 0.8.
+def changed(image, weight, seed=99):
+    return (image*(1 - weight) + random_image(seed)*weight).astype(np.uint8)
+
+
+# A game that started at 0 and has been skimmed up to seconds
+def tracker_at(seconds, image):
+    tracker = GameTracker(GAME_SIZE, stride=STRIDE)
+    tracker.start_game(20, image)
+    assert tracker.update(seconds, image, False, DRAINED)
+    return tracker
+
+
+def test_same_game_keeps_skimming():
+    image = random_image(0)
+    tracker = tracker_at(20, image)
+    assert tracker.update(25, changed(image, 0.1), False, DRAINED)
+    assert not tracker.checking_gap
+    assert tracker.resume_seconds == 26
+
+
+def test_hud_gone_ends_game():
+    tracker = tracker_at(20, random_image(0))
+    assert not tracker.update(25, random_image(1), False, DRAINED)
+    assert not tracker.in_game
+    assert tracker.resume_seconds == 21
+
+
+def test_round_start_ends_game():
+    image = random_image(0)
+    tracker = tracker_at(20, image)
+    assert not tracker.update(25, image, True, FULL)
+    assert not tracker.in_game
+
+
+# Still looks like a game, but not much like the last sample
+def test_big_hud_change_checks_gap():
+    image = random_image(0)
+    tracker = tracker_at(20, image)
+    assert tracker.update(25, changed(image, 0.4), False, DRAINED)
+    assert tracker.checking_gap
+    assert (tracker.gap_start, tracker.gap_end) == (21, 25)
+    assert tracker.gap_checked() == 25 + STRIDE
+    assert not tracker.checking_gap
+    assert tracker.in_game
+
+
+def test_refilled_health_checks_gap():
+    image = random_image(0)
+    tracker = tracker_at(20, image)
+    assert tracker.update(25, image, False, FULL)
+    assert (tracker.gap_start, tracker.gap_end) == (21, 25)
+
+
+# Nothing was skipped between the round start's window and the first
+# sample, so there's no gap to check
+def test_first_sample_has_no_gap():
+    image = random_image(0)
+    tracker = GameTracker(GAME_SIZE, stride=STRIDE)
+    tracker.start_game(20, image)
+    assert tracker.update(20, changed(image, 0.4), False, FULL)
+    assert not tracker.checking_gap
+
+
+def test_end_game_forgets_gap():
+    image = random_image(0)
+    tracker = tracker_at(20, image)
+    tracker.update(25, changed(image, 0.4), False, DRAINED)
+    tracker.end_game()
+    assert not tracker.checking_gap
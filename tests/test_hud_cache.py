@@ -0,0 +1,84 @@
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv = pytest.importorskip("cv2")
+
+from utils.hud_cache import HUDStrips, HUDStripPool, StripPacking, strip_shape
+from utils.hud_layout import hud_layout
+from utils.game_state import hud_vector
+from utils.live import LiveFrames, LiveCapturePool
+
+GAME_SIZE = 640
+HEIGHT    = 360
+SECONDS   = 3
+
+
+# Blotchy enough that shrinking the background doesn't lose everything,
+# with some noise on top so every pixel of a region matters
+def random_frames(count):
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(count):
+        blotches = rng.integers(0, 248, (HEIGHT // 20, GAME_SIZE // 20, 3), dtype=np.uint8)
+        frame = cv.resize(blotches, (GAME_SIZE, HEIGHT), interpolation=cv.INTER_LINEAR)
+        frames.append(frame + rng.integers(0, 8, frame.shape, dtype=np.uint8))
+    return frames
+
+
+def build_cache(tmp_path, frames, scale=1.0):
+    stream = io.BytesIO(b"".join(frame.tobytes() for frame in frames))
+    capture_pool = LiveCapturePool("test", LiveFrames(stream, GAME_SIZE, HEIGHT))
+    strips = HUDStrips(str(tmp_path / "video.mp4"), len(frames), 0, 0, GAME_SIZE, scale)
+    assert strips.build(capture_pool)
+    return strips
+
+
+def read_strip(strips, seconds):
+    capture = HUDStripPool("test", strips).acquire()
+    capture.set(cv.CAP_PROP_POS_MSEC, seconds * 1000)
+    return capture.read()
+
+
+def test_regions_come_back_exactly(tmp_path):
+    frames = random_frames(SECONDS)
+    strips = build_cache(tmp_path, frames)
+    layout = hud_layout(GAME_SIZE)
+    (height, width, _) = strip_shape(GAME_SIZE, 1)
+    for seconds in range(SECONDS):
+        (ok, strip) = read_strip(strips, seconds)
+        assert ok
+        original = frames[seconds][:height, :width]
+        assert np.array_equal(layout.health_bar_diffs(strip), layout.health_bar_diffs(original))
+        assert np.array_equal(layout.name_imgs(strip), layout.name_imgs(original))
+        for char_num in (2, 3):
+            assert np.array_equal(layout.char_imgs(strip, char_num), layout.char_imgs(original, char_num))
+        # Greyscale is all that's kept of the big portraits
+        for (cached, portrait) in zip(layout.char_imgs(strip, 1), layout.char_imgs(original, 1)):
+            assert np.array_equal(cv.cvtColor(cached, cv.COLOR_BGR2GRAY), cv.cvtColor(portrait, cv.COLOR_BGR2GRAY))
+
+
+def test_hud_strip_comparison_still_works(tmp_path):
+    frames = random_frames(SECONDS)
+    strips = build_cache(tmp_path, frames)
+    (ok, strip) = read_strip(strips, 0)
+    assert float(hud_vector(strip, GAME_SIZE) @ hud_vector(frames[0], GAME_SIZE)) > 0.95
+
+
+def test_much_smaller_than_the_strip():
+    packing = StripPacking(1920)
+    assert packing.record_size * 4 < np.prod(strip_shape(1920, 1))
+
+
+def test_cache_is_reused(tmp_path):
+    frames = random_frames(SECONDS)
+    build_cache(tmp_path, frames)
+    strips = HUDStrips(str(tmp_path / "video.mp4"), SECONDS, 0, 0, GAME_SIZE, 1.0)
+    assert strips.complete
+    assert strips.done == SECONDS
+
+
+def test_past_the_end(tmp_path):
+    strips = build_cache(tmp_path, random_frames(SECONDS))
+    assert not read_strip(strips, SECONDS)[0]
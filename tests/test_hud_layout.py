@@ -0,0 +1,53 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from utils.hud_layout import hud_layout
+
+
+# How health bar diffs used to be worked out, one slice at a time
+def per_slice_diffs(image, GAME_SIZE):
+    diffs = []
+    for (y1, y2, x1, x2, colour) in hud_layout(GAME_SIZE).health_bar_slices:
+        average = image[y1:y2, x1:x2].mean(axis=0).mean(axis=0)
+        diffs.append(np.linalg.norm(average - colour))
+    return np.array(diffs)
+
+
+def random_frames(count, GAME_SIZE, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (count, int(GAME_SIZE*0.5625), GAME_SIZE, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("GAME_SIZE", [480, 1280, 1366, 1920])
+def test_bar_diffs_match_per_slice_means(GAME_SIZE):
+    layout = hud_layout(GAME_SIZE)
+    for image in random_frames(3, GAME_SIZE):
+        assert np.allclose(layout.health_bar_diffs(image), per_slice_diffs(image, GAME_SIZE))
+
+
+def test_batch_matches_one_at_a_time():
+    frames = random_frames(4, 1280)
+    layout = hud_layout(1280)
+    batch = layout.batch_health_bar_diffs(frames)
+    assert batch.shape == (4, 4)
+    for (image, diffs) in zip(frames, batch):
+        assert np.allclose(diffs, layout.health_bar_diffs(image))
+
+
+# A frame that's exactly the expected green everywhere it's sampled
+def test_full_bars_have_no_diff():
+    GAME_SIZE = 1280
+    image = np.zeros((720, GAME_SIZE, 3), dtype=np.float64)
+    for (y1, y2, x1, x2, colour) in hud_layout(GAME_SIZE).health_bar_slices:
+        image[y1:y2, x1:x2] = colour
+    assert np.allclose(hud_layout(GAME_SIZE).health_bar_diffs(image), 0)
+
+
+def test_crops_are_copies():
+    image = random_frames(1, 1280)[0]
+    before = image.copy()
+    (p1_name, _) = hud_layout(1280).name_imgs(image)
+    p1_name[:] = 0
+    assert np.array_equal(image, before)
@@ -0,0 +1,109 @@
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv = pytest.importorskip("cv2")
+
+from utils.live import LiveFrames, LiveCapture, LiveCapturePool
+from utils.scan_pipeline import ScanPipeline
+from utils.game_state import GameTracker
+from utils.stamper import earliest_needed
+
+WIDTH  = 32
+HEIGHT = 18
+
+
+# Raw BGR frames, one per second, each filled with its own second so they can
+# be told apart
+def raw_frames(count):
+    return b"".join(bytes([seconds]) * (WIDTH*HEIGHT*3) for seconds in range(count))
+
+
+def live_frames(count, max_frames=64):
+    frames = LiveFrames(io.BytesIO(raw_frames(count)), WIDTH, HEIGHT, max_frames=max_frames)
+    frames.thread.join(timeout=5)
+    return frames
+
+
+def read_second(frames, seconds):
+    capture = LiveCapture(frames)
+    capture.set(cv.CAP_PROP_POS_MSEC, seconds * 1000)
+    return capture.read()
+
+
+def test_frames_come_out_by_second():
+    frames = live_frames(5)
+    assert frames.ended
+    assert frames.received == 5
+    for seconds in range(5):
+        (ok, image) = read_second(frames, seconds)
+        assert ok
+        assert image.shape == (HEIGHT, WIDTH, 3)
+        assert (image == seconds).all()
+    # Past the end of the stream
+    (ok, _) = read_second(frames, 5)
+    assert not ok
+
+
+def test_reads_are_copies():
+    frames = live_frames(1)
+    (_, image) = read_second(frames, 0)
+    image[:] = 255
+    (_, image) = read_second(frames, 0)
+    assert (image == 0).all()
+
+
+def test_discarded_frames_are_gone():
+    frames = live_frames(5)
+    frames.discard_before(3)
+    assert not read_second(frames, 2)[0]
+    assert read_second(frames, 3)[0]
+
+
+# A full buffer holds the stream up until something gets discarded
+def test_buffer_waits_for_discard():
+    frames = LiveFrames(io.BytesIO(raw_frames(6)), WIDTH, HEIGHT, max_frames=4)
+    assert frames.wait_for(3)
+    frames.thread.join(timeout=0.5)
+    assert frames.received == 4
+    frames.discard_before(2)
+    assert frames.wait_for(5)
+    assert read_second(frames, 5)[0]
+
+
+# Skimming a game, the scan is past where it goes back to if the game turns
+# out to be over. That second has to still be there when it does.
+def test_resume_point_survives_discard():
+    frames = live_frames(20)
+    tracker = GameTracker(WIDTH, stride=5)
+    (_, round_start_image) = read_second(frames, 0)
+    tracker.start_game(8, round_start_image)
+    seconds = 13
+    frames.discard_before(earliest_needed(seconds, [], tracker))
+    assert read_second(frames, tracker.resume_seconds)[0]
+    assert not read_second(frames, 7)[0]
+
+
+def test_enriching_games_keep_their_frames():
+    frames = live_frames(40)
+    tracker = GameTracker(WIDTH, stride=5)
+    enriching = [(4, None), (30, None)]
+    frames.discard_before(earliest_needed(35, enriching, tracker))
+    assert read_second(frames, 4)[0]
+    assert not read_second(frames, 3)[0]
+
+
+# With the buffer full, the scan can only get further once whoever's waiting
+# on it lets go of some frames
+def test_scan_gets_past_full_buffer():
+    frames = LiveFrames(io.BytesIO(raw_frames(12)), WIDTH, HEIGHT, max_frames=4)
+    capture_pool = LiveCapturePool("test", frames)
+    scan_pipeline = ScanPipeline(capture_pool, 0, 0, WIDTH, 0, 0)
+    scan_pipeline.start()
+    try:
+        result = scan_pipeline.get(10, lambda: capture_pool.discard_before(frames.received - 1))
+        assert result.seconds == 10
+        assert (result.image == 10).all()
+    finally:
+        scan_pipeline.close()
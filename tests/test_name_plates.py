@@ -0,0 +1,76 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from utils.name_plates import NamePlateFingerprints, name_plate_vector
+
+HEIGHT = 30
+WIDTH  = 240
+
+
+# A made up name plate, different for every seed
+def plate(seed):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+
+# A slightly noisy copy, like the same name plate a few frames later
+def noisy(image, seed=99):
+    rng = np.random.default_rng(seed)
+    return np.clip(image.astype(np.int16) + rng.integers(-8, 9, image.shape), 0, 255).astype(np.uint8)
+
+
+ALICE = plate(1)
+BOB   = plate(2)
+CAROL = plate(3)
+
+
+def samples(p1_img, p2_img, p1_guess, p2_guess, count=3):
+    return [(name_plate_vector(p1_img), name_plate_vector(p2_img), p1_guess, p2_guess)] * count
+
+
+def fingerprints():
+    fingerprints = NamePlateFingerprints()
+    fingerprints.remember("ALICE", "BOB", samples(ALICE, BOB, "ALICE", "BOB"))
+    return fingerprints
+
+
+def test_same_sides():
+    assert fingerprints().match([(noisy(ALICE), noisy(BOB))] * 2) == ("ALICE", "BOB")
+
+
+def test_swapped_sides():
+    assert fingerprints().match([(noisy(BOB), noisy(ALICE))] * 2) == ("BOB", "ALICE")
+
+
+def test_new_player_means_ocr():
+    assert fingerprints().match([(noisy(ALICE), noisy(CAROL))] * 2) is None
+
+
+# Every sample has to agree, and on the same way around
+def test_every_sample_has_to_match():
+    assert fingerprints().match([(ALICE, BOB), (ALICE, CAROL)]) is None
+    assert fingerprints().match([(ALICE, BOB), (BOB, ALICE)]) is None
+
+
+def test_nothing_to_match_against():
+    assert NamePlateFingerprints().match([(ALICE, BOB)]) is None
+    assert fingerprints().match([]) is None
+
+
+# Unknown names are never worth matching
+def test_unknown_name_forgets():
+    plates = fingerprints()
+    plates.remember("ALICE", "_", samples(ALICE, BOB, "ALICE", "_"))
+    assert plates.match([(ALICE, BOB)]) is None
+
+
+# Plates that OCR'd as something else (eg. something in the way) are left
+# out, and if that's all of them there's no fingerprint
+def test_only_plates_that_read_right_count():
+    plates = NamePlateFingerprints()
+    plates.remember("ALICE", "BOB", samples(ALICE, BOB, "ALICE", "BOB") + samples(CAROL, CAROL, "AL1CE", "B0B"))
+    assert plates.match([(ALICE, BOB)]) == ("ALICE", "BOB")
+    plates.remember("ALICE", "BOB", samples(CAROL, CAROL, "AL1CE", "BOB"))
+    assert plates.match([(ALICE, BOB)]) is None
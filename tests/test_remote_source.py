@@ -0,0 +1,53 @@
+import pytest
+
+import utils.remote_source as remote_source
+from utils.remote_source import HTTPSource, FileSource, LoopbackServer
+
+DATA = bytes(range(256)) * 64
+
+
+# A source that claims to have data but never hands any over
+class EmptySource:
+    size = len(DATA)
+
+    def read(self, start, length):
+        return b""
+
+
+@pytest.fixture
+def served_file(tmp_path):
+    path = tmp_path / "video.bin"
+    path.write_bytes(DATA)
+    server = LoopbackServer(FileSource(str(path)))
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def no_delay(monkeypatch):
+    monkeypatch.setattr(remote_source, "RETRY_DELAY", 0)
+    monkeypatch.setattr(remote_source, "MAX_RETRIES", 2)
+
+
+def test_size_from_content_range(served_file):
+    assert HTTPSource(served_file.url).size == len(DATA)
+
+
+def test_read_range(served_file):
+    assert HTTPSource(served_file.url).read(100, 1000) == DATA[100:1100]
+
+
+def test_read_stops_at_end(served_file):
+    assert HTTPSource(served_file.url).read(len(DATA) - 10, 100) == DATA[-10:]
+
+
+# 206 every time, but no body. Has to give up eventually rather than asking
+# again forever.
+def test_empty_responses_count_as_failures(no_delay):
+    server = LoopbackServer(EmptySource())
+    try:
+        source = HTTPSource(server.url)
+        with pytest.raises(OSError, match="Giving up"):
+            source.read(0, 1000)
+    finally:
+        server.close()
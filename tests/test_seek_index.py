@@ -0,0 +1,79 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from utils.seek_index import SeekIndex, seek_index_path, load_seek_index
+
+FPS = 30
+
+
+# 10 seconds at 30fps, with a keyframe every 2 seconds
+def seek_index():
+    pts = np.arange(10 * FPS) / FPS
+    keyframes = np.arange(0, 10, 2, dtype=np.float64)
+    return SeekIndex(pts, keyframes)
+
+
+def test_duration_includes_last_frame():
+    assert seek_index().duration == pytest.approx(10.0)
+
+
+def test_duration_of_almost_nothing():
+    assert SeekIndex(np.array([]), np.array([])).duration == 0.0
+    assert SeekIndex(np.array([0.5]), np.array([0.5])).duration == 0.5
+
+
+# Only the frame timings near the end count, so a variable frame rate
+# recording still comes out right
+def test_duration_variable_frame_rate():
+    pts = np.concatenate([np.arange(0, 5, 1 / 60), np.arange(5, 10, 1 / 30)])
+    assert SeekIndex(pts, np.array([0.0])).duration == pytest.approx(10.0)
+
+
+@pytest.mark.parametrize("t, keyframe", [
+    (0.0, 0.0),
+    (1.9, 0.0),
+    (2.0, 2.0),
+    (5.5, 4.0),
+    (100.0, 8.0),
+])
+def test_keyframe_before(t, keyframe):
+    assert seek_index().keyframe_before(t) == keyframe
+
+
+def test_keyframe_before_first_keyframe():
+    index = SeekIndex(np.arange(5.0), np.array([1.0, 3.0]))
+    assert index.keyframe_before(0.5) == 0.0
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (0.0, 1.9, False),
+    (0.0, 2.0, True),
+    (2.0, 3.9, False), # at start doesn't count, that's where we already are
+    (1.5, 2.5, True),
+    (8.5, 20.0, False),
+])
+def test_has_keyframe_between(start, end, expected):
+    assert seek_index().has_keyframe_between(start, end) == expected
+
+
+def test_save_round_trip(tmp_path):
+    path = seek_index_path(str(tmp_path / "video.mp4"))
+    index = seek_index()
+    index.save(path, 1234, 5.0)
+    with np.load(path) as data:
+        assert int(data['size']) == 1234
+        assert np.array_equal(data['pts'], index.pts)
+        assert np.array_equal(data['keyframes'], index.keyframes)
+
+
+# A sidecar that matches the video gets used as is, without ffprobe
+def test_load_saved_index(tmp_path):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"not really a video")
+    stat = video.stat()
+    seek_index().save(seek_index_path(str(video)), stat.st_size, stat.st_mtime)
+    index = load_seek_index(str(video))
+    assert index is not None
+    assert index.duration == pytest.approx(10.0)
@@ -0,0 +1,113 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from utils.shards import split_into_shards, merge_shard_games, MIN_GAME_SECONDS
+from utils.stamper import game_record
+
+TEAM_A = ("PW", "AN", "BD", 0.9)
+TEAM_B = ("FI", "N", "N", 0.8)
+TEAM_C = ("VA", "SQ", "N", 0.95)
+
+
+def test_split_exact_multiple():
+    assert split_into_shards(3000, 1000) == [(0, 1000), (1000, 2000), (2000, 3000)]
+
+
+def test_split_remainder_goes_in_a_short_last_shard():
+    assert split_into_shards(2500, 1000) == [(0, 1000), (1000, 2000), (2000, 2500)]
+
+
+def test_split_shorter_than_one_shard():
+    assert split_into_shards(10, 1000) == [(0, 10)]
+
+
+def test_split_empty_video():
+    assert split_into_shards(0, 1000) == []
+
+
+# The shard after a boundary starts during a game's intro and finds it again
+def test_merge_drops_game_found_again_across_boundary():
+    first = [game_record(100, "ALICE", "BOB", TEAM_A, TEAM_B)]
+    second = [
+        game_record(100 + MIN_GAME_SECONDS - 1, "ALICE", "BOB", TEAM_A, TEAM_B),
+        game_record(400, "CAROL", "DAVE", TEAM_C, TEAM_A),
+    ]
+    merged = merge_shard_games([first, second], NETPLAY=1)
+    assert [game['seconds'] for game in merged] == [100, 400]
+
+
+def test_merge_keeps_games_min_game_seconds_apart():
+    first = [game_record(100, "ALICE", "BOB", TEAM_A, TEAM_B)]
+    second = [game_record(100 + MIN_GAME_SECONDS, "CAROL", "DAVE", TEAM_C, TEAM_A)]
+    merged = merge_shard_games([first, second], NETPLAY=1)
+    assert [game['seconds'] for game in merged] == [100, 100 + MIN_GAME_SECONDS]
+
+
+# A shard that starts mid-set guesses teams for its first game, but that game
+# is still part of the set from the shard before
+def test_merge_regroups_sets_across_boundary():
+    first = [
+        game_record(100, "ALICE", "BOB", TEAM_A, TEAM_B),
+        game_record(300, "ALICE", "BOB"),
+    ]
+    second = [
+        game_record(500, "BOB", "ALICE", TEAM_B, TEAM_A),
+        game_record(700, "CAROL", "DAVE", TEAM_C, TEAM_A),
+    ]
+    merged = merge_shard_games([first, second], NETPLAY=1)
+    assert [game['next_in_set'] for game in merged] == [False, True, True, False]
+
+
+def test_merge_borrows_teams_within_shard():
+    first = [
+        game_record(100, "ALICE", "BOB", TEAM_A, TEAM_B),
+        game_record(300, "ALICE", "BOB"),
+    ]
+    second = [
+        game_record(500, "CAROL", "DAVE", TEAM_C, TEAM_A),
+        game_record(700, "CAROL", "DAVE"),
+    ]
+    merged = merge_shard_games([first, second], NETPLAY=1)
+    assert (merged[1]['p1team'], merged[1]['p2team']) == (TEAM_A, TEAM_B)
+    assert (merged[3]['p1team'], merged[3]['p2team']) == (TEAM_C, TEAM_A)
+
+
+# Teams only ever come from earlier in the same shard, never the one before
+def test_merge_doesnt_borrow_teams_from_previous_shard():
+    first = [game_record(100, "ALICE", "BOB", TEAM_A, TEAM_B)]
+    second = [
+        game_record(500, "CAROL", "DAVE", TEAM_C, TEAM_A),
+        game_record(700, "CAROL", "DAVE"),
+    ]
+    merged = merge_shard_games([first, second], NETPLAY=1)
+    assert merged[2]['p1team'] == TEAM_C
+
+
+def test_merge_unknown_names_never_continue_a_set():
+    games = [
+        game_record(100, "_", "BOB", TEAM_A, TEAM_B),
+        game_record(300, "_", "BOB", TEAM_A, TEAM_B),
+    ]
+    merged = merge_shard_games([games], NETPLAY=1)
+    assert [game['next_in_set'] for game in merged] == [False, False]
+
+
+def test_merge_offline_games_are_all_sets():
+    games = [
+        game_record(100, "_", "_", TEAM_A, TEAM_B),
+        game_record(300, "_", "_", TEAM_A, TEAM_B),
+    ]
+    merged = merge_shard_games([games], NETPLAY=0)
+    assert [game['next_in_set'] for game in merged] == [False, False]
+
+
+def test_merge_leaves_shard_games_alone():
+    games = [
+        game_record(100, "ALICE", "BOB", TEAM_A, TEAM_B),
+        game_record(300, "ALICE", "BOB"),
+    ]
+    merge_shard_games([games], NETPLAY=1)
+    assert games[1]['p1team'] is None
+    assert 'next_in_set' not in games[0]
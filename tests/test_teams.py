@@ -0,0 +1,102 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from utils.ml import char1_list, char23_list
+from utils.teams import TeamInference, valid_teams, CONFIDENCE, MIN_FRAMES
+
+
+# Model output that's mostly sure about one character
+def probs(characters, character, sure=0.9):
+    out = np.full(len(characters), (1 - sure) / (len(characters) - 1))
+    out[characters.index(character)] = sure
+    return out
+
+
+def team_probs(char1, char2, char3, sure=0.9):
+    return (probs(char1_list, char1, sure), probs(char23_list, char2, sure), probs(char23_list, char3, sure))
+
+
+def is_valid(char1, char2, char3):
+    return bool(valid_teams[char1_list.index(char1), char23_list.index(char2), char23_list.index(char3)])
+
+
+def test_valid_teams():
+    assert is_valid("PW", "AN", "BD")
+    assert is_valid("PW", "AN", "N")
+    assert is_valid("PW", "N", "N")
+    # Duplicates
+    assert not is_valid("PW", "PW", "N")
+    assert not is_valid("PW", "AN", "PW")
+    assert not is_valid("PW", "AN", "AN")
+    # Anchor without a mid
+    assert not is_valid("PW", "N", "AN")
+
+
+def test_best_is_the_clear_winner():
+    inference = TeamInference()
+    inference.add(*team_probs("PW", "AN", "BD"))
+    assert inference.best()[:3] == ("PW", "AN", "BD")
+
+
+# Every frame's favourite for each slot on its own makes a team that can't
+# exist, so the best valid team wins instead
+def test_best_is_always_valid():
+    inference = TeamInference()
+    (char1, _, _) = team_probs("PW", "AN", "N")
+    char2 = probs(char23_list, "PW", 0.6)
+    char2[char23_list.index("AN")] = 0.35
+    inference.add(char1, char2, probs(char23_list, "N"))
+    best = inference.best()
+    assert is_valid(*best[:3])
+    assert best[:3] == ("PW", "AN", "N")
+
+
+# One confidently wrong frame gets outvoted by the rest
+def test_frames_add_up():
+    inference = TeamInference()
+    inference.add(*team_probs("PW", "AN", "BD"))
+    inference.add(*team_probs("PW", "AN", "BD"))
+    inference.add(*team_probs("FI", "AN", "BD", sure=0.99))
+    assert inference.best()[:3] == ("PW", "AN", "BD")
+
+
+# A probability of 0 from one frame can't rule a character out for good
+def test_zero_probability_isnt_final():
+    inference = TeamInference()
+    (char1, char2, char3) = team_probs("PW", "AN", "BD")
+    char1[char1_list.index("PW")] = 0
+    inference.add(char1, char2, char3)
+    for _ in range(3):
+        inference.add(*team_probs("PW", "AN", "BD"))
+    assert inference.best()[:3] == ("PW", "AN", "BD")
+
+
+def test_posterior_sums_to_one():
+    inference = TeamInference()
+    inference.add(*team_probs("PW", "AN", "BD"))
+    posterior = inference.posterior()
+    assert posterior.sum() == pytest.approx(1.0)
+    assert (posterior[~valid_teams] == 0).all()
+
+
+def test_confident_needs_min_frames():
+    inference = TeamInference()
+    for _ in range(MIN_FRAMES - 1):
+        inference.add(*team_probs("PW", "AN", "BD", sure=0.999))
+    assert inference.best()[3] >= CONFIDENCE
+    assert not inference.confident()
+    inference.add(*team_probs("PW", "AN", "BD", sure=0.999))
+    assert inference.confident()
+
+
+def test_not_confident_when_torn():
+    inference = TeamInference()
+    for _ in range(MIN_FRAMES):
+        (char1, char2, char3) = team_probs("PW", "AN", "BD")
+        char1[:] = 0
+        char1[char1_list.index("PW")] = 0.5
+        char1[char1_list.index("FI")] = 0.5
+        inference.add(char1, char2, char3)
+    assert not inference.confident()
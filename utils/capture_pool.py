@@ -0,0 +1,218 @@
+import os
+import sys
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import cv2 as cv
+from utils.seek_index import load_seek_index, IndexedCapture
+from utils.remote_source import is_url, is_growing, open_remote, GROWTH_POLL_INTERVAL
+
+# Enough for the preview, the worker and a couple of spares
+DEFAULT_MAX_HANDLES = 4
+
+
+# Hands out separate decoder handles on the same video file, so different
+# threads (eg. the GUI preview and the worker) never fight over one decoder's
+# position. Released handles are kept open and handed out again, since opening
+# a new one isn't free.
+#
+# The video can also be a http(s) URL, which is read through a local caching
+# proxy (see utils.remote_source), or a file that's still being downloaded or
+# recorded (growing=True), in which case the handles get reopened as it grows.
+#
+# A seek index can take a while to build for a long video. With
+# index_in_background=True the pool is usable straight away, without one,
+# and switches over once it's ready (see use_index).
+class CapturePool:
+    def __init__(self, filename: str, max_handles: int = DEFAULT_MAX_HANDLES, growing: bool = False,
+                 index_in_background: bool = False):
+        self.filename    = filename
+        self.max_handles = max_handles
+        self.remote      = None
+        # Only ever set by whoever opened it, a file that's just finished
+        # copying looks exactly the same as one that's still being written
+        self.still_growing = False
+        if is_url(filename):
+            try:
+                self.remote = open_remote(filename)
+            except OSError as e:
+                sys.exit(f"ERROR: couldn't open {filename} ({e})")
+            self.open_name = self.remote.url
+            # Building one would mean downloading the whole thing up front
+            self.index = None
+        else:
+            if not os.path.isfile(filename):
+                sys.exit(f"ERROR: file {filename} doesn't exist!")
+            self.open_name = filename
+            # Every handle shares the one seek index. No point building one
+            # for a file that's still being written, it'd be out of date
+            # straight away.
+            self.still_growing = growing
+            self.index = None
+            if not growing and not index_in_background:
+                self.index = load_seek_index(filename)
+        self.growing_at_open = self.still_growing
+        self.idle        = []
+        self.open_count  = 0
+        self.closed      = False
+        self.condition   = threading.Condition()
+        # Bumped whenever the video has grown, handles opened before that
+        # can't see the new end
+        self.generation  = 0
+        self.generations = {} # id(capture) -> generation it was opened in
+
+        # Open the first handle up front to answer questions about the video
+        # (size, length etc), then leave it idle for whoever wants it next
+        capture = self.acquire()
+        self.total_seconds = capture.total_seconds()
+        self.width  = capture.get(cv.CAP_PROP_FRAME_WIDTH)
+        self.height = capture.get(cv.CAP_PROP_FRAME_HEIGHT)
+        self.release(capture)
+
+        # Set once there's nothing more to wait for, index or no index
+        self.index_ready = threading.Event()
+        if self.remote is None and not growing and index_in_background:
+            threading.Thread(target=self.load_index, daemon=True).start()
+        else:
+            self.index_ready.set()
+
+    # Get a handle for exclusive use, blocking until one is free if we're
+    # already at capacity
+    def acquire(self, timeout=None):
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise RuntimeError(f"Capture pool for {self.filename} is closed")
+                if self.idle:
+                    return self.idle.pop()
+                if self.open_count < self.max_handles:
+                    self.open_count += 1
+                    break
+                if not self.condition.wait(timeout):
+                    raise TimeoutError(f"No free capture handles for {self.filename}")
+        # Open outside the lock, it can take a while. Anything that changes
+        # meanwhile makes it stale.
+        generation = self.generation
+        try:
+            capture = IndexedCapture(self.open_name, self.index)
+            self.generations[id(capture)] = generation
+            return capture
+        except Exception:
+            with self.condition:
+                self.open_count -= 1
+                self.condition.notify()
+            raise
+
+    # Give a handle back for someone else to use
+    def release(self, capture):
+        with self.condition:
+            if self.closed or self.is_stale(capture):
+                capture.release()
+                self.generations.pop(id(capture), None)
+                self.open_count -= 1
+            else:
+                self.idle.append(capture)
+            self.condition.notify()
+
+    @contextmanager
+    def handle(self, timeout=None):
+        capture = self.acquire(timeout)
+        try:
+            yield capture
+        finally:
+            self.release(capture)
+
+    def load_index(self):
+        try:
+            self.use_index(load_seek_index(self.filename))
+        except OSError as e:
+            logging.warning(f"Couldn't load seek index for {self.filename} ({e})")
+        finally:
+            self.index_ready.set()
+
+    # Switch over to a seek index (None if it couldn't be built). Handles in
+    # use carry on without it until they're released (see is_stale). The
+    # length can change too, since the index knows the real one.
+    def use_index(self, index):
+        with self.condition:
+            if index is None or self.closed:
+                return
+            self.index = index
+            self.total_seconds = int(index.duration)
+            self.generation += 1
+            self.close_idle()
+            self.condition.notify_all()
+
+    # Whether the video is a local file that's still being written to. Once
+    # it's stopped changing for a while, it's done for good.
+    @property
+    def growing(self) -> bool:
+        if self.still_growing and not is_growing(self.filename):
+            self.still_growing = False
+        return self.still_growing
+
+    # Whether a handle was opened before the video last grew (or before the
+    # seek index was ready)
+    def is_stale(self, capture) -> bool:
+        return self.generations.get(id(capture)) != self.generation
+
+    # Reopen to pick up everything written so far. Handles in use carry on
+    # until they're released (see is_stale). Returns the new length.
+    def refresh(self) -> int:
+        with self.condition:
+            self.generation += 1
+            self.close_idle()
+            self.condition.notify_all()
+        # Whoever's asking is usually holding a handle, and every other
+        # handle can be in use too, so don't wait for one to come free
+        try:
+            capture = self.acquire(timeout=0)
+        except TimeoutError:
+            capture = IndexedCapture(self.open_name, self.index)
+            try:
+                self.total_seconds = capture.total_seconds()
+            finally:
+                capture.release()
+            return self.total_seconds
+        self.total_seconds = capture.total_seconds()
+        self.release(capture)
+        return self.total_seconds
+
+    # Wait until the video is longer than the given second, for as long as
+    # it's still being written. Returns whether it got there.
+    def wait_for(self, seconds, should_stop=lambda: False) -> bool:
+        if not self.growing_at_open:
+            return seconds < self.total_seconds
+        while seconds >= self.total_seconds and not should_stop():
+            growing = self.growing
+            self.refresh()
+            if not growing:
+                break
+            if seconds >= self.total_seconds:
+                time.sleep(GROWTH_POLL_INTERVAL)
+        return seconds < self.total_seconds
+
+    # Nothing before this second will be read again. Only matters for live
+    # sources (see utils.live), a file can always be seeked back into.
+    def discard_before(self, seconds):
+        pass
+
+    # Call with the condition held
+    def close_idle(self):
+        for capture in self.idle:
+            capture.release()
+            self.generations.pop(id(capture), None)
+        self.open_count -= len(self.idle)
+        self.idle = []
+
+    # Close all idle handles now, and any handles still in use as soon as
+    # they're released
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.close_idle()
+            self.condition.notify_all()
+        if self.remote:
+            self.remote.close()
+
@@ -0,0 +1,52 @@
+import os
+import re
+from glob import glob
+import cv2 as cv
+
+# Labelled portrait crops come in one of two layouts:
+#
+# * Sorted by hand: <root>/char1/<CODE>/*.jpg and <root>/char23/<CODE>/*.jpg
+# * Straight out of a debug run (debug/ml): <root>/<timestamp>/<p1char2>/
+#   containing 1_original.jpg and 3_resized_<CODE>.jpg, where the code is
+#   whatever the model guessed at the time
+#
+# Both come out as a list of (kind, code, image) where kind is "char1" or
+# "char23" and image is the original BGR crop.
+
+
+# Whether the labels were checked by a person, rather than being a model's
+# own guesses
+def sorted_by_hand(root: str) -> bool:
+    return os.path.isdir(os.path.join(root, "char1")) or os.path.isdir(os.path.join(root, "char23"))
+
+
+def load_labelled_crops(root: str):
+    if sorted_by_hand(root):
+        return load_sorted_crops(root)
+    return load_debug_crops(root)
+
+
+def load_sorted_crops(root: str):
+    crops = []
+    for kind in ["char1", "char23"]:
+        for path in sorted(glob(os.path.join(root, kind, "*", "*.*"))):
+            code = os.path.basename(os.path.dirname(path))
+            image = cv.imread(path)
+            if image is not None:
+                crops.append((kind, code, image))
+    return crops
+
+
+def load_debug_crops(root: str):
+    crops = []
+    for original_path in sorted(glob(os.path.join(root, "*", "p[12]char[123]", "1_original.jpg"))):
+        slot_dir = os.path.dirname(original_path)
+        kind = "char1" if slot_dir.endswith("char1") else "char23"
+        labels = glob(os.path.join(slot_dir, "3_resized_*.jpg"))
+        if not labels:
+            continue
+        code = re.match(r"3_resized_(\w+)\.jpg", os.path.basename(labels[0])).group(1)
+        image = cv.imread(original_path)
+        if image is not None:
+            crops.append((kind, code, image))
+    return crops
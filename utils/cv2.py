@@ -1,28 +1,42 @@
 import cv2 as cv
-import numpy as np
 import sys
 import os
 import logging
 from pathlib import Path
-from PyQt6.QtGui import QPixmap, QImage
+from utils.seek_index import load_seek_index, IndexedCapture
+from utils.hud_layout import hud_layout, HEALTH_BAR_NAMES
 
 # Open a video file, returning a capture object and some other data
 def open_capture(filename: str):
     if not os.path.isfile(filename):
         sys.exit(f"ERROR: file {filename} doesn't exist!")
-    capture = cv.VideoCapture(filename)
-    fps = capture.get(cv.CAP_PROP_FPS)
-    frame_count = int(capture.get(cv.CAP_PROP_FRAME_COUNT))
-    total_seconds = int(frame_count / fps)
-    return (capture, total_seconds)
+    capture = IndexedCapture(filename, load_seek_index(filename))
+    return (capture, capture.total_seconds())
 
 
 # Read a frame at a specific time from a video
 def get_frame_from_video(capture, seconds, GAME_X, GAME_Y, GAME_SIZE, crop=False):
+    image = read_frame_from_video(capture, seconds, GAME_X, GAME_Y, GAME_SIZE, crop)
+    if image is None:
+        sys.exit(f"Failed to read frame at t = {seconds} from capture!")
+    return image
+
+
+# Same as get_frame_from_video, but returns None if the frame can't be read
+# (for background threads, where sys.exit would go unnoticed)
+# With a FrameRing, the frame is decoded into one of its buffers rather than a
+# freshly allocated one, and what comes back is a view into that buffer
+def read_frame_from_video(capture, seconds, GAME_X, GAME_Y, GAME_SIZE, crop=False, ring=None):
     capture.set(cv.CAP_PROP_POS_MSEC,(seconds*1000))   
-    success, image = capture.read()
+    buffer = ring.next() if ring is not None else None
+    if buffer is None:
+        success, image = capture.read()
+    else:
+        success, image = capture.read(buffer)
+    if ring is not None:
+        ring.keep(image if success else None)
     if not success:
-        sys.exit(f"Failed to read frame at t = {seconds} from capture!")
+        return None
     # Cut down to only the relevant part we're interested in
     # This means passing around a smaller array, and also all calculations
     # from this point forward can be independent of GAME_X and GAME_Y
@@ -36,128 +50,59 @@ def get_frame_from_video(capture, seconds, GAME_X, GAME_Y, GAME_SIZE, crop=False
     return image[y1:y2, x1:x2]
 
 
-def cv2_to_qpixmap(image):
-    height, width, channel = image.shape
-    bytesPerLine = 3 * width
-    image2 = np.require(image, np.uint8, 'C')
-    qimg = QImage(image2, width, height, bytesPerLine, QImage.Format.Format_BGR888)
-    return QPixmap(qimg)
-
-
 def avg_colour_of_area(image, y1, y2, x1, x2):
     area = image[y1:y2, x1:x2]
     return area.mean(axis=0).mean(axis=0)
 
 
-# Determines whether a frame is near the start of a round by looking for the
-# presence of a green health bar on both P1 and P2's point characters.
-def is_round_start(image, GAME_SIZE, debug_name="guess"):
+# Max allowable error from the "expected" health bar greens
+HEALTH_BAR_THRESHOLD = 10
 
-    # Take two slices from each health bar, take the average colour, and then
-    # compare to an "expected" green value. 
-    # Needs to be two because stuff like Band's saxophone and Bella's hoop 
-    # intro like to cut through the middle. Very annoying
-    y1   = int(GAME_SIZE*0.0734)
-    y2   = y1 + 1
+# Names of the health bar slices, in the order health_bar_diffs returns them
+health_bar_slice_names = HEALTH_BAR_NAMES
 
-    # Correct/"expected" green colours + max allowable error
-    correct_outer_green = np.array([128.9, 221.8, 218.9])
-    correct_inner_green = np.array([ 69.7, 126.3,  56.6])
-    threshold = 10
+
+# Where to sample each health bar, as (y1, y2, x1, x2, expected colour)
+def health_bar_slices(GAME_SIZE):
+    return hud_layout(GAME_SIZE).health_bar_slices
+
+
+# How far the average colour of each health bar slice is from the green of a
+# full health bar
+def health_bar_diffs(image, GAME_SIZE):
+    return hud_layout(GAME_SIZE).health_bar_diffs(image)
+
+
+# Determines whether a frame is near the start of a round by looking for the
+# presence of a green health bar on both P1 and P2's point characters.
+# Pass in diffs if they've already been worked out for this frame.
+def is_round_start(image, GAME_SIZE, debug_name="guess", diffs=None, threshold=HEALTH_BAR_THRESHOLD):
+    if diffs is None:
+        diffs = health_bar_diffs(image, GAME_SIZE)
 
     # Set up debug logging
     if logging.DEBUG >= logging.root.level:
         debug_path = f"debug/green_bars/{debug_name}"
         Path(debug_path).mkdir(parents=True, exist_ok=True)
 
-    # P1 outer slice
-    p1x1_outer = int(GAME_SIZE*0.146)
-    p1x2_outer = int(GAME_SIZE*0.225)
-    p1_outer_avg = avg_colour_of_area(image, y1, y2, p1x1_outer, p1x2_outer)
-    p1_outer_diff = np.linalg.norm(p1_outer_avg - correct_outer_green)
-    if p1_outer_diff > threshold:
-        if logging.DEBUG >= logging.root.level:
-            logging.debug(f"is_round_start: ({debug_name}) p1_outer_diff {p1_outer_diff} > threshold {threshold}")
-            cv.imwrite(f"{debug_path}/p1_outer_diff_{p1_outer_diff}.jpg", image[y1:y2, p1x1_outer:p1x2_outer])
-            cv.imwrite(f"{debug_path}/full_img.jpg", image)
-        return False
-
-    # P2 outer slice
-    p2x1_outer = GAME_SIZE - p1x2_outer
-    p2x2_outer = GAME_SIZE - p1x1_outer
-    p2_outer_avg = avg_colour_of_area(image, y1, y2, p2x1_outer, p2x2_outer)
-    p2_outer_diff = np.linalg.norm(p2_outer_avg - correct_outer_green)
-    if p2_outer_diff > threshold:
-        if logging.DEBUG >= logging.root.level:
-            logging.debug(f"is_round_start: ({debug_name}) p2_outer_diff {p2_outer_diff} > threshold {threshold}")
-            cv.imwrite(f"{debug_path}/p2_outer_diff_{p2_outer_diff}.jpg", image[y1:y2, p2x1_outer:p2x2_outer])
-            cv.imwrite(f"{debug_path}/full_img.jpg", image)
-        return False
-
-    # P1 inner slice
-    p1x1_inner = int(GAME_SIZE*0.330)
-    p1x2_inner = int(GAME_SIZE*0.409)
-    p1_inner_avg = avg_colour_of_area(image, y1, y2, p1x1_inner, p1x2_inner)
-    p1_inner_diff = np.linalg.norm(p1_inner_avg - correct_inner_green)
-    if p1_inner_diff > threshold:
-        if logging.DEBUG >= logging.root.level:
-            logging.debug(f"is_round_start: ({debug_name}) p1_inner_diff {p1_inner_diff} > threshold {threshold}")
-            cv.imwrite(f"{debug_path}/p1_inner_diff_{p1_inner_diff}.jpg", image[y1:y2, p1x1_inner:p1x2_inner])
-            cv.imwrite(f"{debug_path}/full_img.jpg", image)
-        return False
-
-    # P2 inner slice
-    p2x1_inner = GAME_SIZE - p1x2_inner
-    p2x2_inner = GAME_SIZE - p1x1_inner
-    p2_inner_avg = avg_colour_of_area(image, y1, y2, p2x1_inner, p2x2_inner)
-    p2_inner_diff = np.linalg.norm(p2_inner_avg - correct_inner_green)
-    if p2_inner_diff > threshold:
-        if logging.DEBUG >= logging.root.level:
-            logging.debug(f"is_round_start: ({debug_name}) p2_inner_diff {p2_inner_diff} > threshold {threshold}")
-            cv.imwrite(f"{debug_path}/p2_inner_diff_{p2_inner_diff}.jpg", image[y1:y2, p2x1_inner:p2x2_inner])
-            cv.imwrite(f"{debug_path}/full_img.jpg", image)
-        return False
+    for (name, diff, (y1, y2, x1, x2, correct_colour)) in zip(
+        health_bar_slice_names, diffs, health_bar_slices(GAME_SIZE)
+    ):
+        if diff > threshold:
+            if logging.DEBUG >= logging.root.level:
+                logging.debug(f"is_round_start: ({debug_name}) {name}_diff {diff} > threshold {threshold}")
+                cv.imwrite(f"{debug_path}/{name}_diff_{diff}.jpg", image[y1:y2, x1:x2])
+                cv.imwrite(f"{debug_path}/full_img.jpg", image)
+            return False
 
     return True
 
 
-# Get character portraits from a frame
+# Get character portraits from a frame (see HUDLayout for where they are)
 def get_char_imgs(image, char_num, GAME_SIZE):
-    # funny magic numbers for each portrait's position
-    if char_num == 1:
-        y1   = int(GAME_SIZE*0.015625)
-        y2   = int(GAME_SIZE*0.078125)
-        p1x1 = int(GAME_SIZE*0.023438)
-        p1x2 = int(GAME_SIZE*0.117188)
-    elif char_num == 2:
-        y1   = int(GAME_SIZE*0.054213)
-        y2   = int(GAME_SIZE*0.063588)
-        # Older params that were a bit more imprecise I think
-        # y1   = int(GAME_SIZE*0.054688)
-        # y2   = int(GAME_SIZE*0.064063)
-        p1x1 = int(GAME_SIZE*0.134375)
-        p1x2 = int(GAME_SIZE*0.171875)
-    else:
-        y1   = int(GAME_SIZE*0.043750)
-        y2   = int(GAME_SIZE*0.053125)
-        p1x1 = int(GAME_SIZE*0.128906)
-        p1x2 = int(GAME_SIZE*0.166406)
-    # horizontal flip for player 2
-    p2x1 = GAME_SIZE - p1x2
-    p2x2 = GAME_SIZE - p1x1
-    # crop the image and return
-    return image[y1:y2, p1x1:p1x2], image[y1:y2, p2x1:p2x2]
+    return hud_layout(GAME_SIZE).char_imgs(image, char_num)
 
 
 # Get the player's names from a frame
 def get_name_imgs(image, GAME_SIZE):
-    # funny magic numbers for each name's position
-    y1   = int(GAME_SIZE*0.1)
-    y2   = int(GAME_SIZE*0.1234)
-    p1x1 = int(GAME_SIZE*0.164)
-    p1x2 = int(GAME_SIZE*0.352)
-    # horizontal flip for player 2
-    p2x1 = GAME_SIZE - p1x2
-    p2x2 = GAME_SIZE - p1x1
-    # crop the image and return
-    return image[y1:y2, p1x1:p1x2], image[y1:y2, p2x1:p2x2]
\ No newline at end of file
+    return hud_layout(GAME_SIZE).name_imgs(image)
@@ -0,0 +1,346 @@
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import urllib.error
+import urllib.request
+from collections import deque
+
+from utils.jobs import JobQueue, DEFAULT_MAX_JOBS
+from utils.presets import load_presets, settings_from_preset
+
+# A long running local service that keeps a pool of processes with the
+# models already loaded, and takes jobs over HTTP. Starting a job then costs
+# a request instead of a TensorFlow import.
+#
+#   python -m utils.daemon serve [--max-jobs N]
+#   python -m utils.daemon submit VIDEO -p PRESET [--date D] [--url U] [--wait]
+#   python -m utils.daemon status [JOB]
+#   python -m utils.daemon cancel JOB
+#
+# API (JSON in and out):
+#   GET  /jobs                 every job's state
+#   GET  /jobs/N               one job's state, including its log and results
+#   POST /jobs                 {"video", "preset", "date", "url", "settings"}
+#                              or {"settings"} with every setting filled in
+#   POST /jobs/N/cancel
+#   POST /max_jobs             {"max_jobs"}
+#   GET  /events?since=N       everything that's happened since event N
+
+DEFAULT_DAEMON_PORT = 8766
+DEFAULT_DAEMON_URL = f"http://127.0.0.1:{DEFAULT_DAEMON_PORT}"
+
+# How often to pass on what the pool processes have to say (seconds)
+EVENT_POLL_INTERVAL = 0.2
+
+# Events kept for clients that poll, oldest dropped first
+MAX_EVENTS = 10000
+
+# Lines of log kept per job
+MAX_JOB_LINES = 1000
+
+# How long a client waits for the daemon to answer (seconds)
+CLIENT_TIMEOUT = 10
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+# CSV next to the video, same as the job queue window does
+def csv_filename(infile_name: str) -> str:
+    return re.sub(r'\.(mp4|m4v|mov|avi|mkv|webm|wmv)$', '', infile_name) + ".csv"
+
+
+class Daemon:
+    def __init__(self, max_jobs: int = DEFAULT_MAX_JOBS):
+        self.job_queue = JobQueue(max_jobs)
+        self.config    = load_presets()
+        self.jobs      = {} # job_id -> state, see new_job
+        self.events    = deque(maxlen=MAX_EVENTS) # (sequence number, job_id, kind, value)
+        self.sequence  = 0
+
+    def new_job(self, settings):
+        return dict(
+            video     = settings['infile_name'],
+            preset    = settings.get('PRESET', ""),
+            status    = "Queued",
+            seconds   = 0,
+            total     = None,
+            elapsed   = 0,
+            lines     = deque(maxlen=MAX_JOB_LINES),
+            result    = None,
+        )
+
+    def job_summary(self, job_id, job, full=False):
+        summary = {key: value for (key, value) in job.items() if key not in ("lines", "result")}
+        summary['job_id'] = job_id
+        if full:
+            summary['lines']  = list(job['lines'])
+            summary['result'] = job['result']
+        return summary
+
+    # Settings for a job from a request, either filled in from a preset or
+    # given in full (like the GUI does)
+    def job_settings(self, body):
+        if "video" not in body:
+            return dict(body["settings"])
+        preset = body.get("preset", "DEFAULT")
+        if preset not in self.config:
+            raise ValueError(f"no preset called {preset}")
+        settings = settings_from_preset(self.config, preset, body.get("date"), body.get("url", ""))
+        settings.update(body.get("settings", {}))
+        settings['infile_name'] = os.path.abspath(body["video"])
+        settings.setdefault('outfile_name', csv_filename(settings['infile_name']))
+        if not os.path.isfile(settings['infile_name']):
+            raise ValueError(f"{settings['infile_name']} doesn't exist")
+        return settings
+
+    def submit(self, body):
+        settings = self.job_settings(body)
+        job_id = self.job_queue.submit(settings)
+        self.jobs[job_id] = self.new_job(settings)
+        logging.info(f"Job {job_id}: {settings['infile_name']}")
+        return job_id
+
+    # Keep track of what each job is up to, and keep the events for clients
+    def handle_event(self, job_id, kind, value):
+        self.sequence += 1
+        self.events.append((self.sequence, job_id, kind, value))
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        if kind == "line":
+            job['lines'].append(value)
+        elif kind == "started":
+            job['status'] = "Running"
+            job['total'] = value
+        elif kind == "progress":
+            (job['seconds'], job['elapsed']) = value
+        elif kind == "result":
+            job['result'] = value
+        elif kind == "finished":
+            job['status'] = value
+            logging.info(f"Job {job_id}: {value}")
+
+    async def poll_events(self):
+        while True:
+            for event in self.job_queue.poll_events():
+                self.handle_event(*event)
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
+
+    # Returns (status, response JSON)
+    def route(self, method, path, query, body):
+        parts = [part for part in path.split("/") if part]
+        if method == "GET" and parts == ["jobs"]:
+            return (200, dict(jobs=[self.job_summary(job_id, job) for (job_id, job) in self.jobs.items()]))
+        if method == "POST" and parts == ["jobs"]:
+            return (200, dict(job_id=self.submit(body)))
+        if len(parts) >= 2 and parts[0] == "jobs" and parts[1].isdigit():
+            job_id = int(parts[1])
+            if job_id not in self.jobs:
+                return (404, dict(error=f"no job {job_id}"))
+            if method == "GET" and len(parts) == 2:
+                return (200, self.job_summary(job_id, self.jobs[job_id], full=True))
+            if method == "POST" and parts[2:] == ["cancel"]:
+                never_started = self.job_queue.cancel(job_id)
+                if never_started:
+                    self.handle_event(job_id, "finished", "Cancelled")
+                return (200, dict(ok=True))
+        if method == "POST" and parts == ["max_jobs"]:
+            self.job_queue.set_max_jobs(int(body["max_jobs"]))
+            return (200, dict(ok=True))
+        if method == "GET" and parts == ["events"]:
+            since = int(query.get("since", 0))
+            return (200, dict(
+                events=[list(event) for event in self.events if event[0] > since],
+                latest=self.sequence
+            ))
+        return (404, dict(error=f"nothing at {method} {path}"))
+
+    # Just enough HTTP/1.1 for JSON requests, one per connection
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode()
+            (method, target, _) = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode()
+                if line in ("\r\n", "\n", ""):
+                    break
+                (name, value) = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            body = json.loads(await reader.readexactly(length)) if length else {}
+            (path, _, query_string) = target.partition("?")
+            query = dict(pair.split("=", 1) for pair in query_string.split("&") if "=" in pair)
+            (status, response) = self.route(method, path, query, body)
+        except (ValueError, KeyError, TypeError, asyncio.IncompleteReadError) as e:
+            (status, response) = (400, dict(error=str(e)))
+        # Anything else is our fault, but one bad request shouldn't leave the
+        # client hanging or take the daemon down with it
+        except Exception as e:
+            logging.exception(f"Error handling a request: {e}")
+            (status, response) = (500, dict(error=str(e)))
+        data = json.dumps(response, default=float).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n".encode() + data
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def serve(self, host, port):
+        # Models load while we wait for the first job
+        self.job_queue.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logging.info(f"Listening on http://{host}:{port}")
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.poll_events())
+
+    def run(self, host="127.0.0.1", port=DEFAULT_DAEMON_PORT):
+        try:
+            asyncio.run(self.serve(host, port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.job_queue.shutdown()
+
+
+# Talks to a running daemon. Has the same methods as a JobQueue, so the job
+# queue window can hand its jobs to a daemon instead of running them itself.
+class DaemonClient:
+    def __init__(self, url: str = DEFAULT_DAEMON_URL):
+        self.url   = url.rstrip("/")
+        self.since = 0
+
+    # A client for the daemon if there's one running, otherwise None
+    @classmethod
+    def connect(cls, url: str = DEFAULT_DAEMON_URL):
+        client = cls(url)
+        try:
+            client.since = client.request("GET", "/events?since=0")["latest"]
+        except OSError:
+            return None
+        return client
+
+    def request(self, method, path, data=None):
+        request = urllib.request.Request(
+            self.url + path,
+            method=method,
+            data=json.dumps(data, default=float).encode() if data is not None else None,
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=CLIENT_TIMEOUT) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise OSError(f"daemon said {e.code}: {json.loads(e.read() or b'{}').get('error', '')}")
+
+    def submit(self, settings) -> int:
+        return self.request("POST", "/jobs", dict(settings=settings))["job_id"]
+
+    # Unlike a JobQueue, can't tell whether it never got started
+    def cancel(self, job_id: int) -> bool:
+        self.request("POST", f"/jobs/{job_id}/cancel", {})
+        return False
+
+    def poll_events(self):
+        try:
+            response = self.request("GET", f"/events?since={self.since}")
+        except OSError as e:
+            logging.error(f"Lost the daemon at {self.url} ({e})")
+            return []
+        self.since = response["latest"]
+        return [(job_id, kind, value) for (_, job_id, kind, value) in response["events"]]
+
+    def active_jobs(self) -> int:
+        jobs = self.request("GET", "/jobs")["jobs"]
+        return sum(1 for job in jobs if job["status"] in ("Queued", "Running"))
+
+    def set_max_jobs(self, max_jobs: int):
+        self.request("POST", "/max_jobs", dict(max_jobs=max_jobs))
+
+    def job(self, job_id: int):
+        return self.request("GET", f"/jobs/{job_id}")
+
+    # The daemon's jobs carry on without us
+    def shutdown(self):
+        pass
+
+
+def print_job(job):
+    progress = f"{job['seconds']}/{job['total']}s" if job['total'] else ""
+    print(f"{job['job_id']:>4}  {job['status']:<10} {progress:<14} {job['video']}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Keep the models loaded and take jobs over HTTP")
+    parser.add_argument("--url", default=DEFAULT_DAEMON_URL, help=f"daemon to talk to (default {DEFAULT_DAEMON_URL})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_DAEMON_PORT, help="port to listen on")
+    serve_parser.add_argument("--max-jobs", type=int, default=DEFAULT_MAX_JOBS, help="videos to process at once")
+
+    submit_parser = subparsers.add_parser("submit")
+    submit_parser.add_argument("videos", nargs="+", help="video files to process")
+    submit_parser.add_argument("-p", "--preset", default="DEFAULT", help="preset from config/presets.ini")
+    submit_parser.add_argument("-d", "--date", help="date for the csv (YYYY-MM-DD), instead of the preset's DAY")
+    submit_parser.add_argument("--urls", nargs="*", default=[], help="vod URL for each video, for the csv")
+    submit_parser.add_argument("--wait", action="store_true", help="wait for the jobs to finish, printing their output")
+
+    status_parser = subparsers.add_parser("status")
+    status_parser.add_argument("job", type=int, nargs="?", help="job to show in full")
+
+    cancel_parser = subparsers.add_parser("cancel")
+    cancel_parser.add_argument("job", type=int)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        Daemon(args.max_jobs).run(port=args.port)
+        sys.exit()
+
+    client = DaemonClient.connect(args.url)
+    if client is None:
+        sys.exit(f"ERROR: no daemon at {args.url}, start one with python -m utils.daemon serve")
+    try:
+        if args.command == "submit":
+            job_ids = []
+            for (i, video) in enumerate(args.videos):
+                body = dict(video=video, preset=args.preset, date=args.date)
+                if i < len(args.urls):
+                    body['url'] = args.urls[i]
+                job_ids.append(client.request("POST", "/jobs", body)["job_id"])
+                print(f"Job {job_ids[-1]}: {video}")
+            unfinished = set(job_ids)
+            while args.wait and unfinished:
+                for (job_id, kind, value) in client.poll_events():
+                    if job_id not in unfinished:
+                        continue
+                    if kind == "line":
+                        print(f"[{job_id}] {value}")
+                    elif kind == "finished":
+                        print(f"[{job_id}] {value}")
+                        unfinished.discard(job_id)
+                time.sleep(EVENT_POLL_INTERVAL)
+        elif args.command == "status":
+            if args.job is None:
+                for job in client.request("GET", "/jobs")["jobs"]:
+                    print_job(job)
+            else:
+                job = client.job(args.job)
+                print_job(job)
+                print("\n".join(job['lines']))
+        elif args.command == "cancel":
+            client.cancel(args.job)
+    except OSError as e:
+        sys.exit(f"ERROR: {e}")
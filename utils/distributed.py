@@ -0,0 +1,461 @@
+import os
+import re
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import threading
+import traceback
+import subprocess
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+from utils.capture_pool import CapturePool
+from utils.stamper import Stamper
+from utils.remote_source import FileSource, RangeRequestHandler
+from utils.presets import load_presets, settings_from_preset
+from utils.shards import split_into_shards, merge_shard_games, format_games, DEFAULT_SHARD_SECONDS
+from utils.jobs import timestamps_filename
+from utils.ml import use_shared_models
+
+# Splitting long videos across several machines. A coordinator cuts each
+# video into time ranges ("shards") and hands them out over HTTP to any
+# number of workers, which fetch just their part of the video from the
+# coordinator, run the usual pipeline over it and send back the games they
+# found. Once every shard of a video is in, the coordinator merges them and
+# writes the timestamps and CSV next to the video.
+#
+#   python -m utils.distributed coordinator -p PRESET video.mp4 [video2.mp4 ...]
+#   python -m utils.distributed worker http://coordinator-host:8765
+#   python -m utils.distributed local -w 3 -p PRESET video.mp4
+#
+# The last one runs a coordinator and a few workers on this machine.
+
+DEFAULT_PORT = 8765
+
+# A shard is handed to someone else if its worker hasn't been heard from in
+# this long (seconds), eg. because it crashed or lost its network
+LEASE_SECONDS = 120
+HEARTBEAT_INTERVAL = 30
+
+# Times a shard is tried before giving up on it
+MAX_ATTEMPTS = 3
+
+# How long workers wait before asking again when there's nothing to do yet
+IDLE_POLL_INTERVAL = 5
+
+# Workers give up on a coordinator they can't reach this many times in a row
+MAX_CONNECT_FAILURES = 12
+
+# Bump this whenever the manifest format changes
+MANIFEST_VERSION = 1
+
+
+# Each video's list of shards and what came back from them, kept next to the
+# video so a coordinator that's restarted doesn't redo finished shards
+def manifest_path(filename: str) -> str:
+    return f"{filename}.shards.json"
+
+
+class VideoJob:
+    def __init__(self, number, filename, settings, shard_seconds):
+        self.number   = number
+        self.filename = filename
+        self.settings = settings
+        self.source   = FileSource(filename)
+        capture_pool  = CapturePool(filename, max_handles=1)
+        self.total_seconds = capture_pool.total_seconds
+        capture_pool.close()
+        self.finished = False
+
+        self.tasks = [
+            dict(start=start, end=end, status="waiting", attempts=0, games=None)
+            for (start, end) in split_into_shards(self.total_seconds, shard_seconds)
+        ]
+        self.load_manifest(shard_seconds)
+
+    def manifest(self, shard_seconds):
+        return dict(
+            version=MANIFEST_VERSION,
+            total_seconds=self.total_seconds,
+            shard_seconds=shard_seconds,
+            GAME_X=self.settings['GAME_X'],
+            GAME_Y=self.settings['GAME_Y'],
+            GAME_SIZE=self.settings['GAME_SIZE'],
+        )
+
+    # Pick up finished shards from an earlier run with the same settings
+    def load_manifest(self, shard_seconds):
+        self.shard_seconds = shard_seconds
+        try:
+            with open(manifest_path(self.filename), "r") as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            return
+        if old.get("manifest") != self.manifest(shard_seconds):
+            return
+        for (task, old_task) in zip(self.tasks, old["tasks"]):
+            if old_task["status"] == "done":
+                task.update(status="done", games=old_task["games"])
+        done = sum(1 for task in self.tasks if task["status"] == "done")
+        logging.info(f"{self.filename}: {done}/{len(self.tasks)} shards already done")
+
+    def save_manifest(self):
+        path = manifest_path(self.filename)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(
+                manifest=self.manifest(self.shard_seconds),
+                tasks=[
+                    dict(start=task["start"], end=task["end"], status=task["status"], games=task["games"])
+                    for task in self.tasks
+                ]
+            ), f)
+        os.replace(tmp_path, path)
+
+    def all_settled(self) -> bool:
+        return all(task["status"] in ("done", "failed") for task in self.tasks)
+
+    # Merge every shard's games and write out the results
+    def finish(self):
+        games = merge_shard_games(
+            [task["games"] or [] for task in self.tasks], self.settings['NETPLAY']
+        )
+        (timestamp_data, csv_data, log_lines) = format_games(games, self.total_seconds, **self.settings)
+        failed = [task for task in self.tasks if task["status"] == "failed"]
+        if failed:
+            missing = ", ".join(f"{task['start']}s-{task['end']}s" for task in failed)
+            log_lines.append(f"### WARNING! Couldn't process {missing}, games in there are missing")
+
+        outfile_name = timestamps_filename(self.filename)
+        with open(outfile_name, "w") as f:
+            f.write(timestamp_data)
+        if self.settings['MAKE_CSV']:
+            csv_name = re.sub(r'\.(mp4|m4v|mov|avi|mkv|webm|wmv)$', '', self.filename) + ".csv"
+            with open(csv_name, "w") as f:
+                f.write(csv_data)
+        for line in log_lines:
+            logging.info(f"{os.path.basename(self.filename)}: {line}")
+        logging.info(f"{self.filename}: timestamps written to {outfile_name}")
+        self.finished = True
+
+
+class CoordinatorRequestHandler(RangeRequestHandler):
+    def do_HEAD(self):
+        self.serve_video(body=False)
+
+    def do_GET(self):
+        self.serve_video(body=True)
+
+    def serve_video(self, body: bool):
+        match = re.fullmatch(r'/video/(\d+)', self.path)
+        videos = self.server.coordinator.videos
+        if not match or int(match.group(1)) >= len(videos):
+            self.send_error(404)
+            return
+        self.serve_range(videos[int(match.group(1))].source, body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_error(400)
+            return
+        coordinator = self.server.coordinator
+        handlers = {
+            "/claim":     coordinator.claim,
+            "/heartbeat": coordinator.heartbeat,
+            "/complete":  coordinator.complete,
+            "/fail":      coordinator.fail,
+        }
+        if self.path not in handlers:
+            self.send_error(404)
+            return
+        (status, response) = handlers[self.path](request, self.headers.get("Host", ""))
+        # 204 (nothing to hand out right now) can't have a body
+        data = json.dumps(response).encode() if status != 204 else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+# Hands out shards of a queue of videos and collects what comes back
+class Coordinator:
+    def __init__(self, filenames, settings_list, shard_seconds=DEFAULT_SHARD_SECONDS, host="0.0.0.0", port=DEFAULT_PORT):
+        # Every worker uses the coordinator's username aliases so names come
+        # out the same whichever machine read them
+        with open("config/usernames.json", "r") as f:
+            self.usernames = json.load(f)
+        self.videos = [
+            VideoJob(number, filename, settings, shard_seconds)
+            for (number, (filename, settings)) in enumerate(zip(filenames, settings_list))
+        ]
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), CoordinatorRequestHandler)
+        self.server.daemon_threads = True
+        self.server.coordinator = self
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def tasks(self):
+        for video in self.videos:
+            for (number, task) in enumerate(video.tasks):
+                yield (video, number, task)
+
+    def find(self, request):
+        for (video, number, task) in self.tasks():
+            if request.get("task_id") == f"{video.number}:{number}":
+                return (video, number, task)
+        return (None, None, None)
+
+    def all_finished(self) -> bool:
+        return all(video.finished for video in self.videos)
+
+    # Shards whose worker went quiet go back in the queue
+    def expire_leases(self):
+        now = time.time()
+        for (video, number, task) in self.tasks():
+            if task["status"] == "running" and task["lease_expires"] < now:
+                logging.warning(f"{task['worker']} went quiet on {video.filename} shard {number}")
+                self.give_up_or_retry(video, number, task)
+
+    # Call with the lock held
+    def give_up_or_retry(self, video, number, task):
+        if task["attempts"] >= MAX_ATTEMPTS:
+            logging.error(f"Giving up on {video.filename} shard {number} after {task['attempts']} attempts")
+            task["status"] = "failed"
+        else:
+            task["status"] = "waiting"
+
+    def claim(self, request, host):
+        with self.lock:
+            self.expire_leases()
+            if self.all_finished():
+                return (410, {})
+            for (video, number, task) in self.tasks():
+                if task["status"] == "waiting":
+                    task.update(
+                        status="running",
+                        attempts=task["attempts"] + 1,
+                        worker=request.get("worker", "?"),
+                        lease_expires=time.time() + LEASE_SECONDS
+                    )
+                    logging.info(f"{task['worker']} <- {video.filename} {task['start']}s-{task['end']}s")
+                    # Workers fetch the video from us, by whatever address
+                    # they used to get here
+                    return (200, dict(
+                        task_id=f"{video.number}:{number}",
+                        video_url=f"http://{host}/video/{video.number}",
+                        start=task["start"],
+                        end=task["end"],
+                        total_seconds=video.total_seconds,
+                        settings=dict(video.settings, USERNAMES=self.usernames)
+                    ))
+            # Everything's handed out but not all back yet
+            return (204, {})
+
+    # Returns whether the worker should carry on with the shard
+    def heartbeat(self, request, host):
+        with self.lock:
+            (video, number, task) = self.find(request)
+            if task is None or task["status"] != "running" or task.get("worker") != request.get("worker"):
+                return (200, dict(ok=False))
+            task["lease_expires"] = time.time() + LEASE_SECONDS
+            return (200, dict(ok=True))
+
+    def complete(self, request, host):
+        with self.lock:
+            (video, number, task) = self.find(request)
+            # A late answer for a shard that's since been given to somebody
+            # else is still a perfectly good answer
+            if task is None or task["status"] == "done":
+                return (200, {})
+            task.update(status="done", games=request.get("games", []))
+            video.save_manifest()
+            if video.all_settled() and not video.finished:
+                video.finish()
+            return (200, {})
+
+    def fail(self, request, host):
+        with self.lock:
+            (video, number, task) = self.find(request)
+            if task is None or task["status"] != "running":
+                return (200, {})
+            logging.warning(f"{request.get('worker')} failed on {request.get('task_id')}:\n{request.get('error', '')}")
+            self.give_up_or_retry(video, number, task)
+            if video.all_settled() and not video.finished:
+                video.finish()
+            return (200, {})
+
+    # Serve until every video is finished
+    def run(self):
+        with self.lock:
+            for video in self.videos:
+                if video.all_settled():
+                    video.finish()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        logging.info(f"Coordinator listening on port {self.port}")
+        while True:
+            time.sleep(1)
+            with self.lock:
+                self.expire_leases()
+                for video in self.videos:
+                    if video.all_settled() and not video.finished:
+                        video.finish()
+                if self.all_finished():
+                    break
+        # Give workers a chance to hear that there's nothing left
+        time.sleep(IDLE_POLL_INTERVAL)
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# POST some JSON, returns (status, response JSON)
+def post(base_url, path, data):
+    request = urllib.request.Request(
+        base_url.rstrip("/") + path,
+        data=json.dumps(data, default=float).encode(),
+        headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            body = response.read()
+            return (response.status, json.loads(body) if body else {})
+    except urllib.error.HTTPError as e:
+        return (e.code, {})
+
+
+def run_task(coordinator_url, name, task):
+    stamper = None
+    stop_heartbeat = threading.Event()
+
+    def heartbeat():
+        while not stop_heartbeat.wait(HEARTBEAT_INTERVAL):
+            try:
+                (status, response) = post(coordinator_url, "/heartbeat", dict(task_id=task["task_id"], worker=name))
+            except OSError:
+                continue
+            # Somebody else has it now, no point carrying on
+            if not response.get("ok", True) and stamper is not None:
+                stamper.signal_to_stop()
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    capture_pool = None
+    try:
+        capture_pool = CapturePool(task["video_url"], max_handles=2)
+        stamper = Stamper(
+            **dict(task["settings"], MAKE_CSV=False),
+            capture_pool  = capture_pool,
+            start_seconds = task["start"],
+            end_seconds   = task["end"],
+            total_seconds = task["total_seconds"],
+            outfile_name  = None,
+            print_line    = logging.info
+        )
+        stamper.run()
+        if not stamper.stop:
+            report(coordinator_url, "/complete", dict(task_id=task["task_id"], worker=name, games=stamper.games))
+    # The pipeline likes to sys.exit() when it can't read a frame
+    except (Exception, SystemExit):
+        logging.error(traceback.format_exc())
+        report(coordinator_url, "/fail", dict(task_id=task["task_id"], worker=name, error=traceback.format_exc()))
+    finally:
+        stop_heartbeat.set()
+        if capture_pool:
+            capture_pool.close()
+
+
+# Tell the coordinator how a shard went. If it can't be reached, the shard's
+# lease runs out and it gets handed out again anyway.
+def report(coordinator_url, path, data):
+    try:
+        post(coordinator_url, path, data)
+    except OSError as e:
+        logging.error(f"Couldn't reach coordinator at {coordinator_url} ({e})")
+
+
+# Keep asking for shards until the coordinator says it's all done
+def run_worker(coordinator_url, name):
+    # Other workers on this machine share the model weights
+    use_shared_models()
+    failures = 0
+    while True:
+        try:
+            (status, task) = post(coordinator_url, "/claim", dict(worker=name))
+        except OSError as e:
+            failures += 1
+            if failures >= MAX_CONNECT_FAILURES:
+                sys.exit(f"ERROR: couldn't reach coordinator at {coordinator_url} ({e})")
+            time.sleep(IDLE_POLL_INTERVAL)
+            continue
+        failures = 0
+        if status == 410:
+            logging.info("Nothing left to do")
+            return
+        if status != 200:
+            time.sleep(IDLE_POLL_INTERVAL)
+            continue
+        logging.info(f"Working on {task['task_id']} ({task['start']}s-{task['end']}s)")
+        run_task(coordinator_url, name, task)
+
+
+def coordinator_from_args(args, port):
+    config = load_presets()
+    if args.preset not in config:
+        sys.exit(f"ERROR: no preset called {args.preset}")
+    urls = args.urls or []
+    settings_list = [
+        settings_from_preset(config, args.preset, args.date, urls[i] if i < len(urls) else "")
+        for i in range(len(args.videos))
+    ]
+    for filename in args.videos:
+        if not os.path.isfile(filename):
+            sys.exit(f"ERROR: file {filename} doesn't exist!")
+    return Coordinator(args.videos, settings_list, int(args.shard_minutes * 60), args.host, port)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Process videos across several machines")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    for mode in ["coordinator", "local"]:
+        subparser = subparsers.add_parser(mode)
+        subparser.add_argument("videos", nargs="+", help="video files to process")
+        subparser.add_argument("-p", "--preset", default="DEFAULT", help="preset from config/presets.ini")
+        subparser.add_argument("-d", "--date", help="date for the csv (YYYY-MM-DD), instead of the preset's DAY")
+        subparser.add_argument("--urls", nargs="*", help="vod URL for each video, for the csv")
+        subparser.add_argument("--shard-minutes", type=float, default=DEFAULT_SHARD_SECONDS / 60, help="length of each shard")
+        subparser.add_argument("--host", default="0.0.0.0", help="address to listen on")
+        subparser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+        if mode == "local":
+            subparser.add_argument("-w", "--workers", type=int, default=2, help="worker processes to start")
+
+    worker_parser = subparsers.add_parser("worker")
+    worker_parser.add_argument("coordinator", help="coordinator URL, eg. http://192.168.1.10:8765")
+    worker_parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}", help="name to report to the coordinator")
+
+    args = parser.parse_args()
+    if args.mode == "worker":
+        run_worker(args.coordinator, args.name)
+    elif args.mode == "coordinator":
+        coordinator_from_args(args, args.port).run()
+    else:
+        coordinator = coordinator_from_args(args, args.port)
+        url = f"http://127.0.0.1:{coordinator.port}"
+        workers = [
+            subprocess.Popen([sys.executable, "-m", "utils.distributed", "worker", url, "--name", f"local-{i}"])
+            for i in range(args.workers)
+        ]
+        coordinator.run()
+        for worker in workers:
+            worker.wait()
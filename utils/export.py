@@ -0,0 +1,130 @@
+import os
+import sys
+import argparse
+from glob import glob
+import numpy as np
+from utils.ml import char1_list, char23_list
+from utils.shards import merge_shard_games
+from utils.stamper import game_warnings
+
+# Bump this whenever what goes in an export changes
+EXPORT_VERSION = 1
+
+# Every vod gets its own file in the export directory, so adding another vod
+# never means rewriting the others
+EXPORT_SUFFIX = ".detections.npz"
+
+# Everything the stamper worked out for a vod, not just the final strings
+# that go in the TWB CSV. Three tables, each a set of equal length columns:
+#
+#   game_*:  one row per game found, including next games in a set
+#   name_*:  one row per name plate pair OCR'd
+#   char_*:  one row per frame the characters were guessed from
+#
+# Samples point at the game they were taken for with their game column,
+# which load_detections keeps pointing at the right row across vods.
+# Columns with a pair of values are [p1, p2].
+
+
+def export_path(directory: str, vod: str) -> str:
+    return os.path.join(directory, os.path.basename(vod) + EXPORT_SUFFIX)
+
+
+# Which game each sample belongs to: the last one that started at or before it
+def game_of(sample_seconds, game_seconds):
+    return np.searchsorted(game_seconds, sample_seconds, side="right") - 1
+
+
+def game_columns(vod, games):
+    return dict(
+        game_vod         = np.array([vod] * len(games), dtype=str),
+        game_seconds     = np.array([game['seconds'] for game in games], dtype=np.int64),
+        game_next_in_set = np.array([game['next_in_set'] for game in games], dtype=bool),
+        game_name        = np.array([(game['p1name'], game['p2name']) for game in games], dtype=str).reshape(-1, 2),
+        game_team        = np.array([(game['p1team'][:3], game['p2team'][:3]) for game in games], dtype=str).reshape(-1, 2, 3),
+        game_team_confidence = np.array([(game['p1team'][3], game['p2team'][3]) for game in games], dtype=np.float32).reshape(-1, 2),
+        game_warnings    = np.array(["\n".join(game_warnings(game)) for game in games], dtype=str),
+    )
+
+
+# name_samples is a list of (seconds, p1 text, p2 text, p1 guess, p2 guess,
+# p1 score, p2 score), as Stamper.name_samples
+def name_columns(vod, name_samples, game_seconds):
+    seconds = np.array([sample[0] for sample in name_samples], dtype=np.int64)
+    return dict(
+        name_vod     = np.array([vod] * len(name_samples), dtype=str),
+        name_game    = game_of(seconds, game_seconds),
+        name_seconds = seconds,
+        name_ocr     = np.array([sample[1:3] for sample in name_samples], dtype=str).reshape(-1, 2),
+        name_guess   = np.array([sample[3:5] for sample in name_samples], dtype=str).reshape(-1, 2),
+        name_score   = np.array([sample[5:7] for sample in name_samples], dtype=np.uint8).reshape(-1, 2),
+    )
+
+
+# char_samples is a list of (seconds, char1 probs, char23 probs) as
+# Stamper.char_samples, with probabilities shaped like Timeline.record_chars
+def char_columns(vod, char_samples, game_seconds):
+    seconds = np.array([sample[0] for sample in char_samples], dtype=np.int64)
+    return dict(
+        char_vod          = np.array([vod] * len(char_samples), dtype=str),
+        char_game         = game_of(seconds, game_seconds),
+        char_seconds      = seconds,
+        char_char1_probs  = np.array([sample[1] for sample in char_samples], dtype=np.float16).reshape(-1, 2, len(char1_list)),
+        char_char23_probs = np.array([sample[2] for sample in char_samples], dtype=np.float16).reshape(-1, 2, 2, len(char23_list)),
+    )
+
+
+# Write out everything a Stamper found for a vod
+def export_detections(directory: str, vod: str, stamper):
+    games = merge_shard_games([stamper.games], stamper.NETPLAY)
+    game_seconds = np.array([game['seconds'] for game in games], dtype=np.int64)
+    os.makedirs(directory, exist_ok=True)
+    path = export_path(directory, vod)
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        version = np.array(EXPORT_VERSION),
+        **game_columns(vod, games),
+        **name_columns(vod, stamper.name_samples, game_seconds),
+        **char_columns(vod, stamper.char_samples, game_seconds)
+    )
+    os.replace(tmp_path, path)
+    return path
+
+
+# Every export in a directory as one set of tables, in one go
+def load_detections(directory: str):
+    tables = {}
+    games_so_far = 0
+    for path in sorted(glob(os.path.join(directory, "*" + EXPORT_SUFFIX))):
+        with np.load(path) as data:
+            if int(data['version']) != EXPORT_VERSION:
+                continue
+            for key in data.files:
+                if key == "version":
+                    continue
+                column = data[key]
+                # Keep samples pointing at their games in the combined table
+                if key in ("name_game", "char_game"):
+                    column = column + games_so_far
+                tables.setdefault(key, []).append(column)
+            games_so_far += len(data['game_seconds'])
+    return {key: np.concatenate(columns) for (key, columns) in tables.items()}
+
+
+# python -m utils.export <directory>
+# Quick look at what's in an export directory
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise a directory of detection exports")
+    parser.add_argument("directory")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        sys.exit(f"ERROR: {args.directory} isn't a directory")
+    tables = load_detections(args.directory)
+    if not tables:
+        sys.exit(f"No exports in {args.directory}")
+    sets = ~tables['game_next_in_set']
+    print(f"{len(np.unique(tables['game_vod']))} vods, {sets.sum()} sets, {len(sets)} games")
+    print(f"{len(tables['name_seconds'])} name samples, {len(tables['char_seconds'])} character samples")
+    print(f"{(tables['game_warnings'][sets] != '').sum()} sets with warnings")
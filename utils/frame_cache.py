@@ -0,0 +1,51 @@
+import threading
+from collections import OrderedDict
+
+# How much memory decoded frames can take up between them, in megabytes.
+# Enough for the whole name window (NAME_WINDOW_SECONDS frames) up to 1440p,
+# at 4K it takes about 500.
+DEFAULT_FRAME_CACHE_MB = 256
+
+
+# Frames (already cut down to the game area) by second, so a second that's
+# needed again soon after isn't decoded again. When a set starts, the name
+# window reads the seconds after the round start and then the team window
+# reads the first half of them again.
+#
+# Least recently used frames get thrown away to stay under the size limit.
+# Frames are copied on the way in, so the decoder's buffers (and whatever the
+# crop was a view of) aren't kept alive, and whatever comes out is shared:
+# crop from it, don't draw on it.
+class FrameCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.frames    = OrderedDict() # seconds -> frame, least recently used first
+        self.total     = 0
+        self.lock      = threading.Lock()
+
+    def get(self, seconds):
+        with self.lock:
+            frame = self.frames.get(seconds)
+            if frame is not None:
+                self.frames.move_to_end(seconds)
+            return frame
+
+    # Returns the copy that was stored, which is still good to use even if
+    # it didn't fit
+    def put(self, seconds, image):
+        frame = image.copy()
+        with self.lock:
+            old = self.frames.pop(seconds, None)
+            if old is not None:
+                self.total -= old.nbytes
+            self.frames[seconds] = frame
+            self.total += frame.nbytes
+            while self.total > self.max_bytes and self.frames:
+                (_, evicted) = self.frames.popitem(last=False)
+                self.total -= evicted.nbytes
+        return frame
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.total = 0
@@ -0,0 +1,40 @@
+import threading
+import numpy as np
+
+# A fixed set of full size frame buffers that decoding cycles through, so
+# reading a frame doesn't allocate (and later free) a whole new image. At 4K
+# that's 24MB a second of churn otherwise.
+#
+# Anything handed out (including slices of it, which are views) is only good
+# until the ring comes back around to the same buffer, so there need to be
+# more slots than frames anybody can be holding on to at once.
+class FrameRing:
+    def __init__(self, slots: int):
+        self.slots   = slots
+        self.buffers = [None] * slots
+        self.position = 0
+
+    # Buffer to decode the next frame into. None until OpenCV has allocated
+    # one for that slot, after which it gets reused forever.
+    def next(self):
+        return self.buffers[self.position]
+
+    # Hang on to whatever OpenCV decoded into, which is the buffer from
+    # next() unless the frame size changed, and move on to the next slot
+    def keep(self, image):
+        if image is not None:
+            self.buffers[self.position] = image
+        self.position = (self.position + 1) % self.slots
+
+
+# Float input arrays for the models, reused for every prediction instead of
+# building a new one from each crop. One set per thread, since filling one
+# in isn't something two threads can share.
+input_tensors = threading.local()
+
+
+def input_tensor(shape):
+    tensors = input_tensors.__dict__.setdefault("by_shape", {})
+    if shape not in tensors:
+        tensors[shape] = np.empty(shape, dtype=np.float32)
+    return tensors[shape]
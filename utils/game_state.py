@@ -0,0 +1,135 @@
+import numpy as np
+import cv2 as cv
+
+from utils.cv2 import HEALTH_BAR_THRESHOLD
+
+# Seconds between samples while a game is clearly still going. A game gets
+# noticed as over if a sample lands somewhere that isn't mid-game: off the
+# HUD (results, character select, loading) or on the next game's full health
+# bars before the first hit. A rematch with the results screen mashed through
+# can be over in fewer seconds than this, so the skip can land straight in
+# the next game. That's caught from the other side of the gap instead: the
+# HUD has changed more than it does within one game, or a health bar has
+# filled back up, so the seconds skipped over get checked one by one.
+DEFAULT_SKIP_STRIDE = 5
+
+# How far down the game the HUD strip goes: portraits, health bars, timer
+HUD_STRIP_HEIGHT = 0.09
+
+# Size the HUD strip is shrunk to before comparing, (width, height)
+HUD_STRIP_SIZE = (64, 6)
+
+# Correlation with the last in-game sample needed to say the HUD is still up
+HUD_MATCH_THRESHOLD = 0.6
+
+# Still up, but below this it's changed more than it usually does between
+# two samples of the same game, so maybe it isn't the same game any more
+HUD_CHANGED_THRESHOLD = 0.9
+
+
+# The top of the screen shrunk down to a unit vector that doesn't care about
+# overall brightness or contrast, so a dot product gives the correlation.
+# Health bars draining and characters tagging in change a little of it, a
+# menu or loading screen changes all of it.
+def hud_vector(image, GAME_SIZE):
+    strip = image[0:int(GAME_SIZE*HUD_STRIP_HEIGHT), 0:GAME_SIZE]
+    strip = cv.cvtColor(strip, cv.COLOR_BGR2GRAY)
+    vector = cv.resize(strip, HUD_STRIP_SIZE, interpolation=cv.INTER_AREA).astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+# Keeps track of whether a game found by the main scan is still being played,
+# so the scan can sample sparsely until it's over instead of every second.
+#
+# The rule is deliberately one-sided: a sample only counts as mid-game if the
+# HUD looks like it did at the last mid-game sample and the health bars aren't
+# all full (which would be the start of another game). Anything else ends the
+# game, and the scan goes back to the last mid-game sample and carries on a
+# second at a time from there, so being wrong only costs time.
+#
+# A mid-game sample that's changed a lot since the last one could be a
+# different game, if the skip went over a quick rematch's results screen and
+# round start. Then the seconds in between (the gap) get checked one by one
+# for a round start before skimming on, which again only costs time.
+class GameTracker:
+    def __init__(self, GAME_SIZE, stride=DEFAULT_SKIP_STRIDE):
+        self.GAME_SIZE = GAME_SIZE
+        self.stride    = stride
+        self.reference = None
+        # Health bar diffs at the last in-game sample, if known
+        self.diffs     = None
+        # Where a second by second scan should pick up if the game turns out
+        # to be over
+        self.resume_seconds = None
+        # Seconds to check one by one, from gap_start up to (not including)
+        # gap_end, or None if there's no gap to check
+        self.gap_start = None
+        self.gap_end   = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.stride > 1
+
+    @property
+    def in_game(self) -> bool:
+        return self.reference is not None
+
+    @property
+    def checking_gap(self) -> bool:
+        return self.gap_end is not None
+
+    # A game has started, image being its round start frame. Nothing new can
+    # happen before resume_seconds even if the game is already over by then.
+    def start_game(self, resume_seconds, image):
+        self.reference      = hud_vector(image, self.GAME_SIZE)
+        self.diffs          = None
+        self.resume_seconds = resume_seconds
+        self.gap_start      = None
+        self.gap_end        = None
+
+    def end_game(self):
+        self.reference = None
+        self.gap_start = None
+        self.gap_end   = None
+
+    # Whether any health bar sample that was drained is full again. A new
+    # character tagging in does this too, but so does a new game.
+    def health_refilled(self, diffs) -> bool:
+        if diffs is None or self.diffs is None:
+            return False
+        return bool(np.any((self.diffs > HEALTH_BAR_THRESHOLD) & (diffs <= HEALTH_BAR_THRESHOLD)))
+
+    # Check a sparse sample, returns whether the game is still going. If it
+    # is, but the seconds since the last sample need checking first,
+    # checking_gap is set.
+    def update(self, seconds, image, round_start, diffs=None) -> bool:
+        if round_start:
+            self.end_game()
+            return False
+        vector = hud_vector(image, self.GAME_SIZE)
+        correlation = float(vector @ self.reference)
+        if correlation < HUD_MATCH_THRESHOLD:
+            self.end_game()
+            return False
+        if seconds > self.resume_seconds and \
+           (correlation < HUD_CHANGED_THRESHOLD or self.health_refilled(diffs)):
+            self.gap_start = self.resume_seconds
+            self.gap_end   = seconds
+        # Compare against the latest sample from now on, so slow changes over
+        # the course of a game (tags, supers, stage hazards) don't add up
+        self.reference      = vector
+        self.diffs          = diffs
+        self.resume_seconds = seconds + 1
+        return True
+
+    # Done checking the gap without finding another game, returns where to
+    # skim on from
+    def gap_checked(self) -> int:
+        seconds = self.gap_end + self.stride
+        self.gap_start = None
+        self.gap_end   = None
+        return seconds
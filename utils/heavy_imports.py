@@ -0,0 +1,33 @@
+import importlib
+from timeit import default_timer as timer
+from utils.ml import import_tensorflow
+
+# Modules that take ages to import and aren't needed to show the GUI or
+# scrub through a video. They're imported on first use, or ahead of time in
+# the background once the window is up.
+HEAVY_MODULES = [
+    "keras.models",
+    "pytesseract",
+    "thefuzz.process",
+    "pyperclip",
+]
+
+
+# Import all the heavy modules, calling progress(name, seconds) after each.
+# Returns the total time taken.
+def import_heavy_modules(progress=None):
+    total = 0.0
+    start = timer()
+    import_tensorflow()
+    elapsed = timer() - start
+    total += elapsed
+    if progress:
+        progress("tensorflow", elapsed)
+    for name in HEAVY_MODULES:
+        start = timer()
+        importlib.import_module(name)
+        elapsed = timer() - start
+        total += elapsed
+        if progress:
+            progress(name, elapsed)
+    return total
@@ -0,0 +1,266 @@
+import os
+import json
+import logging
+from contextlib import contextmanager
+import numpy as np
+import cv2 as cv
+from utils.cv2 import read_frame_from_video
+from utils.hud_layout import hud_layout
+
+# Bump this whenever what goes in a HUD cache changes
+HUD_CACHE_VERSION = 2
+
+# How far down the game the cache goes, the same as crop=True when reading a
+# frame. Everything the scan looks at (health bars, portraits, name plates,
+# the HUD strip) is above this.
+HUD_CACHE_HEIGHT = 0.15
+
+# Strips can be shrunk to save disk space, at the cost of OCR and portrait
+# accuracy. 1 keeps them full size. At 1080p (GAME_SIZE 1920) the character
+# models see the portraits no bigger than they are at 2/3, so that costs
+# them nothing.
+DEFAULT_HUD_CACHE_SCALE = 0.67
+
+# Only the regions the scan reads (health bar samples, portraits and name
+# plates, see HUDLayout) are kept in full. The rest of the strip is only
+# used for the HUD strip comparison in utils/game_state.py, which shrinks it
+# to a handful of pixels anyway, so it's kept this wide.
+BACKGROUND_WIDTH = 128
+
+# How often to save how far decoding got, so a stopped run can carry on from
+# there (seconds of video)
+SAVE_PROGRESS_INTERVAL = 60
+
+
+# HUD caches live right next to the video they came from, like timelines
+def hud_cache_paths(filename: str):
+    return (f"{filename}.hud.npy", f"{filename}.hud.json")
+
+
+# GAME_SIZE of the frames in a cache
+def cached_game_size(GAME_SIZE, scale) -> int:
+    return int(GAME_SIZE*scale)
+
+
+# Shape of one second in a cache: the crop=True region of a frame at the
+# cached GAME_SIZE
+def strip_shape(GAME_SIZE, scale):
+    size = cached_game_size(GAME_SIZE, scale)
+    return (int(size*HUD_CACHE_HEIGHT), size - 1, 3)
+
+
+# Where everything goes in one second's record in a cache: a shrunk copy of
+# the whole strip, then each region the scan reads, flattened one after
+# another. The big portraits only ever get looked at in greyscale (by the
+# char1 model and the portrait index), so that's all that's kept of them.
+class StripPacking:
+    def __init__(self, size):
+        self.shape = strip_shape(size, 1)
+        (height, width, channels) = self.shape
+        self.background_shape = (max(1, round(height*BACKGROUND_WIDTH/width)), BACKGROUND_WIDTH, channels)
+        layout = hud_layout(size)
+        rectangles = [(*rectangle[:4], channels) for rectangle in layout.health_bar_slices]
+        rectangles.extend((*rectangle, 1) for rectangle in layout.portraits[1])
+        for pair in [layout.portraits[2], layout.portraits[3], layout.names]:
+            rectangles.extend((*rectangle, channels) for rectangle in pair)
+        # (y1, y2, x1, x2, channels, offset into the record)
+        self.regions = []
+        offset = int(np.prod(self.background_shape))
+        for (y1, y2, x1, x2, region_channels) in rectangles:
+            (y2, x2) = (min(y2, height), min(x2, width))
+            self.regions.append((y1, y2, x1, x2, region_channels, offset))
+            offset += (y2 - y1) * (x2 - x1) * region_channels
+        self.record_size = offset
+
+    def pack(self, strip, record):
+        (height, width, _) = self.background_shape
+        background = cv.resize(strip, (width, height), interpolation=cv.INTER_AREA)
+        record[:background.size] = background.reshape(-1)
+        for (y1, y2, x1, x2, channels, offset) in self.regions:
+            region = strip[y1:y2, x1:x2]
+            if channels == 1:
+                region = cv.cvtColor(region, cv.COLOR_BGR2GRAY)
+            record[offset:offset + region.size] = region.reshape(-1)
+
+    # Rebuild a strip into out: the background blown back up, with the
+    # regions pasted over it as they were
+    def unpack(self, record, out):
+        (height, width, _) = self.shape
+        background = record[:int(np.prod(self.background_shape))].reshape(self.background_shape)
+        out[:] = cv.resize(background, (width, height), interpolation=cv.INTER_LINEAR)
+        for (y1, y2, x1, x2, channels, offset) in self.regions:
+            region = record[offset:offset + (y2 - y1) * (x2 - x1) * channels].reshape(y2 - y1, x2 - x1, channels)
+            if channels == 1:
+                region = cv.cvtColor(region, cv.COLOR_GRAY2BGR)
+            out[y1:y2, x1:x2] = region
+        return out
+
+
+# The top of every second of a video, decoded once in a single pass and
+# memory mapped from disk. Reruns (and the name and team windows) read from
+# this instead of decoding the video again. Only what the scan reads is
+# kept (see StripPacking), about 80KB a second at 1080p with the default
+# scale, so under 1GB for three hours.
+class HUDStrips:
+    def __init__(self, filename: str, total_seconds: int, GAME_X, GAME_Y, GAME_SIZE, scale=DEFAULT_HUD_CACHE_SCALE):
+        self.path, self.meta_path = hud_cache_paths(filename)
+        self.GAME_X    = GAME_X
+        self.GAME_Y    = GAME_Y
+        self.GAME_SIZE = GAME_SIZE
+        self.size      = cached_game_size(GAME_SIZE, scale)
+        self.packing   = StripPacking(self.size)
+        self.meta = {
+            "version":   HUD_CACHE_VERSION,
+            "GAME_X":    GAME_X,
+            "GAME_Y":    GAME_Y,
+            "GAME_SIZE": GAME_SIZE,
+            "scale":     scale,
+        }
+        shape = (total_seconds, self.packing.record_size)
+
+        # How many seconds have been decoded so far, and whether that's all
+        # there's ever going to be
+        self.done     = 0
+        self.complete = False
+        self.data     = None
+        if os.path.isfile(self.path) and os.path.isfile(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                old_meta = json.load(f)
+            progress = {key: old_meta.pop(key, None) for key in ("done", "complete")}
+            if old_meta == self.meta:
+                data = np.load(self.path, mmap_mode="r+")
+                if data.dtype == np.uint8 and data.shape == shape:
+                    self.data     = data
+                    self.done     = progress["done"] or 0
+                    self.complete = bool(progress["complete"])
+        if self.data is None:
+            logging.info(f"Starting a new HUD cache at {self.path}")
+            self.data = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.uint8, shape=shape)
+            self.save_progress()
+        if self.complete:
+            self.open_read_only()
+
+    def save_progress(self):
+        with open(self.meta_path, "w") as f:
+            json.dump(dict(self.meta, done=self.done, complete=self.complete), f)
+
+    # Nothing that reads a finished cache should be able to write to it
+    def open_read_only(self):
+        self.data.flush()
+        self.data = np.load(self.path, mmap_mode="r")
+
+    # Decode whatever's left, one frame a second from start to finish. Seeking
+    # forward a second at a time just decodes forward, so this is one pass
+    # over the video. Returns whether it got to the end.
+    def build(self, capture_pool, should_stop=lambda: False, progress=lambda seconds: None):
+        (height, width, _) = self.packing.shape
+        with capture_pool.handle() as capture:
+            for seconds in range(self.done, len(self.data)):
+                if should_stop():
+                    break
+                image = read_frame_from_video(capture, seconds, self.GAME_X, self.GAME_Y, self.GAME_SIZE, crop=True)
+                if image is None:
+                    # Whatever's at the very end can't be read, so that's
+                    # where the video ends as far as the cache is concerned
+                    logging.warning(f"HUD cache stopped at t = {seconds}, couldn't read any further")
+                    self.complete = True
+                    break
+                if self.size != self.GAME_SIZE:
+                    image = cv.resize(image, (width, height), interpolation=cv.INTER_AREA)
+                self.packing.pack(image, self.data[seconds])
+                self.done = seconds + 1
+                if self.done % SAVE_PROGRESS_INTERVAL == 0:
+                    self.data.flush()
+                    self.save_progress()
+                    progress(seconds)
+            else:
+                self.complete = True
+        self.data.flush()
+        self.save_progress()
+        if self.complete:
+            self.open_read_only()
+        return self.complete
+
+
+# Stands in for an IndexedCapture on a HUD cache. Frames come out already cut
+# down to the game area (so GAME_X = GAME_Y = 0).
+class HUDStripCapture:
+    def __init__(self, strips: HUDStrips):
+        self.strips = strips
+        self.target = 0
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        if prop == cv.CAP_PROP_POS_MSEC:
+            return self.target * 1000
+        if prop == cv.CAP_PROP_FRAME_WIDTH:
+            return self.strips.packing.shape[1]
+        if prop == cv.CAP_PROP_FRAME_HEIGHT:
+            return self.strips.packing.shape[0]
+        if prop == cv.CAP_PROP_FPS:
+            return 1
+        return 0
+
+    def set(self, prop, value):
+        if prop == cv.CAP_PROP_POS_MSEC:
+            self.target = int(round(value / 1000))
+        return True
+
+    # Rebuilt into whatever buffer gets passed in, if it's the right size
+    def read(self, image=None):
+        if not 0 <= self.target < self.strips.done:
+            return False, image
+        if image is None or image.shape != self.strips.packing.shape:
+            image = np.empty(self.strips.packing.shape, dtype=np.uint8)
+        self.strips.packing.unpack(self.strips.data[self.target], image)
+        self.target += 1
+        return True, image
+
+    def release(self):
+        pass
+
+    def total_seconds(self) -> int:
+        return self.strips.done
+
+
+# Everything the stamper wants from a CapturePool, for a HUD cache. Handles
+# are free, they all read from the same memory map.
+class HUDStripPool:
+    def __init__(self, filename: str, strips: HUDStrips):
+        self.filename = filename
+        self.strips   = strips
+        self.width    = strips.packing.shape[1]
+        self.height   = strips.packing.shape[0]
+        self.growing_at_open = False
+        self.growing  = False
+
+    @property
+    def total_seconds(self) -> int:
+        return self.strips.done
+
+    def acquire(self, timeout=None):
+        return HUDStripCapture(self.strips)
+
+    def release(self, capture):
+        pass
+
+    @contextmanager
+    def handle(self, timeout=None):
+        yield self.acquire(timeout)
+
+    def is_stale(self, capture) -> bool:
+        return False
+
+    def refresh(self) -> int:
+        return self.total_seconds
+
+    def wait_for(self, seconds, should_stop=lambda: False) -> bool:
+        return seconds < self.total_seconds
+
+    def discard_before(self, seconds):
+        pass
+
+    def close(self):
+        pass
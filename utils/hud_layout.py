@@ -0,0 +1,149 @@
+import threading
+import numpy as np
+
+# Where everything on the HUD is, as fractions of GAME_SIZE. P2's side is the
+# mirror image of P1's, so only P1's side is given.
+#   health_bar_y:     top of the health bar row that gets sampled
+#   health_bars:      (x1, x2) of each sample taken from P1's health bar
+#   char1/2/3:        (y1, y2, x1, x2) of P1's point, second and third portraits
+#   name:             (y1, y2, x1, x2) of P1's name plate
+HUD_VARIANTS = {
+    "default": dict(
+        # Two samples from each health bar since stuff like Band's saxophone
+        # and Bella's hoop intro like to cut through the middle
+        health_bar_y = 0.0734,
+        health_bars  = [(0.146, 0.225), (0.330, 0.409)],
+        char1        = (0.015625, 0.078125, 0.023438, 0.117188),
+        # Older params that were a bit more imprecise I think
+        # char2      = (0.054688, 0.064063, 0.134375, 0.171875),
+        char2        = (0.054213, 0.063588, 0.134375, 0.171875),
+        char3        = (0.043750, 0.053125, 0.128906, 0.166406),
+        name         = (0.1, 0.1234, 0.164, 0.352),
+    ),
+}
+DEFAULT_HUD = "default"
+
+# Correct/"expected" health bar green colours, in the same order as a
+# variant's health_bars
+HEALTH_BAR_GREENS = [
+    np.array([128.9, 221.8, 218.9]), # outer
+    np.array([ 69.7, 126.3,  56.6]), # inner
+]
+
+# Names of the health bar samples, in the order health_bar_diffs returns them
+HEALTH_BAR_NAMES = ["p1_outer", "p2_outer", "p1_inner", "p2_inner"]
+
+
+# Mirror a P1 rectangle over to P2's side. Returns both, as (y1, y2, x1, x2).
+def mirrored(fractions, GAME_SIZE):
+    (y1, y2, x1, x2) = [int(GAME_SIZE*fraction) for fraction in fractions]
+    return ((y1, y2, x1, x2), (y1, y2, GAME_SIZE - x2, GAME_SIZE - x1))
+
+
+# A stack of frames, whether given one frame or several
+def as_batch(frames):
+    if isinstance(frames, np.ndarray) and frames.ndim == 3:
+        return frames[np.newaxis]
+    return frames
+
+
+# Every HUD region the scan looks at, worked out once for a GAME_SIZE (and
+# HUD variant) instead of on every frame. Crops come out of extract() copied
+# into contiguous arrays, a whole batch of frames at a time, so nothing
+# downstream is left holding on to (or drawing over) the frames themselves.
+class HUDLayout:
+    def __init__(self, GAME_SIZE, variant=DEFAULT_HUD):
+        fractions = HUD_VARIANTS[variant]
+        self.GAME_SIZE = GAME_SIZE
+        self.variant   = variant
+
+        # Health bar samples, as (y1, y2, x1, x2, expected colour) in the
+        # order of HEALTH_BAR_NAMES
+        y1 = int(GAME_SIZE*fractions['health_bar_y'])
+        self.health_bar_slices = []
+        for ((x1_fraction, x2_fraction), colour) in zip(fractions['health_bars'], HEALTH_BAR_GREENS):
+            for (_, _, x1, x2) in mirrored((0, 0, x1_fraction, x2_fraction), GAME_SIZE):
+                self.health_bar_slices.append((y1, y1 + 1, x1, x2, colour))
+        self.health_bar_rows = slice(y1, y1 + 1)
+        self.expected_greens = np.array([colour for (*_, colour) in self.health_bar_slices])
+        # Every sample is on the same row, so they can all be averaged in
+        # one go with reduceat: give it each sample's edges left to right,
+        # and every other sum is a sample (the rest are the gaps between)
+        order = sorted(range(len(self.health_bar_slices)), key=lambda i: self.health_bar_slices[i][2])
+        self.health_bar_edges = []
+        for i in order:
+            (_, _, x1, x2, _) = self.health_bar_slices[i]
+            self.health_bar_edges.extend([x1, x2])
+        self.health_bar_order = np.argsort(order)
+        self.health_bar_widths = np.array([x2 - x1 for (_, _, x1, x2, _) in self.health_bar_slices])
+
+        # (P1, P2) rectangles for each portrait and the name plates
+        self.portraits = {
+            char_num: mirrored(fractions[f"char{char_num}"], GAME_SIZE)
+            for char_num in (1, 2, 3)
+        }
+        self.names = mirrored(fractions['name'], GAME_SIZE)
+
+    # How far the average colour of each health bar sample is from the green
+    # of a full health bar, for a batch of frames (one row of diffs each)
+    def batch_health_bar_diffs(self, frames):
+        frames = as_batch(frames)
+        rows = np.stack([frame[self.health_bar_rows] for frame in frames])
+        row_sums = rows.sum(axis=1, dtype=np.float64)
+        sums = np.add.reduceat(row_sums, self.health_bar_edges, axis=1)[:, 0::2]
+        means = sums[:, self.health_bar_order] / (self.health_bar_widths[:, np.newaxis] * rows.shape[1])
+        return np.linalg.norm(means - self.expected_greens, axis=2)
+
+    def health_bar_diffs(self, image):
+        return self.batch_health_bar_diffs(image)[0]
+
+    # Copy a pair of (P1, P2) rectangles out of a batch of frames, into an
+    # array of shape (frames, 2, height, width, channels)
+    def crop_pairs(self, frames, rectangles):
+        frames = as_batch(frames)
+        ((y1, y2, p1x1, p1x2), (_, _, p2x1, p2x2)) = rectangles
+        out = np.empty((len(frames), 2, y2 - y1, p1x2 - p1x1, frames[0].shape[2]), dtype=frames[0].dtype)
+        for (i, frame) in enumerate(frames):
+            out[i, 0] = frame[y1:y2, p1x1:p1x2]
+            out[i, 1] = frame[y1:y2, p2x1:p2x2]
+        return out
+
+    # (P1, P2) character portraits from a frame
+    def char_imgs(self, image, char_num):
+        (p1_img, p2_img) = self.crop_pairs(image, self.portraits[char_num])[0]
+        return p1_img, p2_img
+
+    # (P1, P2) name plates from a frame
+    def name_imgs(self, image):
+        (p1_img, p2_img) = self.crop_pairs(image, self.names)[0]
+        return p1_img, p2_img
+
+    # Everything at once for a batch of frames
+    def extract(self, frames):
+        frames = as_batch(frames)
+        return HUDCrops(
+            self.batch_health_bar_diffs(frames),
+            [self.crop_pairs(frames, self.portraits[char_num]) for char_num in (1, 2, 3)],
+            self.crop_pairs(frames, self.names)
+        )
+
+
+# What HUDLayout.extract pulls out of a batch of frames. Each is indexed by
+# frame first, then P1/P2 for the crops.
+class HUDCrops:
+    def __init__(self, health_bar_diffs, portraits, names):
+        self.health_bar_diffs = health_bar_diffs
+        self.char1, self.char2, self.char3 = portraits
+        self.names = names
+
+
+# One layout per GAME_SIZE and variant, shared by everybody
+layouts = {}
+layouts_lock = threading.Lock()
+
+
+def hud_layout(GAME_SIZE, variant=DEFAULT_HUD) -> HUDLayout:
+    with layouts_lock:
+        if (GAME_SIZE, variant) not in layouts:
+            layouts[(GAME_SIZE, variant)] = HUDLayout(GAME_SIZE, variant)
+        return layouts[(GAME_SIZE, variant)]
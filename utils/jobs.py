@@ -0,0 +1,172 @@
+import os
+import re
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from queue import Empty
+from timeit import default_timer as timer
+
+from utils.capture_pool import CapturePool
+from utils.stamper import Stamper
+from utils.ml import get_model, choose_model_path, use_shared_models
+from utils.heavy_imports import import_heavy_modules
+
+# TensorFlow already spreads a single job over a few threads, so one job per
+# core would just have them all fighting each other
+DEFAULT_MAX_JOBS = max(1, (os.cpu_count() or 1) // 4)
+
+# Don't flood the GUI with progress updates
+PROGRESS_INTERVAL = 0.5
+
+
+# Where a job writes its list of timestamps (since nobody is around to copy
+# it off the clipboard)
+def timestamps_filename(infile_name: str) -> str:
+    return re.sub(r'\.(mp4|m4v|mov|avi|mkv|webm|wmv)$', '', infile_name) + "_timestamps.txt"
+
+
+# Load the models (and everything else that's slow to import) as soon as a
+# pool process starts, so they're shared by every job that process runs
+# afterwards. The weights themselves are shared with every other process in
+# the pool, where possible.
+def preload_models():
+    use_shared_models()
+    import_heavy_modules()
+    get_model(choose_model_path('models/char1_model.h5'))
+    get_model(choose_model_path('models/char23_model.h5'))
+
+
+# Runs a single job inside a pool process. Everything the GUI needs to know
+# goes back through the events queue as (job_id, kind, value) tuples.
+def run_job(job_id, settings, events, cancel):
+    start_time = timer()
+    last_update = 0
+
+    def print_line(line):
+        events.put((job_id, "line", line))
+
+    # Called for every second of video scanned, doubles as the place where
+    # we check whether the job has been cancelled
+    def update_progress(seconds):
+        nonlocal last_update
+        now = timer()
+        if now - last_update < PROGRESS_INTERVAL:
+            return
+        last_update = now
+        events.put((job_id, "progress", (seconds, now - start_time)))
+        if cancel.is_set():
+            stamper.signal_to_stop()
+
+    capture_pool = None
+    try:
+        # One handle for the scan pipeline, one for the name and team windows
+        capture_pool = CapturePool(settings['infile_name'], max_handles=2)
+        stamper = Stamper(
+            **settings,
+            capture_pool  = capture_pool,
+            start_seconds = 0,
+            total_seconds = capture_pool.total_seconds,
+            print_line    = print_line,
+            update_slider = update_progress
+        )
+        events.put((job_id, "started", capture_pool.total_seconds))
+        timestamp_data = stamper.run()
+
+        outfile_name = timestamps_filename(settings['infile_name'])
+        with open(outfile_name, "w") as f:
+            f.write(timestamp_data)
+        print_line(f"Timestamps written to {outfile_name}.")
+        events.put((job_id, "result", dict(timestamps=timestamp_data, games=stamper.games)))
+        events.put((job_id, "finished", "Cancelled" if stamper.stop else "Done"))
+    # The pipeline likes to sys.exit() when it can't read a frame
+    except (Exception, SystemExit):
+        print_line(traceback.format_exc())
+        events.put((job_id, "finished", "Failed"))
+    finally:
+        # Decoder handles, and the proxy for a remote video
+        if capture_pool:
+            capture_pool.close()
+
+
+# Runs several videos at once in a bounded pool of processes
+class JobQueue:
+    def __init__(self, max_jobs: int = DEFAULT_MAX_JOBS):
+        self.max_jobs = max_jobs
+        # Forking a process that has Qt and TensorFlow loaded is asking for
+        # trouble, so always start pool processes from scratch
+        self.context  = multiprocessing.get_context("spawn")
+        self.manager  = self.context.Manager()
+        self.events   = self.manager.Queue()
+        self.executor = None
+        self.pool_size = None # max_jobs the running pool was started with
+        self.jobs     = {} # job_id -> (future, cancel event)
+        self.job_ids  = count(1)
+
+    # Number of jobs that are queued or running
+    def active_jobs(self) -> int:
+        return sum(1 for (future, cancel) in self.jobs.values() if not future.done())
+
+    # Only takes effect once the queue is idle, since the pool can't be
+    # resized while jobs are running in it. Until then jobs keep going to
+    # the old pool.
+    def set_max_jobs(self, max_jobs: int):
+        self.max_jobs = max_jobs
+        self.resize_if_idle()
+
+    # Swap the pool for one of the size asked for, if that's still pending
+    # and nothing's running in it. The new one starts loading straight away.
+    def resize_if_idle(self):
+        if self.executor and self.pool_size != self.max_jobs and self.active_jobs() == 0:
+            self.executor.shutdown()
+            self.executor = None
+            self.start()
+
+    # Start the pool processes loading the models now, rather than when the
+    # first job turns up
+    def start(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_jobs,
+                mp_context=self.context,
+                initializer=preload_models
+            )
+            self.pool_size = self.max_jobs
+            for _ in range(self.max_jobs):
+                self.executor.submit(int)
+
+    def submit(self, settings) -> int:
+        self.resize_if_idle()
+        self.start()
+        job_id = next(self.job_ids)
+        cancel = self.manager.Event()
+        future = self.executor.submit(run_job, job_id, settings, self.events, cancel)
+        self.jobs[job_id] = (future, cancel)
+        return job_id
+
+    # Returns True if the job never got started, otherwise it's asked to stop
+    # at the next opportunity (and will still report "finished")
+    def cancel(self, job_id: int) -> bool:
+        future, cancel = self.jobs[job_id]
+        if future.cancel():
+            return True
+        cancel.set()
+        return False
+
+    # All events that have arrived since the last call. Called regularly,
+    # so also where a pending resize happens once the last job finishes.
+    def poll_events(self):
+        self.resize_if_idle()
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except Empty:
+                return events
+
+    def shutdown(self):
+        for job_id in self.jobs:
+            self.cancel(job_id)
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.manager.shutdown()
@@ -0,0 +1,295 @@
+import os
+import sys
+import logging
+import argparse
+import threading
+import subprocess
+from contextlib import contextmanager
+import numpy as np
+import cv2 as cv
+
+from utils.capture_pool import CapturePool
+from utils.presets import load_presets, settings_from_preset
+from utils.stamper import Stamper
+
+# Processing a broadcast while it's still going. Frames come in one a second,
+# either through FFmpeg (from anything it can read: an RTMP/SRT feed from
+# OBS, a capture device, or a file played back in real time as a stand-in) or
+# as raw BGR frames on stdin. A recording that's still being written works
+# too, through the usual CapturePool.
+#
+#   python -m utils.live -p PRESET rtmp://localhost/live/stream
+#   python -m utils.live -p PRESET --realtime old_vod.mp4
+#   some_command | python -m utils.live -p PRESET --size 1920x1080 -
+#   python -m utils.live -p PRESET recording_in_progress.mkv
+
+# Frames kept around for reading again (the name and team windows go back to
+# the round start). Has to cover those windows plus however far the scan
+# pipeline reads ahead, beyond that FFmpeg gets made to wait.
+LIVE_BUFFER_SECONDS = 64
+
+# Report sets no later than this many seconds after they start
+DEFAULT_LATENCY_TARGET = 45
+
+# How often to check whether anybody's asked us to stop (seconds)
+WAIT_POLL_INTERVAL = 0.5
+
+
+# Width and height of a video (or stream) according to ffprobe
+def probe_frame_size(source: str):
+    command = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height",
+        "-of", "csv=p=0",
+        source
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True, timeout=30)
+        (width, height) = result.stdout.strip().splitlines()[0].split(",")[:2]
+        return (int(width), int(height))
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError) as e:
+        sys.exit(f"ERROR: couldn't get the size of {source} ({e}), is ffprobe on your PATH?")
+
+
+# FFmpeg outputting one raw frame of just the game area every second. The
+# game area is cut out by FFmpeg, so the frames have GAME_X = GAME_Y = 0.
+def ffmpeg_command(source, GAME_X, GAME_Y, GAME_SIZE, realtime=False):
+    width = GAME_SIZE
+    height = int(GAME_SIZE*0.5625)
+    return [
+        "ffmpeg", "-v", "error",
+        *(["-re"] if realtime else []),
+        "-i", source,
+        "-an",
+        "-vf", f"fps=1,crop={width}:{height}:{GAME_X}:{GAME_Y}",
+        "-pix_fmt", "bgr24",
+        "-f", "rawvideo",
+        "-"
+    ]
+
+
+# Fill a buffer from a stream, returns False if the stream ends first
+def read_exactly(stream, view) -> bool:
+    got = 0
+    while got < len(view):
+        count = stream.readinto(view[got:])
+        if not count:
+            return False
+        got += count
+    return True
+
+
+# The last few seconds of a live video, filled in from a stream of raw BGR
+# frames (one per second) by a background thread. Frame n is second n.
+class LiveFrames:
+    def __init__(self, stream, width, height, max_frames=LIVE_BUFFER_SECONDS, process=None):
+        self.stream     = stream
+        self.width      = width
+        self.height     = height
+        self.max_frames = max_frames
+        self.process    = process
+        self.frames     = {} # second -> frame
+        self.received   = 0
+        self.ended      = False
+        self.condition  = threading.Condition()
+        self.thread     = threading.Thread(target=self.read_loop, daemon=True)
+        self.thread.start()
+
+    def read_loop(self):
+        try:
+            while True:
+                frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+                if not read_exactly(self.stream, memoryview(frame.reshape(-1))):
+                    break
+                with self.condition:
+                    # Don't run away from the pipeline, let the stream wait
+                    while len(self.frames) >= self.max_frames and not self.ended:
+                        self.condition.wait()
+                    if self.ended:
+                        break
+                    self.frames[self.received] = frame
+                    self.received += 1
+                    self.condition.notify_all()
+        except (OSError, ValueError) as e:
+            logging.error(f"Live input stopped: {e}")
+        finally:
+            with self.condition:
+                self.ended = True
+                self.condition.notify_all()
+            logging.info(f"Live input ended after {self.received} seconds")
+
+    # Wait for a second to arrive, returns whether it did
+    def wait_for(self, seconds, should_stop=lambda: False) -> bool:
+        with self.condition:
+            while seconds >= self.received and not self.ended and not should_stop():
+                self.condition.wait(WAIT_POLL_INTERVAL)
+            return seconds < self.received
+
+    # The frame for a second, or None if the stream ended before it (or it's
+    # already been thrown away)
+    def frame(self, seconds):
+        self.wait_for(seconds)
+        with self.condition:
+            return self.frames.get(seconds)
+
+    def discard_before(self, seconds):
+        with self.condition:
+            for old in [old for old in self.frames if old < seconds]:
+                del self.frames[old]
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.ended = True
+            self.condition.notify_all()
+        if self.process:
+            self.process.kill()
+
+
+# Stands in for an IndexedCapture on live frames. Seeking only means picking
+# which second to hand out next.
+class LiveCapture:
+    def __init__(self, frames: LiveFrames):
+        self.frames = frames
+        self.target = 0
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        if prop == cv.CAP_PROP_POS_MSEC:
+            return self.target * 1000
+        if prop == cv.CAP_PROP_FRAME_WIDTH:
+            return self.frames.width
+        if prop == cv.CAP_PROP_FRAME_HEIGHT:
+            return self.frames.height
+        if prop == cv.CAP_PROP_FPS:
+            return 1
+        return 0
+
+    def set(self, prop, value):
+        if prop == cv.CAP_PROP_POS_MSEC:
+            self.target = int(round(value / 1000))
+        return True
+
+    # Always a copy, since whoever reads a frame is free to draw on it
+    def read(self, image=None):
+        frame = self.frames.frame(self.target)
+        if frame is None:
+            return False, image
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+        else:
+            image = frame.copy()
+        self.target += 1
+        return True, image
+
+    def release(self):
+        pass
+
+    def total_seconds(self) -> int:
+        return self.frames.received
+
+
+# Everything the stamper wants from a CapturePool, for live frames. Every
+# handle reads from the same buffer.
+class LiveCapturePool:
+    def __init__(self, name: str, frames: LiveFrames):
+        self.filename = name
+        self.frames   = frames
+        self.width    = frames.width
+        self.height   = frames.height
+        self.growing_at_open = True
+
+    @property
+    def total_seconds(self) -> int:
+        return self.frames.received
+
+    @property
+    def growing(self) -> bool:
+        return not self.frames.ended
+
+    def acquire(self, timeout=None):
+        return LiveCapture(self.frames)
+
+    def release(self, capture):
+        pass
+
+    @contextmanager
+    def handle(self, timeout=None):
+        yield self.acquire(timeout)
+
+    def is_stale(self, capture) -> bool:
+        return False
+
+    def refresh(self) -> int:
+        return self.total_seconds
+
+    def wait_for(self, seconds, should_stop=lambda: False) -> bool:
+        return self.frames.wait_for(seconds, should_stop)
+
+    def discard_before(self, seconds):
+        self.frames.discard_before(seconds)
+
+    def close(self):
+        self.frames.close()
+
+
+def live_capture_pool(args, settings):
+    if args.source == "-":
+        if not args.size:
+            sys.exit("ERROR: --size is needed for raw frames on stdin")
+        (width, height) = [int(n) for n in args.size.lower().split("x")]
+        return LiveCapturePool("stdin", LiveFrames(sys.stdin.buffer, width, height))
+
+    # A recording that's still being written doesn't need anything special
+    if os.path.isfile(args.source) and not args.realtime:
+        return CapturePool(args.source, max_handles=2, growing=True)
+
+    command = ffmpeg_command(args.source, settings['GAME_X'], settings['GAME_Y'], settings['GAME_SIZE'], args.realtime)
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    except OSError as e:
+        sys.exit(f"ERROR: couldn't start ffmpeg ({e}), is it on your PATH?")
+    settings['GAME_X'] = 0
+    settings['GAME_Y'] = 0
+    frames = LiveFrames(process.stdout, settings['GAME_SIZE'], int(settings['GAME_SIZE']*0.5625), process=process)
+    return LiveCapturePool(args.source, frames)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Find sets in a broadcast while it's still going")
+    parser.add_argument("source", help="anything FFmpeg can read, a recording in progress, or - for raw BGR frames on stdin")
+    parser.add_argument("-p", "--preset", default="DEFAULT", help="preset from config/presets.ini")
+    parser.add_argument("-d", "--date", help="date for the csv (YYYY-MM-DD), instead of the preset's DAY")
+    parser.add_argument("--url", default="", help="vod URL, for the csv")
+    parser.add_argument("-o", "--outfile", default="live.csv", help="csv to write (default live.csv)")
+    parser.add_argument("--latency", type=int, default=DEFAULT_LATENCY_TARGET, help="report each set within this many seconds")
+    parser.add_argument("--realtime", action="store_true", help="play a file back at real speed, as a stand-in for a live feed")
+    parser.add_argument("--size", help="WIDTHxHEIGHT of raw frames on stdin")
+    args = parser.parse_args()
+
+    config = load_presets()
+    if args.preset not in config:
+        sys.exit(f"ERROR: no preset called {args.preset}")
+    settings = settings_from_preset(config, args.preset, args.date, args.url)
+    capture_pool = live_capture_pool(args, settings)
+
+    stamper = Stamper(
+        **settings,
+        capture_pool    = capture_pool,
+        start_seconds   = 0,
+        total_seconds   = capture_pool.total_seconds,
+        outfile_name    = args.outfile,
+        timestamps_name = os.path.splitext(args.outfile)[0] + "_timestamps.txt",
+        LATENCY_TARGET  = args.latency,
+        print_line      = print
+    )
+    try:
+        stamper.run()
+    except KeyboardInterrupt:
+        stamper.signal_to_stop()
+    finally:
+        capture_pool.close()
@@ -1,55 +1,182 @@
 import numpy as np
 from numpy import argmax
 import os
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-import tensorflow as tf
 import logging
-from keras.models import load_model
+import threading
 from glob import glob
 import cv2 as cv
 from pathlib import Path
+from utils.frame_ring import input_tensor
 
 char1_list  = ["AN","BB","BD","BW","CE","DB","EL","FI","FU","MA","MF",    "PC","PS","PW","RF","SQ","UM","VA"]
 char23_list = ["AN","BB","BD","BW","CE","DB","EL","FI","FU","MA","MF","N","PC","PS","PW","RF","SQ","UM","VA"]
 
+# Models that have already been loaded in this process, by path
+loaded_models = {}
 
-# Identify a point character by its big portrait
-def identify_char1(image, model, debug_name="guess"):
+# Whether this process should use the memory mapped models where they exist,
+# see use_shared_models
+shared_models = False
+
+
+# TensorFlow takes seconds to import, so only do it once a model is needed
+# (or in the background, see utils.heavy_imports)
+def import_tensorflow():
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3' # Suppress annoying tensorflow logging
+    import tensorflow as tf
+    return tf
+
+
+# Load a model, or reuse it if this process has loaded it before. Loading is
+# slow, so jobs running one after another in the same process share models.
+def get_model(path):
+    if path not in loaded_models:
+        if path.endswith(".tflite"):
+            loaded_models[path] = TFLiteModel(path)
+        else:
+            import_tensorflow()
+            from keras.models import load_model
+            loaded_models[path] = load_model(path)
+    return loaded_models[path]
+
+
+# Where the int8 quantized version of a Keras model lives
+def quantized_model_path(path):
+    return os.path.splitext(path)[0] + "_int8.tflite"
+
+
+# Where the float TensorFlow Lite version of a Keras model lives. Same
+# weights, but in a file TFLite can memory map, see use_shared_models.
+def shared_model_path(path):
+    return os.path.splitext(path)[0] + "_float.tflite"
+
+
+# For processes in a pool. Keras copies a model's weights into every process
+# that loads it, which adds up to gigabytes with enough workers. TFLite reads
+# constant weights straight out of the memory mapped model file instead, so
+# every process shares the one copy the OS has cached. That only holds
+# without TFLite's default delegate, which repacks weights into memory of its
+# own.
+def use_shared_models():
+    global shared_models
+    shared_models = True
+
+
+# Use the quantized version of a model if asked for and it's been made, or
+# the memory mapped version in a pool process
+def choose_model_path(path, quantized=False):
+    if quantized:
+        if os.path.isfile(quantized_model_path(path)):
+            return quantized_model_path(path)
+        logging.warning(f"No quantized version of {path}, run python -m utils.quantize first")
+    if shared_models:
+        if os.path.isfile(shared_model_path(path)):
+            return shared_model_path(path)
+        logging.warning(f"No shared version of {path}, run python -m utils.shared_models first")
+    return path
+
+
+# Runs a TensorFlow Lite model behind the same predict() as a Keras model, so
+# it can be used anywhere a Keras model can. get_model hands the same one to
+# every thread, and an interpreter can only run one thing at a time.
+class TFLiteModel:
+    def __init__(self, path):
+        tf = import_tensorflow()
+        if shared_models:
+            self.interpreter = tf.lite.Interpreter(
+                model_path=path,
+                experimental_op_resolver_type=tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+            )
+        else:
+            self.interpreter = tf.lite.Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+        self.input_index  = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.lock = threading.Lock()
+
+    def predict(self, img_array, verbose=None):
+        with self.lock:
+            self.interpreter.set_tensor(self.input_index, img_array)
+            self.interpreter.invoke()
+            # A copy, so it stays put once the next prediction runs
+            return self.interpreter.get_tensor(self.output_index)
+
+
+# Turn a big portrait crop into the input the char1 model expects. Also
+# returns the intermediate images for debugging.
+# Pass out to fill in an existing (1,80,120,1) float32 array rather than
+# allocating a new one.
+def preprocess_char1(image, out=None):
     height, width = 80, 120
     greyscale_image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
     # Resize to the correct size so it can be accepted by the model
     resized_image = cv.resize(greyscale_image, (width, height), interpolation=cv.INTER_CUBIC)
-    img_array = np.array(resized_image)
-    img_array = img_array.astype('float32')
-    img_array = img_array / 255.0
-    img_array = img_array.reshape(1,height,width,1)
+    if out is None:
+        out = np.empty((1,height,width,1), dtype=np.float32)
+    np.divide(resized_image.reshape(1,height,width,1), np.float32(255.0), out=out)
+    return out, greyscale_image, resized_image
+
+
+# Turn a mini portrait crop into the input the char23 model expects. Also
+# returns the intermediate images for debugging.
+# Pass out to fill in an existing (1,12,48,3) float32 array rather than
+# allocating a new one.
+def preprocess_char23(image, out=None):
+    height, width = 12, 48
+    rgb_image = cv.cvtColor(image, cv.COLOR_BGR2RGB)
+    # Resize to the correct size so it can be accepted by the model
+    resized_image = cv.resize(rgb_image, (width, height), interpolation=cv.INTER_CUBIC)
+    if out is None:
+        out = np.empty((1,height,width,3), dtype=np.float32)
+    np.divide(resized_image.reshape(1,height,width,3), np.float32(255.0), out=out)
+    return out, rgb_image, resized_image
+
+
+# Identify a point character by its big portrait
+def identify_char1(image, model, debug_name="guess"):
+    return char1_list[argmax(predict_char1(image, model, debug_name))]
+
+
+# Identify a mid or anchor character by its mini portrait
+def identify_char23(image, model, debug_name="guess"):
+    return char23_list[argmax(predict_char23(image, model, debug_name))]
+
+
+# Probability of a big portrait being each character in char1_list
+# If there's a portrait index and the crop is a close match to one of its
+# references, skip the model entirely
+def predict_char1(image, model, debug_name="guess", portrait_index=None):
+    if portrait_index is not None:
+        probs = portrait_index.lookup(image, "char1")
+        if probs is not None:
+            return probs
+    img_array, greyscale_image, resized_image = preprocess_char1(image, out=input_tensor((1,80,120,1)))
     output_labels = model.predict(img_array, verbose=None)[0]
-    guess = char1_list[argmax(output_labels)]
     if logging.DEBUG >= logging.root.level:
+        guess = char1_list[argmax(output_labels)]
         debug_path = f"debug/ml/{debug_name}"
         Path(debug_path).mkdir(parents=True, exist_ok=True)
         cv.imwrite(f"{debug_path}/1_original.jpg", image)
         cv.imwrite(f"{debug_path}/2_greyscale.jpg", greyscale_image)
         cv.imwrite(f"{debug_path}/3_resized_{guess}.jpg", resized_image)
-    return guess
+    return output_labels
 
 
-# Identify a mid or anchor character by its mini portrait
-def identify_char23(image, model, debug_name="guess"):
-    height, width = 12, 48
-    rgb_image = cv.cvtColor(image, cv.COLOR_BGR2RGB)
-    # Resize to the correct size so it can be accepted by the model
-    resized_image = cv.resize(rgb_image, (width, height), interpolation=cv.INTER_CUBIC)
-    img_array = np.array(resized_image)
-    img_array = img_array.astype('float32')
-    img_array = img_array / 255.0
-    img_array = img_array.reshape(1,height,width,3)
+# Probability of a mini portrait being each character in char23_list
+# If there's a portrait index and the crop is a close match to one of its
+# references, skip the model entirely
+def predict_char23(image, model, debug_name="guess", portrait_index=None):
+    if portrait_index is not None:
+        probs = portrait_index.lookup(image, "char23")
+        if probs is not None:
+            return probs
+    img_array, rgb_image, resized_image = preprocess_char23(image, out=input_tensor((1,12,48,3)))
     output_labels = model.predict(img_array, verbose=None)[0]
-    guess = char23_list[argmax(output_labels)]
     if logging.DEBUG >= logging.root.level:
+        guess = char23_list[argmax(output_labels)]
         debug_path = f"debug/ml/{debug_name}"
         Path(debug_path).mkdir(parents=True, exist_ok=True)
         cv.imwrite(f"{debug_path}/1_original.jpg", image)
         cv.imwrite(f"{debug_path}/2_rgb.jpg", rgb_image)
         cv.imwrite(f"{debug_path}/3_resized_{guess}.jpg", resized_image)
-    return guess
+    return output_labels
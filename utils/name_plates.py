@@ -0,0 +1,82 @@
+import numpy as np
+import cv2 as cv
+
+# Size name plates are shrunk to before comparing, (width, height). Big
+# enough that two different names don't look alike.
+NAME_PLATE_SIZE = (96, 12)
+
+# Correlation a fresh name plate needs with the last game's to count as the
+# same name
+NAME_MATCH_THRESHOLD = 0.92
+
+# Fresh name plates checked at a round start. Every one of them has to match
+# for OCR to be skipped.
+NAME_MATCH_SAMPLES = 2
+
+
+# A name plate crop shrunk down to a unit vector that doesn't care about
+# overall brightness or contrast, so a dot product gives the correlation
+def name_plate_vector(image):
+    image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    vector = cv.resize(image, NAME_PLATE_SIZE, interpolation=cv.INTER_AREA).astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+# Average of some name plate vectors, as a unit vector again
+def mean_vector(vectors):
+    vector = np.mean(vectors, axis=0)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+# What the last game's name plates looked like, so the next game in a set can
+# be recognised by its name plates alone instead of running OCR over a whole
+# name window again.
+#
+# Only name plates that OCR'd as the name that was picked go into each
+# fingerprint, so frames where something was in the way don't count.
+class NamePlateFingerprints:
+    def __init__(self):
+        self.forget()
+
+    def forget(self):
+        self.names   = None # (p1name, p2name)
+        self.vectors = None # (p1 vector, p2 vector)
+
+    # samples is a list of (p1 vector, p2 vector, p1 guess, p2 guess) from a
+    # name window
+    def remember(self, p1name, p2name, samples):
+        p1_vectors = [p1_vector for (p1_vector, _, p1_guess, _) in samples if p1_guess == p1name]
+        p2_vectors = [p2_vector for (_, p2_vector, _, p2_guess) in samples if p2_guess == p2name]
+        if "_" in (p1name, p2name) or not p1_vectors or not p2_vectors:
+            self.forget()
+            return
+        self.names   = (p1name, p2name)
+        self.vectors = (mean_vector(p1_vectors), mean_vector(p2_vectors))
+
+    # Names for fresh name plates if they're confidently the last game's
+    # (either way around, players can swap sides between games), otherwise
+    # None. images is a list of (p1 crop, p2 crop).
+    def match(self, images):
+        if self.vectors is None or not images:
+            return None
+        (p1_vector, p2_vector) = self.vectors
+        (p1name, p2name) = self.names
+        straight = True
+        swapped  = True
+        for (p1_img, p2_img) in images:
+            p1 = name_plate_vector(p1_img)
+            p2 = name_plate_vector(p2_img)
+            straight = straight and min(p1 @ p1_vector, p2 @ p2_vector) >= NAME_MATCH_THRESHOLD
+            swapped  = swapped  and min(p1 @ p2_vector, p2 @ p1_vector) >= NAME_MATCH_THRESHOLD
+        if straight:
+            return (p1name, p2name)
+        if swapped:
+            return (p2name, p1name)
+        return None
@@ -1,5 +1,3 @@
-import pytesseract
-from thefuzz import process, fuzz
 import cv2 as cv
 import numpy as np
 import logging
@@ -8,6 +6,11 @@ from pathlib import Path
 
 # Guesses the text contained within an image
 def ocr_with_fuzzy_match(image, aliases_dict, brightness_threshold, debug_name="guess"):
+    return fuzzymatch(ocr_name(image, brightness_threshold, debug_name), aliases_dict)
+
+
+# Raw OCR of a name plate, before any matching against known aliases
+def ocr_name(image, brightness_threshold, debug_name="guess"):
     # Set up debug logging
     if logging.DEBUG >= logging.root.level:
         debug_path = f"debug/ocr/{debug_name}"
@@ -39,12 +42,8 @@ def ocr_with_fuzzy_match(image, aliases_dict, brightness_threshold, debug_name="
         cv.imwrite(f"{debug_path}/5_floodfill.jpg", image)
 
     # Use OCR to guess the text
-    guess = pytesseract.image_to_string(image).strip().replace("\n","")
-
-    # Use fuzzy string matching against a list of known aliases
-    guess = fuzzymatch(guess, aliases_dict)
-
-    return guess
+    import pytesseract # slow to import, see utils.heavy_imports
+    return pytesseract.image_to_string(image).strip().replace("\n","")
 
 
 # Perform black flood fills around the edge of an RGB image
@@ -121,6 +120,12 @@ def remove_coloured_pixels(image):
 
 # Fuzzy matches a name against a dictionary of known aliases, returns real name
 def fuzzymatch(name, aliases_dict):
+    return fuzzymatch_with_score(name, aliases_dict)[0]
+
+
+# Same as fuzzymatch, but also returns how good the best match was (0-100)
+def fuzzymatch_with_score(name, aliases_dict):
+    from thefuzz import process # slow to import, see utils.heavy_imports
     minimum_confidence = 70
     if name:
         # Try using the more simplistic scorer
@@ -138,10 +143,10 @@ def fuzzymatch(name, aliases_dict):
                     logging.debug(f"\"{choice[0]}\"              (exact match)")
                 else:
                     logging.debug(f"\"{choice[0]}\" alias \"{aliases_dict[choice[0]]}\"")
-            return aliases_dict[choice[0]]
+            return (aliases_dict[choice[0]], choice[1])
         else:
             logging.debug(f"\"{name}\" -> _         (best guess was \"{choice[0]}\")")
-            return "_"
+            return ("_", choice[1])
     else:
         logging.debug(f"No text detected!")
-        return "_"
\ No newline at end of file
+        return ("_", 0)
\ No newline at end of file
@@ -0,0 +1,151 @@
+import os
+import re
+import sys
+import logging
+import argparse
+import numpy as np
+import cv2 as cv
+from utils.ml import char1_list, char23_list
+from utils.crops import load_labelled_crops
+
+# Where the reference indexes live, one per game version
+PORTRAIT_INDEX_DIR = "models/portrait_index"
+
+# Template sizes. Mini portraits are tiny to begin with so they keep the
+# model's input size, big portraits can be shrunk a lot more.
+CHAR1_SIZE  = (30, 20) # width, height
+CHAR23_SIZE = (48, 12)
+
+# Cosine distance a crop needs to be within to count as a match...
+MATCH_THRESHOLD = 0.05
+# ...and the best match has to be this much closer than the best match for
+# any other character, otherwise it's too close to call
+MATCH_RATIO = 0.6
+
+# Most templates kept per character
+MAX_TEMPLATES = 32
+
+# Probability given to the matched character, the rest is spread evenly
+MATCH_PROBABILITY = 0.98
+
+
+# Turn a crop into a unit vector that doesn't care about overall brightness
+# or contrast, so a dot product gives cosine similarity
+def portrait_vector(image, kind):
+    if kind == "char1":
+        image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+        size = CHAR1_SIZE
+    else:
+        size = CHAR23_SIZE
+    vector = cv.resize(image, size, interpolation=cv.INTER_AREA).astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+# Filename-safe version of a game version name
+def version_slug(version: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '_', version.lower()).strip('_')
+
+
+def portrait_index_path(version: str) -> str:
+    return os.path.join(PORTRAIT_INDEX_DIR, f"{version_slug(version)}.npz")
+
+
+# Reference portraits for every character in one game version, used to
+# classify crops with a nearest neighbour lookup before bothering the models
+class PortraitIndex:
+    def __init__(self, char1_vectors, char1_labels, char23_vectors, char23_labels):
+        self.vectors = {"char1": char1_vectors, "char23": char23_vectors}
+        self.labels  = {"char1": char1_labels,  "char23": char23_labels}
+        self.classes = {"char1": len(char1_list), "char23": len(char23_list)}
+
+    # Index for a game version if anybody has built one, otherwise None
+    @classmethod
+    def load(cls, version: str):
+        path = portrait_index_path(version)
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as data:
+            return cls(
+                data['char1_vectors'],  data['char1_labels'],
+                data['char23_vectors'], data['char23_labels']
+            )
+
+    def save(self, version: str):
+        os.makedirs(PORTRAIT_INDEX_DIR, exist_ok=True)
+        np.savez_compressed(
+            portrait_index_path(version),
+            char1_vectors=self.vectors["char1"],   char1_labels=self.labels["char1"],
+            char23_vectors=self.vectors["char23"], char23_labels=self.labels["char23"]
+        )
+
+    # Probabilities for each character if the crop is a confident match for
+    # one of the references, otherwise None and it's up to the model
+    def lookup(self, image, kind):
+        vectors = self.vectors[kind]
+        labels = self.labels[kind]
+        if len(vectors) == 0:
+            return None
+
+        distances = 1.0 - vectors @ portrait_vector(image, kind)
+        best = np.argmin(distances)
+        if distances[best] > MATCH_THRESHOLD:
+            return None
+        others = distances[labels != labels[best]]
+        if len(others) and distances[best] > MATCH_RATIO * others.min():
+            return None
+
+        classes = self.classes[kind]
+        probs = np.full(classes, (1.0 - MATCH_PROBABILITY) / (classes - 1), dtype=np.float32)
+        probs[labels[best]] = MATCH_PROBABILITY
+        return probs
+
+
+# Build an index from labelled crops, keeping up to MAX_TEMPLATES spread out
+# examples per character
+def build_portrait_index(crops):
+    vectors = {"char1": [], "char23": []}
+    labels  = {"char1": [], "char23": []}
+    codes   = {"char1": char1_list, "char23": char23_list}
+    for kind in ["char1", "char23"]:
+        by_code = {}
+        for (crop_kind, code, image) in crops:
+            if crop_kind == kind and code in codes[kind]:
+                by_code.setdefault(code, []).append(portrait_vector(image, kind))
+        for code, code_vectors in by_code.items():
+            # Evenly spaced picks rather than the first N, so one long game
+            # doesn't make up every template
+            picks = np.linspace(0, len(code_vectors) - 1, min(len(code_vectors), MAX_TEMPLATES))
+            for i in np.unique(picks.astype(int)):
+                vectors[kind].append(code_vectors[i])
+                labels[kind].append(codes[kind].index(code))
+        logging.info(f"{kind}: {len(vectors[kind])} templates for {len(by_code)} characters")
+
+    def stack(kind, size):
+        dimensions = size[0] * size[1] * (1 if kind == "char1" else 3)
+        if vectors[kind]:
+            return np.stack(vectors[kind])
+        return np.zeros((0, dimensions), dtype=np.float32)
+
+    return PortraitIndex(
+        stack("char1", CHAR1_SIZE),   np.array(labels["char1"],  dtype=np.int16),
+        stack("char23", CHAR23_SIZE), np.array(labels["char23"], dtype=np.int16)
+    )
+
+
+# python -m utils.portrait_index <crops dir> "<game version>"
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Build a portrait lookup index from labelled crops")
+    parser.add_argument("crops", help="crops sorted into char1/<CODE>/ and char23/<CODE>/, or a debug/ml directory")
+    parser.add_argument("version", help="game version the crops are from, eg. \"2024 Balance Patch\"")
+    args = parser.parse_args()
+
+    crops = load_labelled_crops(args.crops)
+    if not crops:
+        sys.exit(f"ERROR: no labelled crops found in {args.crops}")
+    build_portrait_index(crops).save(args.version)
+    logging.info(f"Saved to {portrait_index_path(args.version)}")
@@ -0,0 +1,48 @@
+import configparser
+from datetime import date
+from utils.dates import infer_last_weekday
+from utils.stamper import DEFAULT_OCR_THREADS
+from utils.game_state import DEFAULT_SKIP_STRIDE
+from utils.frame_cache import DEFAULT_FRAME_CACHE_MB
+from utils.hud_cache import DEFAULT_HUD_CACHE_SCALE
+
+PRESETS_FILE = "config/presets.ini"
+
+
+def load_presets(path: str = PRESETS_FILE):
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
+
+
+# Stamper settings from a preset, for when there's no options form to fill
+# in (eg. headless workers). Same defaults as the GUI.
+def settings_from_preset(config, preset_name: str, date_override=None, url=""):
+    preset = config[preset_name]
+    weekday = preset.get('DAY', "")
+    if date_override:
+        event_date = date_override
+    elif weekday:
+        event_date = infer_last_weekday(weekday)
+    else:
+        event_date = date.today().isoformat()
+    return dict(
+        OCR_THREADS = int(preset.get('OCR_THREADS', DEFAULT_OCR_THREADS)),
+        SKIP_STRIDE = int(preset.get('SKIP_STRIDE', DEFAULT_SKIP_STRIDE)),
+        FRAME_CACHE_MB = int(preset.get('FRAME_CACHE_MB', DEFAULT_FRAME_CACHE_MB)),
+        HUD_CACHE   = preset.get('HUD_CACHE', "0") == "1",
+        HUD_CACHE_SCALE = float(preset.get('HUD_CACHE_SCALE', DEFAULT_HUD_CACHE_SCALE)),
+        EXPORT_DIR  = preset.get('EXPORT_DIR', ""),
+        PRESET      = preset_name,
+        GAME_X      = int(preset.get('GAME_X', 0)),
+        GAME_Y      = int(preset.get('GAME_Y', 0)),
+        GAME_SIZE   = int(preset.get('GAME_SIZE', 0)),
+        MAKE_CSV    = True,
+        EVENT       = preset.get('EVENT', ""),
+        DATE        = event_date,
+        REGION      = preset.get('REGION', ""),
+        NETPLAY     = preset.get('NETPLAY', "0") == "1",
+        VERSION     = preset.get('VERSION', ""),
+        URL         = url,
+        QUANTIZED   = preset.get('QUANTIZED', "0") == "1"
+    )
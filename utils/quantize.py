@@ -0,0 +1,130 @@
+import os
+import sys
+import random
+import logging
+import argparse
+from glob import glob
+from timeit import default_timer as timer
+import numpy as np
+import tensorflow as tf
+from keras.models import load_model
+
+from utils.ml import (
+    char1_list, char23_list, preprocess_char1, preprocess_char23,
+    quantized_model_path, TFLiteModel
+)
+from utils.crops import load_labelled_crops, sorted_by_hand
+
+# Share of the crops kept back for checking accuracy rather than calibration
+HELD_OUT_FRACTION = 0.2
+
+# Calibration doesn't need every crop we've ever seen
+MAX_CALIBRATION_CROPS = 500
+
+
+# Which kind of portrait a model file is for, going by its name
+def model_kind(path):
+    return "char1" if os.path.basename(path).startswith("char1") else "char23"
+
+
+def preprocess(image, kind):
+    if kind == "char1":
+        return preprocess_char1(image)[0]
+    return preprocess_char23(image)[0]
+
+
+# Post-training int8 quantization, calibrated on real crops. Input and output
+# stay float32 so the quantized model is a drop-in replacement.
+def quantize_model(model, calibration_inputs):
+    def representative_dataset():
+        for img_array in calibration_inputs:
+            yield [img_array]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+# Accuracy (against the crop labels) and mean time per crop of a model
+def evaluate(model, inputs, labels):
+    correct = 0
+    start = timer()
+    for img_array, label in zip(inputs, labels):
+        if np.argmax(model.predict(img_array, verbose=None)[0]) == label:
+            correct += 1
+    elapsed = timer() - start
+    return correct / max(len(labels), 1), elapsed / max(len(labels), 1)
+
+
+# Quantize one model and return a report comparing it to the original. Crops
+# from debug/ml are labelled with the float model's own guesses, so accuracy
+# against them only says how often the quantized model agrees with it.
+def quantize_and_report(path, crops, hand_labelled=True):
+    kind = model_kind(path)
+    codes = char1_list if kind == "char1" else char23_list
+    examples = [
+        (preprocess(image, kind), codes.index(code))
+        for (crop_kind, code, image) in crops
+        if crop_kind == kind and code in codes
+    ]
+    if len(examples) < 10:
+        return f"{path}: not enough {kind} crops ({len(examples)}), skipped"
+
+    # Same split every time so reports can be compared between runs
+    random.Random(0).shuffle(examples)
+    held_out_count = max(1, int(len(examples) * HELD_OUT_FRACTION))
+    held_out = examples[:held_out_count]
+    calibration = examples[held_out_count:][:MAX_CALIBRATION_CROPS]
+
+    float_model = load_model(path)
+    quantized_path = quantized_model_path(path)
+    with open(quantized_path, "wb") as f:
+        f.write(quantize_model(float_model, [img_array for (img_array, label) in calibration]))
+    quantized_model = TFLiteModel(quantized_path)
+
+    inputs = [img_array for (img_array, label) in held_out]
+    labels = [label for (img_array, label) in held_out]
+    float_accuracy, float_time = evaluate(float_model, inputs, labels)
+    quantized_accuracy, quantized_time = evaluate(quantized_model, inputs, labels)
+    agreement = np.mean([
+        np.argmax(float_model.predict(img_array, verbose=None)[0])
+        == np.argmax(quantized_model.predict(img_array, verbose=None)[0])
+        for img_array in inputs
+    ])
+
+    return "\n".join([
+        f"{path} -> {quantized_path}",
+        f"  calibrated on {len(calibration)} crops, tested on {len(held_out)} held out crops",
+        f"  size:      {os.path.getsize(path) / 1e6:.2f}MB -> {os.path.getsize(quantized_path) / 1e6:.2f}MB",
+        (
+            f"  accuracy:  {float_accuracy:.2%} -> {quantized_accuracy:.2%}" if hand_labelled else
+            "  accuracy:  not measured, crops are labelled by the float model (use crops sorted by hand)"
+        ),
+        f"  agreement: {agreement:.2%} (quantized picks the same character as float)",
+        f"  time/crop: {float_time * 1000:.2f}ms -> {quantized_time * 1000:.2f}ms",
+    ])
+
+
+# python -m utils.quantize <crops dir> [models...]
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Make int8 quantized versions of the character models")
+    parser.add_argument("crops", help="crops sorted into char1/<CODE>/ and char23/<CODE>/, or a debug/ml directory")
+    parser.add_argument("models", nargs="*", help="models to quantize (default: every .h5 in models/)")
+    args = parser.parse_args()
+
+    crops = load_labelled_crops(args.crops)
+    if not crops:
+        sys.exit(f"ERROR: no labelled crops found in {args.crops}")
+    hand_labelled = sorted_by_hand(args.crops)
+    if not hand_labelled:
+        logging.warning(f"{args.crops} isn't sorted by hand, so only agreement with the float models can be measured")
+    models = args.models or sorted(glob("models/*.h5"))
+
+    reports = [quantize_and_report(path, crops, hand_labelled) for path in models]
+    report = "\n\n".join(reports)
+    with open("models/quantization_report.txt", "w") as f:
+        f.write(report + "\n")
+    print(report)
@@ -0,0 +1,346 @@
+import os
+import re
+import sys
+import time
+import hashlib
+import logging
+import argparse
+import threading
+import http.client
+import urllib.error
+import urllib.request
+from glob import glob
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Remote videos are fetched and cached in pieces this big
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# How many chunks past the one being read to fetch in the background
+READ_AHEAD_CHUNKS = 8
+
+# On-disk chunk cache, shared by every remote video. Least recently used
+# chunks are thrown away to stay under the size limit.
+CHUNK_CACHE_DIR = "cache/chunks"
+DEFAULT_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+# Retries for a request that fails or comes back short, with the delay
+# doubling after each one (seconds)
+MAX_RETRIES = 5
+RETRY_DELAY = 1.0
+REQUEST_TIMEOUT = 30
+
+# A file that's being written (downloaded or recorded) is taken to have
+# finished once it hasn't been modified for this long
+GROWING_IDLE_SECONDS = 10
+
+# How often to check whether a file that's being written has grown (seconds)
+GROWTH_POLL_INTERVAL = 1.0
+
+USER_AGENT = "skug-stamper"
+
+
+def is_url(name: str) -> bool:
+    return re.match(r'https?://', name) is not None
+
+
+# Whether a local file has been modified recently. Only a hint: a file that's
+# just been copied or moved into place looks the same.
+def is_growing(filename: str) -> bool:
+    try:
+        return time.time() - os.path.getmtime(filename) < GROWING_IDLE_SECONDS
+    except OSError:
+        return False
+
+
+# Chunks of remote videos kept on disk between runs, so processing the same
+# video again (or seeking back to somewhere already read) doesn't download
+# it again
+class ChunkCache:
+    def __init__(self, directory: str = CHUNK_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries   = OrderedDict() # key -> size, least recently used first
+        self.total     = 0
+        self.lock      = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Pick up whatever earlier runs left behind, oldest first
+        for path in sorted(glob(os.path.join(directory, "*.chunk")), key=os.path.getmtime):
+            key = os.path.basename(path)[:-len(".chunk")]
+            self.entries[key] = os.path.getsize(path)
+            self.total += self.entries[key]
+        with self.lock:
+            self.evict()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.chunk")
+
+    def contains(self, key: str) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key: str):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            with self.lock:
+                self.total -= self.entries.pop(key, 0)
+            return None
+
+    def put(self, key: str, data: bytes):
+        # Write to a temp file first so a half written chunk is never read
+        tmp_path = f"{self.path(key)}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(key))
+        with self.lock:
+            self.total -= self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.total += len(data)
+            self.evict()
+
+    # Call with the lock held
+    def evict(self):
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            (key, size) = self.entries.popitem(last=False)
+            self.total -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+
+# A video on a web server that supports range requests
+class HTTPSource:
+    def __init__(self, url: str):
+        self.url = url
+        self.size = self.probe_size()
+
+    def request(self, start: int, end: int):
+        return urllib.request.Request(self.url, headers={
+            "Range": f"bytes={start}-{end}",
+            "User-Agent": USER_AGENT,
+        })
+
+    # Ask for the first byte, and read the full size off the Content-Range
+    def probe_size(self) -> int:
+        with urllib.request.urlopen(self.request(0, 0), timeout=REQUEST_TIMEOUT) as response:
+            content_range = response.headers.get("Content-Range", "")
+            match = re.search(r'/(\d+)$', content_range)
+            if response.status != 206 or not match:
+                raise OSError(f"{self.url} doesn't support range requests")
+            return int(match.group(1))
+
+    # Read exactly length bytes (fewer only at the end of the file). A
+    # connection that drops part way through picks up where it left off.
+    def read(self, start: int, length: int) -> bytes:
+        length = min(length, self.size - start)
+        data = b""
+        failures = 0
+        while len(data) < length:
+            position = start + len(data)
+            error = "nothing came back"
+            try:
+                with urllib.request.urlopen(
+                    self.request(position, start + length - 1), timeout=REQUEST_TIMEOUT
+                ) as response:
+                    if response.status != 206:
+                        raise OSError(f"{self.url} ignored a range request")
+                    data += response.read(start + length - position)
+            except http.client.IncompleteRead as e:
+                data += e.partial
+            except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+                error = e
+            # Any progress at all resets the retries
+            if start + len(data) > position:
+                failures = 0
+                continue
+            # Whether it failed or just came back empty, asking again straight
+            # away is only going to get the same again
+            failures += 1
+            if failures > MAX_RETRIES:
+                raise OSError(f"Giving up reading {self.url} at byte {position} ({error})")
+            delay = RETRY_DELAY * 2**(failures - 1)
+            logging.warning(f"Read from {self.url} failed ({error}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+        return data
+
+
+# A local file, for serving over HTTP as a stand-in for a real server
+class FileSource:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.size = os.path.getsize(filename)
+
+    def read(self, start: int, length: int) -> bytes:
+        with open(self.filename, "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+
+# Reads a source a chunk at a time through the chunk cache, fetching the
+# chunks after whatever was just read in the background so a sequential
+# reader (like the decoder) rarely has to wait on the network
+class BufferedSource:
+    def __init__(self, source, cache: ChunkCache, read_ahead: int = READ_AHEAD_CHUNKS):
+        self.source     = source
+        self.size       = source.size
+        self.cache      = cache
+        self.read_ahead = read_ahead
+        # Chunks from different videos (or different versions of one) must
+        # never be mixed up
+        self.key        = hashlib.sha1(f"{source.url}:{source.size}".encode()).hexdigest()[:16]
+        self.pending    = {} # chunk number -> future, for chunks being fetched
+        self.lock       = threading.Lock()
+        self.executor   = ThreadPoolExecutor(max_workers=2)
+
+    def chunk_key(self, number: int) -> str:
+        return f"{self.key}_{number}"
+
+    def fetch(self, number: int) -> bytes:
+        data = self.source.read(number * CHUNK_SIZE, CHUNK_SIZE)
+        self.cache.put(self.chunk_key(number), data)
+        return data
+
+    def fetch_ahead(self, number: int):
+        try:
+            return self.fetch(number)
+        finally:
+            with self.lock:
+                self.pending.pop(number, None)
+
+    def chunk(self, number: int) -> bytes:
+        data = self.cache.get(self.chunk_key(number))
+        if data is None:
+            with self.lock:
+                future = self.pending.get(number)
+            data = future.result() if future else self.fetch(number)
+        self.start_read_ahead(number)
+        return data
+
+    def start_read_ahead(self, number: int):
+        last_chunk = (self.size - 1) // CHUNK_SIZE
+        with self.lock:
+            for ahead in range(number + 1, min(number + self.read_ahead, last_chunk) + 1):
+                if ahead not in self.pending and not self.cache.contains(self.chunk_key(ahead)):
+                    self.pending[ahead] = self.executor.submit(self.fetch_ahead, ahead)
+
+    # Up to length bytes from start, stopping at the end of a chunk
+    def read(self, start: int, length: int) -> bytes:
+        (number, offset) = divmod(start, CHUNK_SIZE)
+        return self.chunk(number)[offset:offset + length]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def respond(self, body: bool):
+        self.serve_range(self.server.source, body)
+
+    # Answer a (possibly ranged) request for the contents of a source
+    def serve_range(self, source, body: bool):
+        size = source.size
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)', self.headers.get("Range", ""))
+        if match and (match.group(1) or match.group(2)):
+            if not match.group(1):
+                # Suffix range, the last N bytes
+                start = max(0, size - int(match.group(2)))
+            else:
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(int(match.group(2)), size - 1)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if not body:
+            return
+
+        position = start
+        try:
+            while position <= end:
+                data = source.read(position, end - position + 1)
+                if not data:
+                    break
+                self.wfile.write(data)
+                position += len(data)
+        # The decoder hangs up whenever it seeks somewhere else
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except OSError as e:
+            logging.error(f"Couldn't serve bytes {position}-{end}: {e}")
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+# Serves a source on localhost with range request support. OpenCV (through
+# FFmpeg) then reads from this like any other URL, and seeks turn into range
+# requests that the source can answer from its cache.
+class LoopbackServer:
+    def __init__(self, source, port: int = 0):
+        self.source = source
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), RangeRequestHandler)
+        self.server.daemon_threads = True
+        self.server.source = source
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        (host, port) = self.server.server_address[:2]
+        return f"http://{host}:{port}/video"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if hasattr(self.source, "close"):
+            self.source.close()
+
+
+# Everything needed to read a remote video as if it were local
+def open_remote(url: str) -> LoopbackServer:
+    return LoopbackServer(BufferedSource(HTTPSource(url), ChunkCache()))
+
+
+# python -m utils.remote_source <video file> [--port N]
+# Serves a local file with range request support, for trying out remote
+# input without a real server
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Serve a video file over HTTP with range requests")
+    parser.add_argument("filename", help="video file to serve")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on (default 8000)")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.filename):
+        sys.exit(f"ERROR: file {args.filename} doesn't exist!")
+    server = LoopbackServer(FileSource(args.filename), args.port)
+    logging.info(f"Serving {args.filename} at {server.url}, Ctrl+C to stop")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.close()
@@ -0,0 +1,170 @@
+import queue
+import threading
+from utils.cv2 import read_frame_from_video, is_round_start
+from utils.hud_layout import hud_layout
+from utils.timestamp import display_timestamp
+from utils.frame_ring import FrameRing
+from utils.remote_source import GROWTH_POLL_INTERVAL
+
+# How many seconds each stage is allowed to get ahead of the next one. Bounds
+# memory to a handful of full frames no matter how slow the consumer is.
+PREFETCH_DEPTH = 8
+
+# How often blocked stages check whether they should give up (seconds)
+STOP_POLL_INTERVAL = 0.1
+
+# Put on a queue after the last item
+END = None
+
+
+# Frames that can be alive at once: a full queue between every pair of
+# stages, one in the hands of each stage and one with the consumer, plus a
+# spare. Decoding can't get further ahead than that, so a ring this size never
+# overwrites a frame somebody is still looking at.
+def ring_slots(depth: int) -> int:
+    return 2 * depth + 4
+
+
+# One second of the main scan, as it comes out of the pipeline. image is None
+# if the frame couldn't be read, in which case nothing else comes after it.
+# image is a view into the pipeline's frame ring, so it's only good until the
+# consumer has asked for a few more seconds; copy it to keep it any longer.
+class ScanResult:
+    def __init__(self, seconds, image, diffs=None, round_start=False):
+        self.seconds     = seconds
+        self.image       = image
+        self.diffs       = diffs
+        self.round_start = round_start
+
+
+# Runs the main scan's decoding and round start detection on their own
+# threads, so they overlap with the OCR and ML work the consumer is doing:
+#
+#   decode thread -> frames queue -> detect thread -> results queue -> get()
+#
+# The pipeline reads every stride'th second. Every stage handles them strictly
+# in order, so the consumer (which does the set logic) sees the same sequence
+# it would have computed itself. Full queues block the stage feeding them,
+# which keeps memory bounded.
+class ScanPipeline:
+    def __init__(self, capture_pool, GAME_X, GAME_Y, GAME_SIZE, start_seconds, total_seconds, stride=1, depth=PREFETCH_DEPTH):
+        self.capture_pool  = capture_pool
+        self.GAME_X        = GAME_X
+        self.GAME_Y        = GAME_Y
+        self.GAME_SIZE     = GAME_SIZE
+        self.layout        = hud_layout(GAME_SIZE)
+        self.start_seconds = start_seconds
+        self.total_seconds = total_seconds
+        self.stride        = stride
+
+        self.ring     = FrameRing(ring_slots(depth))
+        self.frames   = queue.Queue(maxsize=depth)
+        self.results  = queue.Queue(maxsize=depth)
+        self.stopping = threading.Event()
+        self.threads  = [
+            threading.Thread(target=self.decode_stage, daemon=True),
+            threading.Thread(target=self.detect_stage, daemon=True),
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    # Blocking put that gives up if the pipeline is closed in the meantime
+    def put(self, q, item) -> bool:
+        while not self.stopping.is_set():
+            try:
+                q.put(item, timeout=STOP_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # Both stages always finish by putting END on their output queue, even if
+    # something goes wrong, so nobody downstream waits forever
+    def decode_stage(self):
+        try:
+            # Our own decoder, so reads are sequential and nobody else moves it
+            capture = self.capture_pool.acquire()
+            try:
+                seconds = self.start_seconds
+                while not self.stopping.is_set():
+                    # The end, unless the video is still being written
+                    if seconds >= self.total_seconds:
+                        if not self.capture_pool.wait_for(seconds, self.stopping.is_set):
+                            return
+                        self.total_seconds = self.capture_pool.total_seconds
+                    if self.capture_pool.is_stale(capture):
+                        self.capture_pool.release(capture)
+                        capture = self.capture_pool.acquire()
+                    image = read_frame_from_video(capture, seconds, self.GAME_X, self.GAME_Y, self.GAME_SIZE, crop=False, ring=self.ring)
+                    if image is None and self.capture_pool.growing:
+                        # Most likely only part of this second has been
+                        # written so far, try again once there's more
+                        self.stopping.wait(GROWTH_POLL_INTERVAL)
+                        self.capture_pool.refresh()
+                        continue
+                    # Ran off the end of a video that's finished being written
+                    if image is None and not self.capture_pool.wait_for(seconds, self.stopping.is_set):
+                        return
+                    if not self.put(self.frames, (seconds, image)) or image is None:
+                        return
+                    seconds += self.stride
+            finally:
+                self.capture_pool.release(capture)
+        finally:
+            self.put(self.frames, END)
+
+    def detect_stage(self):
+        try:
+            while not self.stopping.is_set():
+                try:
+                    item = self.frames.get(timeout=STOP_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                if item is END:
+                    return
+                (seconds, image) = item
+                if image is None:
+                    self.put(self.results, ScanResult(seconds, None))
+                    return
+                debug_name = display_timestamp(seconds, self.total_seconds).replace(':','-')
+                diffs = self.layout.health_bar_diffs(image)
+                round_start = is_round_start(image, self.GAME_SIZE, debug_name, diffs=diffs)
+                if not self.put(self.results, ScanResult(seconds, image, diffs, round_start)):
+                    return
+        finally:
+            self.put(self.results, END)
+
+    # The result for a given second. The scan only ever moves forwards, so
+    # anything for earlier seconds gets thrown away on the way. Returns None
+    # if the pipeline ran out before getting there. while_waiting gets called
+    # every so often until the result turns up, for anything that has to
+    # keep going meanwhile (live, the stages can be waiting on it).
+    def get(self, seconds, while_waiting=None):
+        while True:
+            try:
+                result = self.results.get(timeout=STOP_POLL_INTERVAL)
+            except queue.Empty:
+                if while_waiting is not None:
+                    while_waiting()
+                continue
+            if result is END:
+                # Leave it there for any later calls
+                self.put(self.results, END)
+                return None
+            if result.seconds >= seconds or result.image is None:
+                return result
+
+    # Stop every stage as soon as possible. Draining the queues unblocks any
+    # stage waiting to put something on them.
+    def close(self):
+        self.stopping.set()
+        for q in [self.frames, self.results]:
+            while True:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    break
+        for thread in self.threads:
+            thread.join()
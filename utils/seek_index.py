@@ -0,0 +1,220 @@
+import os
+import logging
+import subprocess
+import numpy as np
+import cv2 as cv
+
+# Bump this whenever the contents of the sidecar file change
+SEEK_INDEX_VERSION = 1
+
+# Decoding forward is only worth it for short hops (like the 1 second stride
+# of the main scan). Anything further than this and we do a real seek.
+MAX_DECODE_FORWARD_SECONDS = 3.0
+
+
+# The seek index lives right next to the video it describes
+def seek_index_path(filename: str) -> str:
+    return f"{filename}.seekindex.npz"
+
+
+# Presentation timestamps of every frame and every keyframe in a video, both
+# in seconds relative to the first frame.
+class SeekIndex:
+    def __init__(self, pts, keyframes):
+        self.pts       = pts
+        self.keyframes = keyframes
+
+    # Real duration of the video, which unlike frame count / fps still works
+    # for variable frame rate recordings
+    @property
+    def duration(self) -> float:
+        if len(self.pts) == 0:
+            return 0.0
+        if len(self.pts) == 1:
+            return float(self.pts[0])
+        frame_duration = float(np.median(np.diff(self.pts[-100:])))
+        return float(self.pts[-1]) + frame_duration
+
+    # Whether a seek to a time after `start` would land on a keyframe at or
+    # before `end`, ie. whether seeking would beat decoding forward
+    def has_keyframe_between(self, start: float, end: float) -> bool:
+        i = np.searchsorted(self.keyframes, start, side='right')
+        return i < len(self.keyframes) and self.keyframes[i] <= end
+
+    # The last keyframe at or before a time. Decoding has to start there to
+    # get to that time.
+    def keyframe_before(self, t: float) -> float:
+        i = np.searchsorted(self.keyframes, t, side='right') - 1
+        if i < 0:
+            return 0.0
+        return float(self.keyframes[i])
+
+    def save(self, path, size, mtime):
+        # Write to a temp file first so an interrupted write can't leave a
+        # corrupt index lying around
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                version=SEEK_INDEX_VERSION,
+                size=size,
+                mtime=mtime,
+                pts=self.pts,
+                keyframes=self.keyframes
+            )
+        os.replace(tmp_path, path)
+
+
+# Scan every video packet with ffprobe. This only demuxes the file, it doesn't
+# decode anything, so it's a lot faster than reading through with OpenCV.
+def build_seek_index(filename: str):
+    command = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        filename
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.warning(f"Couldn't build seek index for {filename} ({e}), is ffprobe on your PATH?")
+        return None
+
+    pts = []
+    keyframes = []
+    for line in result.stdout.splitlines():
+        fields = line.strip().split(",")
+        if len(fields) < 2 or fields[0] in ("", "N/A"):
+            continue
+        packet_pts = float(fields[0])
+        pts.append(packet_pts)
+        if "K" in fields[1]:
+            keyframes.append(packet_pts)
+    if not pts:
+        logging.warning(f"ffprobe found no video packets in {filename}")
+        return None
+
+    # Packets come out in decode order, we want presentation order. Also make
+    # everything relative to the first frame, same as CAP_PROP_POS_MSEC.
+    pts = np.sort(np.array(pts, dtype=np.float64))
+    keyframes = np.sort(np.array(keyframes, dtype=np.float64))
+    return SeekIndex(pts - pts[0], keyframes - pts[0])
+
+
+# Load the sidecar index for a video if it's still valid, otherwise (re)build
+# it. Returns None if no index could be built.
+def load_seek_index(filename: str):
+    path = seek_index_path(filename)
+    stat = os.stat(filename)
+
+    if os.path.isfile(path):
+        try:
+            with np.load(path) as data:
+                if (int(data['version']) == SEEK_INDEX_VERSION
+                and int(data['size']) == stat.st_size
+                and float(data['mtime']) == stat.st_mtime):
+                    return SeekIndex(data['pts'], data['keyframes'])
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable seek index {path} ({e})")
+
+    logging.info(f"Building seek index for {filename}...")
+    index = build_seek_index(filename)
+    if index is not None:
+        try:
+            index.save(path, stat.st_size, stat.st_mtime)
+        except OSError as e:
+            logging.warning(f"Couldn't save seek index to {path} ({e})")
+    return index
+
+
+# Drop-in replacement for cv.VideoCapture that avoids a full seek when the
+# requested time is only a short way past the last frame read. Seeks are
+# deferred until the next read() so we know where we're going. With an index,
+# a seek goes to the keyframe before the target and decodes forward from
+# there, rather than leaving it up to however OpenCV's seek behaves for the
+# container.
+class IndexedCapture:
+    def __init__(self, filename: str, index=None):
+        self.capture  = cv.VideoCapture(filename)
+        self.index    = index
+        self.position = None # pts of the last frame read, if known
+        self.target   = None # pending seek target
+
+        fps = self.capture.get(cv.CAP_PROP_FPS)
+        self.half_frame = 0.5 / fps if fps > 0 else 0.0
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def set(self, prop, value):
+        if prop == cv.CAP_PROP_POS_MSEC:
+            self.target = value / 1000
+            return True
+        self.position = None
+        return self.capture.set(prop, value)
+
+    def release(self):
+        self.capture.release()
+
+    # Length of the video in whole seconds
+    def total_seconds(self) -> int:
+        if self.index is not None:
+            # Real timestamps, so this is right even for variable frame rate
+            return int(self.index.duration)
+        # No index, fall back to a (possibly wrong) estimate
+        fps = self.capture.get(cv.CAP_PROP_FPS)
+        frame_count = int(self.capture.get(cv.CAP_PROP_FRAME_COUNT))
+        return int(frame_count / fps)
+
+    def read(self, image=None):
+        if self.target is not None:
+            target, self.target = self.target, None
+            if self.can_decode_forward(target):
+                return self.decode_forward(target, image)
+            if self.index is not None:
+                self.capture.set(cv.CAP_PROP_POS_MSEC, self.index.keyframe_before(target) * 1000)
+                return self.decode_forward(target, image)
+            self.capture.set(cv.CAP_PROP_POS_MSEC, target * 1000)
+
+        if image is None:
+            success, image = self.capture.read()
+        else:
+            success, image = self.capture.read(image)
+        self.update_position(success)
+        return success, image
+
+    def can_decode_forward(self, target: float) -> bool:
+        if self.position is None or target <= self.position:
+            return False
+        if target - self.position > MAX_DECODE_FORWARD_SECONDS:
+            return False
+        # A seek would land on a keyframe closer to the target than we are
+        if self.index is not None and self.index.has_keyframe_between(self.position, target):
+            return False
+        return True
+
+    # Grab (but don't convert) frames until we reach the target, then only
+    # convert that last one
+    def decode_forward(self, target: float, image=None):
+        while True:
+            if not self.capture.grab():
+                self.update_position(False)
+                return False, image
+            if self.capture.get(cv.CAP_PROP_POS_MSEC) / 1000 >= target - self.half_frame:
+                break
+        if image is None:
+            success, image = self.capture.retrieve()
+        else:
+            success, image = self.capture.retrieve(image)
+        self.update_position(success)
+        return success, image
+
+    def update_position(self, success: bool):
+        if success:
+            self.position = self.capture.get(cv.CAP_PROP_POS_MSEC) / 1000
+        else:
+            self.position = None
@@ -0,0 +1,67 @@
+from utils.csv import twb_csv_header
+from utils.stamper import same_set, timestamp_line, game_warnings, game_csv_row
+
+# Default length of a piece of video handed to one worker (seconds). Long
+# enough that the few seconds lost to warming up each piece don't matter.
+DEFAULT_SHARD_SECONDS = 15 * 60
+
+# The main scan never finds two games closer together than this, see the
+# "+= 20" after a round start in Stamper.run
+MIN_GAME_SECONDS = 20
+
+
+# Cut a video into (start, end) time ranges
+def split_into_shards(total_seconds: int, shard_seconds: int = DEFAULT_SHARD_SECONDS):
+    return [
+        (start, min(start + shard_seconds, total_seconds))
+        for start in range(0, total_seconds, shard_seconds)
+    ]
+
+
+# Put together the games each shard found (a list per shard, in time order)
+# as if the whole video had been scanned in one go:
+#
+# * A shard that starts during a game's intro finds the same game again a few
+#   seconds after the previous shard did, so the later one goes
+# * A shard that starts in the middle of a set thinks its first game starts a
+#   new set, so sets get grouped again across shard boundaries
+#
+# Returns every game with next_in_set filled in.
+def merge_shard_games(shard_games, NETPLAY):
+    merged = []
+    for games in shard_games:
+        # Teams are only guessed at the start of a set, so a game without
+        # them takes them from the last one in its shard that has them
+        shard_teams = (None, None)
+        for game in games:
+            game = dict(game)
+            if game['p1team'] is None:
+                (game['p1team'], game['p2team']) = shard_teams
+            else:
+                shard_teams = (game['p1team'], game['p2team'])
+            if merged and game['seconds'] - merged[-1]['seconds'] < MIN_GAME_SECONDS:
+                continue
+            merged.append(game)
+
+    prev_game = None
+    for game in merged:
+        game['next_in_set'] = same_set(game, prev_game, NETPLAY) or game['p1team'] is None
+        prev_game = game
+    return merged
+
+
+# Timestamps and TWB CSV for a list of merged games, the same as Stamper.run
+# would have produced. Returns (timestamp data, csv data, lines for the log).
+def format_games(games, total_seconds, EVENT, DATE, REGION, NETPLAY, VERSION, URL, **settings):
+    timestamp_list = []
+    csv_list = [twb_csv_header()]
+    log_lines = []
+    for game in games:
+        if game['next_in_set']:
+            continue
+        line = timestamp_line(game, total_seconds)
+        timestamp_list.append(line)
+        log_lines.append(line)
+        log_lines.extend(game_warnings(game))
+        csv_list.append(game_csv_row(game, EVENT, DATE, REGION, NETPLAY, VERSION, URL))
+    return ("\n".join(timestamp_list), "\n".join(csv_list), log_lines)
@@ -0,0 +1,48 @@
+import sys
+import logging
+import argparse
+from glob import glob
+import numpy as np
+import tensorflow as tf
+from keras.models import load_model
+
+from utils.ml import shared_model_path, TFLiteModel
+
+# Largest difference in output allowed between a model and its converted
+# version before giving up on it
+MAX_OUTPUT_DIFFERENCE = 1e-4
+
+
+# Same model, same float32 weights, but as a TFLite file that can be memory
+# mapped by every process that uses it (see utils.ml.use_shared_models)
+def convert_model(path):
+    model = load_model(path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    shared_path = shared_model_path(path)
+    with open(shared_path, "wb") as f:
+        f.write(converter.convert())
+
+    # Random inputs are plenty to tell whether the conversion worked
+    converted = TFLiteModel(shared_path)
+    inputs = np.random.default_rng(0).random((8, *model.input_shape[1:]), dtype=np.float32)
+    difference = max(
+        np.abs(model.predict(img_array[np.newaxis], verbose=None) - converted.predict(img_array[np.newaxis])).max()
+        for img_array in inputs
+    )
+    if difference > MAX_OUTPUT_DIFFERENCE:
+        raise ValueError(f"{shared_path} gives different answers to {path} (off by {difference})")
+    return f"{path} -> {shared_path} (outputs within {difference:.1e})"
+
+
+# python -m utils.shared_models [models...]
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Make memory mappable versions of the character models for process pools")
+    parser.add_argument("models", nargs="*", help="models to convert (default: every .h5 in models/)")
+    args = parser.parse_args()
+
+    models = args.models or sorted(glob("models/*.h5"))
+    if not models:
+        sys.exit("ERROR: no models to convert")
+    for path in models:
+        print(convert_model(path))
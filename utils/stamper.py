@@ -0,0 +1,716 @@
+import os
+import json
+import time
+import logging
+from collections import deque
+from statistics import mode
+from concurrent.futures import ThreadPoolExecutor, wait as wait_for_futures
+
+import numpy as np
+
+from utils.ocr       import ocr_name, fuzzymatch_with_score
+from utils.cv2       import *
+from utils.timestamp import display_timestamp, timestamp_url
+from utils.csv       import twb_csv_header, twb_csv_row
+from utils.ml        import get_model, choose_model_path, predict_char1, predict_char23
+from utils.timeline  import Timeline
+from utils.scan_pipeline import ScanPipeline
+from utils.portrait_index import PortraitIndex
+from utils.teams     import TeamInference, CONFIDENCE as TEAM_CONFIDENCE
+from utils.game_state import GameTracker, DEFAULT_SKIP_STRIDE
+from utils.hud_layout import hud_layout
+from utils.frame_cache import FrameCache, DEFAULT_FRAME_CACHE_MB
+from utils.hud_cache import HUDStrips, HUDStripPool, DEFAULT_HUD_CACHE_SCALE
+from utils.name_plates import NamePlateFingerprints, name_plate_vector, NAME_MATCH_SAMPLES
+
+
+# Name plates OCR'd at once, each one is a separate Tesseract process
+DEFAULT_OCR_THREADS = min(8, os.cpu_count() or 1)
+
+# Seconds after a round start to keep guessing names for. Things can block
+# and obscure the names for a LONG time, so lots of guesses are necessary.
+NAME_WINDOW_SECONDS = 20
+
+# Live, the name window gets shortened to make the latency target, leaving
+# this long for everything else, but never shorter than the minimum
+LIVE_MARGIN_SECONDS = 10
+MIN_NAME_WINDOW_SECONDS = 5
+
+# How often to say how far behind a live video we are (video seconds)
+LAG_REPORT_INTERVAL = 60
+
+# From experimentation, this seems to work well as a brightness threshold
+PNAME_THRESHOLD = 190
+
+# How many games can be waiting on names and teams before the main scan
+# waits for them to catch up. Each one needs its frames kept around until
+# then, which live means kept in memory.
+MAX_ENRICHING_GAMES = 4
+
+# How often to check for finished games while waiting on one (seconds)
+ENRICH_POLL_INTERVAL = 0.1
+
+
+# Do nothing with a callback that nobody asked for
+def ignore(*args):
+    pass
+
+
+# Everything found out about one game. p1team/p2team are (char1, char2,
+# char3, confidence), or None for a game that's just the next one in a set
+# (teams are only guessed at the start of a set).
+def game_record(seconds, p1name, p2name, p1team=None, p2team=None):
+    return dict(seconds=seconds, p1name=p1name, p2name=p2name, p1team=p1team, p2team=p2team)
+
+
+# Whether two games look like they're part of the same set. If any name is _,
+# we can't be sure so they never are.
+def same_set(game, prev_game, NETPLAY):
+    if prev_game is None or NETPLAY != 1 or "_" in (game['p1name'], game['p2name']):
+        return False
+    return (game['p1name'], game['p2name']) in [
+        (prev_game['p1name'], prev_game['p2name']),
+        (prev_game['p2name'], prev_game['p1name'])
+    ]
+
+
+# Team display string, eg. PW/AN/BD
+def team_string(char1, char2, char3):
+    team = char1
+    if char2 != "N":
+        team += f"/{char2}"
+        if char3 != "N":
+            team += f"/{char3}"
+    return team
+
+
+# Timestamp line for the first game of a set
+def timestamp_line(game, total_seconds):
+    timestamp = display_timestamp(game['seconds'], total_seconds)
+    p1team = team_string(*game['p1team'][:3])
+    p2team = team_string(*game['p2team'][:3])
+    return f"{timestamp} {game['p1name']} ({p1team}) vs {game['p2name']} ({p2team})"
+
+
+# Things about a set's first game that somebody should double check
+def game_warnings(game):
+    warnings = []
+    # Teams are always valid now, but they might not be right
+    for team in [game['p1team'], game['p2team']]:
+        if team[3] < TEAM_CONFIDENCE:
+            warnings.append(f"### WARNING! Unsure about team {team_string(*team[:3])} ({team[3]:.0%}), please check manually")
+    if game['p1name'] == game['p2name'] and game['p1name'] != "_":
+        warnings.append("### WARNING! Duplicate names detected, please correct manually")
+    return warnings
+
+
+# The earliest second anything could still want to read, given the main scan
+# is at seconds: games still being enriched need their windows, and if the
+# game being skimmed turns out to be over, the scan goes back to where it
+# was last seen going
+def earliest_needed(seconds, enriching, game_tracker):
+    needed = [seconds] + [game_seconds for (game_seconds, _) in enriching]
+    if game_tracker.in_game:
+        needed.append(game_tracker.resume_seconds)
+    return min(needed)
+
+
+def game_csv_row(game, EVENT, DATE, REGION, NETPLAY, VERSION, URL):
+    return twb_csv_row(
+        EVENT, DATE, REGION, NETPLAY, VERSION,
+        game['p1name'], *game['p1team'][:3],
+        game['p2name'], *game['p2team'][:3],
+        timestamp_url(URL, game['seconds'])
+    )
+
+
+# Finds sets in a video and works out who's playing what. Doesn't know
+# anything about Qt, so the same code can run in the GUI worker thread or
+# headless in a separate process. Progress is reported through callbacks.
+class Stamper:
+    def __init__(self, *args, **kwargs):
+        self.stop = False
+
+        # Unpack arguments
+        self.GAME_X        = kwargs['GAME_X']
+        self.GAME_Y        = kwargs['GAME_Y']
+        self.GAME_SIZE     = kwargs['GAME_SIZE']
+        self.MAKE_CSV      = kwargs['MAKE_CSV']
+        self.EVENT         = kwargs['EVENT']
+        self.DATE          = kwargs['DATE']
+        self.REGION        = kwargs['REGION']
+        if kwargs['NETPLAY'] == True:
+            self.NETPLAY   = 1
+        else:
+            self.NETPLAY   = 0
+        self.VERSION       = kwargs['VERSION']
+        self.URL           = kwargs['URL']
+        self.capture_pool  = kwargs['capture_pool']
+        self.start_seconds = kwargs['start_seconds']
+        self.total_seconds = kwargs['total_seconds']
+        self.outfile_name  = kwargs['outfile_name']
+        # A video that's still being written has no length yet, and could
+        # go on for hours, so its timestamps always get an hour on the front
+        if self.capture_pool.growing_at_open:
+            self.display_total = max(self.total_seconds, 3600)
+        else:
+            self.display_total = self.total_seconds
+        # Optional settings
+        self.QUANTIZED     = kwargs.get('QUANTIZED', False)
+        self.OCR_THREADS   = kwargs.get('OCR_THREADS', DEFAULT_OCR_THREADS)
+        self.SKIP_STRIDE   = kwargs.get('SKIP_STRIDE', DEFAULT_SKIP_STRIDE)
+        self.FRAME_CACHE_MB = kwargs.get('FRAME_CACHE_MB', DEFAULT_FRAME_CACHE_MB)
+        # Decode just the top of the video once, and read it from disk after
+        # that (see utils/hud_cache.py)
+        self.HUD_CACHE       = kwargs.get('HUD_CACHE', False)
+        self.HUD_CACHE_SCALE = kwargs.get('HUD_CACHE_SCALE', DEFAULT_HUD_CACHE_SCALE)
+        # Where to export everything found in detail (see utils/export.py),
+        # if anywhere
+        self.EXPORT_DIR      = kwargs.get('EXPORT_DIR', "")
+        # Only look for games starting before this second (for processing a
+        # video in pieces). Frames after it are still read to finish off a
+        # game that started just before.
+        self.end_seconds   = kwargs.get('end_seconds', None)
+        # Username aliases, instead of reading config/usernames.json
+        self.USERNAMES     = kwargs.get('USERNAMES', None)
+        # For live videos: how soon after a set starts it should be reported
+        self.LATENCY_TARGET  = kwargs.get('LATENCY_TARGET', None)
+        # Where to write the list of timestamps, if anywhere
+        self.timestamps_name = kwargs.get('timestamps_name', None)
+
+        # Every game found, in order, see game_record
+        self.games = []
+        # Every name plate pair OCR'd, as (seconds, p1 text, p2 text,
+        # p1 guess, p2 guess, p1 match score, p2 match score)
+        self.name_samples = []
+        # Every frame the characters were guessed from, as (seconds, char1
+        # probs, char23 probs) shaped like Timeline.record_chars takes them
+        self.char_samples = []
+
+        # Wall clock seconds spent in each part of run(): "setup", "scan"
+        # (waiting on decoding and round start detection), "names" and
+        # "teams". Names and teams happen alongside the scan, so these can
+        # add up to more than the whole run took.
+        self.stage_seconds = {}
+
+        # Frames read outside the main scan, shared by the name and team
+        # windows
+        self.frame_cache = FrameCache(self.FRAME_CACHE_MB * 1024 * 1024)
+
+        # Callbacks for reporting progress
+        self.print_line    = kwargs.get('print_line', ignore)
+        self.show_frame    = kwargs.get('show_frame', ignore)
+        self.update_slider = kwargs.get('update_slider', ignore)
+        self.report_game   = kwargs.get('report_game', ignore)
+
+    def signal_to_stop(self):
+        self.stop = True
+
+    # Whether the main scan should carry on at this second
+    def scanning(self, seconds) -> bool:
+        if self.end_seconds is not None:
+            return seconds < self.end_seconds
+        # A video that's still being written has no end yet, the scan
+        # pipeline will say when it runs out
+        return seconds < self.total_seconds or self.capture_pool.growing_at_open
+
+    # Whether the video has this second in it. If it's still being written
+    # (or is live), wait for it to get that far first.
+    def has_frame(self, seconds) -> bool:
+        if self.capture_pool.growing_at_open:
+            return self.capture_pool.wait_for(seconds, lambda: self.stop)
+        return seconds < self.total_seconds
+
+    # How many seconds of video there are that we haven't got to yet
+    def lag(self, seconds) -> int:
+        return max(0, self.capture_pool.total_seconds - seconds)
+
+    # Read a frame on our own handle (call has_frame first). Full frames come
+    # from the frame cache if they've been read recently. None if it can't be
+    # read, eg. live when it's already been thrown away.
+    def read_frame(self, seconds, crop=False):
+        if not crop:
+            image = self.frame_cache.get(seconds)
+            if image is not None:
+                return image
+        if self.capture_pool.is_stale(self.capture):
+            self.capture_pool.release(self.capture)
+            self.capture = self.capture_pool.acquire()
+        image = read_frame_from_video(self.capture, seconds, self.GAME_X, self.GAME_Y, self.GAME_SIZE, crop)
+        if image is None:
+            logging.warning(f"Failed to read frame at t = {seconds} from capture")
+            return None
+        if not crop:
+            image = self.frame_cache.put(seconds, image)
+        return image
+
+    # Save the CSV and timestamps found so far
+    def write_outputs(self, csv_list, timestamp_list):
+        if self.MAKE_CSV:
+            with open(self.outfile_name, "w") as f:
+                f.write("\n".join(csv_list))
+        if self.timestamps_name:
+            with open(self.timestamps_name, "w") as f:
+                f.write("\n".join(timestamp_list))
+
+    # Stop the current scan pipeline (if any) and start a new one from the
+    # given second, reading every stride'th second
+    def restart_scan(self, scan_pipeline, seconds, stride=1):
+        if scan_pipeline is not None:
+            scan_pipeline.close()
+        scan_pipeline = ScanPipeline(
+            self.capture_pool, self.GAME_X, self.GAME_Y, self.GAME_SIZE,
+            seconds, self.total_seconds, stride
+        )
+        scan_pipeline.start()
+        return scan_pipeline
+
+    # Switch over to reading from the video's HUD cache, decoding whatever
+    # hasn't made it in there yet first. Stays on the video if stopped before
+    # that finished.
+    def use_hud_cache(self):
+        strips = HUDStrips(
+            self.capture_pool.filename, self.total_seconds,
+            self.GAME_X, self.GAME_Y, self.GAME_SIZE, self.HUD_CACHE_SCALE
+        )
+        if not strips.complete:
+            self.print_line(f"Decoding the HUD into {strips.path}, from {display_timestamp(strips.done, self.display_total)}...")
+            if not strips.build(self.capture_pool, lambda: self.stop, self.update_slider):
+                return
+        self.capture_pool = HUDStripPool(self.capture_pool.filename, strips)
+        self.GAME_X = 0
+        self.GAME_Y = 0
+        self.GAME_SIZE = strips.size
+
+    # Add the time since started (from time.perf_counter) to a stage's total
+    def add_stage_time(self, stage, started):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0) + time.perf_counter() - started
+
+    # Work out the names in a game starting at seconds, as (p1name, p2name)
+    def guess_names(self, seconds):
+        # Try to guess the player names. Don't even try for offline games.
+        # TODO with stream overlay support maybe this could be changed
+        if self.NETPLAY != 1:
+            # Offline games won't have player tags
+            return ("_", "_")
+
+        # Most of the time it's just the next game in a set, which the name
+        # plates alone can usually tell without any OCR
+        fresh_plates = []
+        for retry_seconds in range(seconds, seconds + NAME_MATCH_SAMPLES):
+            if not self.has_frame(retry_seconds):
+                break
+            image = self.read_frame(retry_seconds)
+            if image is None:
+                break
+            fresh_plates.append(self.layout.name_imgs(image))
+        matched_names = self.name_plates.match(fresh_plates)
+        if matched_names is not None:
+            logging.debug(f"{display_timestamp(seconds, self.display_total)}: name plates match the last game's, skipping OCR")
+            return matched_names
+
+        # Take a series of guesses
+        # Tesseract spends most of its time outside of Python, so OCR the
+        # crops on a thread pool while we keep decoding, then go through the
+        # results in order
+        p1name_guesses = []
+        p2name_guesses = []
+        name_samples = []
+        ocr_futures = []
+        retry_seconds = seconds
+        while retry_seconds < seconds + self.name_window and \
+              self.has_frame(retry_seconds):
+            # Monitor regularly for stop signal
+            if self.stop:
+                break
+            guess_timestamp = display_timestamp(retry_seconds, self.display_total).replace(':','-')
+            image = self.read_frame(retry_seconds)
+            if image is None:
+                break
+            p1name_img, p2name_img = self.layout.name_imgs(image)
+            # Before OCR gets its hands on the crops, it draws all over them
+            plate_vectors = (name_plate_vector(p1name_img), name_plate_vector(p2name_img))
+            ocr_futures.append((
+                retry_seconds,
+                plate_vectors,
+                self.ocr_pool.submit(ocr_name, p1name_img, PNAME_THRESHOLD, debug_name=f"{guess_timestamp}_p1name"),
+                self.ocr_pool.submit(ocr_name, p2name_img, PNAME_THRESHOLD, debug_name=f"{guess_timestamp}_p2name")
+            ))
+            retry_seconds += 1
+        for (guess_seconds, plate_vectors, p1name_future, p2name_future) in ocr_futures:
+            # Don't wait around for OCR nobody wants any more
+            if self.stop:
+                p1name_future.cancel()
+                p2name_future.cancel()
+                continue
+            p1name_text = p1name_future.result()
+            p2name_text = p2name_future.result()
+            if self.timeline:
+                self.timeline.record_names(guess_seconds, p1name_text, p2name_text)
+            (p1name_guess, p1name_score) = fuzzymatch_with_score(p1name_text, self.usernames_dict)
+            if p1name_guess != "_":
+                p1name_guesses.append(p1name_guess)
+            (p2name_guess, p2name_score) = fuzzymatch_with_score(p2name_text, self.usernames_dict)
+            if p2name_guess != "_":
+                p2name_guesses.append(p2name_guess)
+            self.name_samples.append((
+                guess_seconds, p1name_text, p2name_text,
+                p1name_guess, p2name_guess, p1name_score, p2name_score
+            ))
+            name_samples.append((*plate_vectors, p1name_guess, p2name_guess))
+        # Take the most common guess from each set
+        if p1name_guesses:
+            p1name = mode(p1name_guesses)
+        else:
+            p1name = "_"
+        if p2name_guesses:
+            p2name = mode(p2name_guesses)
+        else:
+            p2name = "_"
+        self.name_plates.remember(p1name, p2name, name_samples)
+        return (p1name, p2name)
+
+    # Guess team characters for a fresh set starting at seconds, as
+    # ((char1, char2, char3, confidence) for p1, the same for p2). Pool the
+    # model outputs over a few frames and pick the most likely valid team,
+    # stopping as soon as we're sure.
+    def guess_teams(self, seconds, round_start_image):
+        p1team_inference = TeamInference()
+        p2team_inference = TeamInference()
+        retry_seconds = seconds
+        # this is a bit dangerous because the teams could change
+        # immediately after the match starts but oh well
+        while retry_seconds < seconds + 10 and \
+              self.has_frame(retry_seconds):
+            # Monitor regularly for stop signal
+            if self.stop:
+                break
+            guess_timestamp = display_timestamp(retry_seconds, self.display_total).replace(':','-')
+            if retry_seconds == seconds:
+                image = round_start_image
+            else:
+                image = self.read_frame(retry_seconds)
+                if image is None:
+                    break
+            crops = self.layout.extract(image)
+            p1char1_img, p2char1_img = crops.char1[0]
+            p1char2_img, p2char2_img = crops.char2[0]
+            p1char3_img, p2char3_img = crops.char3[0]
+            p1char1_probs = predict_char1(p1char1_img,  self.char1_model,  debug_name=f"{guess_timestamp}/p1char1", portrait_index=self.portrait_index)
+            p2char1_probs = predict_char1(p2char1_img,  self.char1_model,  debug_name=f"{guess_timestamp}/p2char1", portrait_index=self.portrait_index)
+            p1char2_probs = predict_char23(p1char2_img, self.char23_model, debug_name=f"{guess_timestamp}/p1char2", portrait_index=self.portrait_index)
+            p2char2_probs = predict_char23(p2char2_img, self.char23_model, debug_name=f"{guess_timestamp}/p2char2", portrait_index=self.portrait_index)
+            p1char3_probs = predict_char23(p1char3_img, self.char23_model, debug_name=f"{guess_timestamp}/p1char3", portrait_index=self.portrait_index)
+            p2char3_probs = predict_char23(p2char3_img, self.char23_model, debug_name=f"{guess_timestamp}/p2char3", portrait_index=self.portrait_index)
+            char1_probs  = [p1char1_probs, p2char1_probs]
+            char23_probs = [[p1char2_probs, p1char3_probs], [p2char2_probs, p2char3_probs]]
+            if self.timeline:
+                self.timeline.record_chars(retry_seconds, char1_probs, char23_probs)
+            self.char_samples.append((retry_seconds, char1_probs, char23_probs))
+            p1team_inference.add(p1char1_probs, p1char2_probs, p1char3_probs)
+            p2team_inference.add(p2char1_probs, p2char2_probs, p2char3_probs)
+            retry_seconds += 1
+            if p1team_inference.confident() and p2team_inference.confident():
+                break
+        return (p1team_inference.best(), p2team_inference.best())
+
+    # Everything about the game starting at seconds, as a game_record, or
+    # None if we were stopped partway through. Runs on the enrichment thread,
+    # one game at a time in order, since whether a game needs OCR or teams
+    # at all depends on the game before it.
+    def enrich_game(self, seconds, round_start_image):
+        stage_started = time.perf_counter()
+        (p1name, p2name) = self.guess_names(seconds)
+        self.add_stage_time("names", stage_started)
+
+        # Monitor regularly for stop signal
+        if self.stop:
+            return None
+
+        # Ignore this timestamp if it looks like it's just another game in
+        # a set (ie. the previous game had the same two players)
+        # If any name is _, always make a timestamp since we can't be sure
+        game = game_record(seconds, p1name, p2name)
+        if not same_set(game, self.last_enriched, self.NETPLAY):
+            stage_started = time.perf_counter()
+            (p1team, p2team) = self.guess_teams(seconds, round_start_image)
+            self.add_stage_time("teams", stage_started)
+
+            # Monitor regularly for stop signal
+            if self.stop:
+                return None
+            game = game_record(seconds, p1name, p2name, p1team, p2team)
+        self.last_enriched = game
+        return game
+
+    # Add a game that's finished enrichment to the results
+    def record_game(self, game, csv_list, timestamp_list):
+        # Just another game in the set, teams only get guessed for the first
+        timestamp = display_timestamp(game['seconds'], self.display_total)
+        if game['p1team'] is None:
+            self.print_line(f"{timestamp} (next game in set)")
+            self.games.append(game)
+            self.set_length += 1
+            return
+
+        # If the previous set was only 1 game in length and --only-sets
+        # was supplied, then it doesn't actually get timestamped. 
+        # Retroactively remove it from the list
+
+        # if args.only_sets and timestamp_list and self.set_length == 1:
+        #     csv_list.pop()
+        #     timestamp_list.pop()
+
+        self.set_length = 1
+        self.games.append(game)
+
+        # Create a timestamp and CSV row for this game
+        line = timestamp_line(game, self.display_total)
+        self.print_line(line)
+        timestamp_list.append(line)
+        if self.MAKE_CSV:
+            csv_list.append(
+                game_csv_row(game, self.EVENT, self.DATE, self.REGION, self.NETPLAY, self.VERSION, self.URL)
+            )
+        for warning in game_warnings(game):
+            self.print_line(warning)
+        self.report_game(game)
+
+        # Live, get it out there straight away
+        if self.capture_pool.growing_at_open:
+            self.write_outputs(csv_list, timestamp_list)
+            latency = self.lag(game['seconds'])
+            self.print_line(f"(reported {latency}s after the set started)")
+            if self.LATENCY_TARGET is not None and latency > self.LATENCY_TARGET:
+                self.print_line(f"### WARNING! Over the {self.LATENCY_TARGET}s latency target, processing can't keep up")
+
+    # Record games whose enrichment has finished, strictly in the order they
+    # started, so a slow game holds back the ones after it. With wait, wait
+    # for everything still going.
+    def record_enriched(self, enriching, csv_list, timestamp_list, wait=False):
+        while enriching and (wait or enriching[0][1].done()):
+            if self.stop:
+                return
+            (_, future) = enriching.popleft()
+            game = future.result()
+            if game is not None:
+                self.record_game(game, csv_list, timestamp_list)
+
+    # Record whatever's finished enriching and let go of frames nothing will
+    # read again, given the main scan is at seconds. Live, the input stops
+    # once its buffer is full until frames get let go of, so this has to
+    # keep happening whenever the main scan is waiting on anything.
+    def catch_up(self, seconds, enriching, game_tracker, csv_list, timestamp_list):
+        self.record_enriched(enriching, csv_list, timestamp_list)
+        self.capture_pool.discard_before(earliest_needed(seconds, enriching, game_tracker))
+
+    # Process the video and return the list of timestamps
+    def run(self):
+        stage_started = time.perf_counter()
+        # Load tensorflow models for identifying characters
+        self.char1_model  = get_model(choose_model_path('models/char1_model.h5', self.QUANTIZED))
+        self.char23_model = get_model(choose_model_path('models/char23_model.h5', self.QUANTIZED))
+        # Cheap nearest neighbour lookup that gets first go at each portrait
+        self.portrait_index = PortraitIndex.load(self.VERSION)
+        if self.portrait_index is None:
+            logging.info(f"No portrait index for {self.VERSION}, using the models for every portrait")
+
+        # Get our own decoder handle so we don't disturb anyone else reading
+        # the same video (eg. the GUI's preview)
+        self.capture = self.capture_pool.acquire()
+        self.add_stage_time("setup", stage_started)
+
+        # Keep everything we measure so detection can be re-run later without
+        # decoding the video again. Timelines can't grow, so not for a video
+        # that's still being written.
+        self.timeline = None
+        if not self.capture_pool.growing_at_open:
+            try:
+                self.timeline = Timeline(
+                    self.capture_pool.filename, self.total_seconds,
+                    self.GAME_X, self.GAME_Y, self.GAME_SIZE
+                )
+            except OSError as e:
+                logging.warning(f"Couldn't open timeline, measurements won't be saved ({e})")
+
+        # Only worth it for a whole video that's all there on disk
+        if self.HUD_CACHE and self.end_seconds is None and \
+           not self.capture_pool.growing_at_open and os.path.isfile(self.capture_pool.filename):
+            self.capture_pool.release(self.capture)
+            self.use_hud_cache()
+            self.capture = self.capture_pool.acquire()
+
+        # Live, fewer name guesses so sets get reported in time
+        self.name_window = NAME_WINDOW_SECONDS
+        if self.LATENCY_TARGET is not None:
+            self.name_window = max(MIN_NAME_WINDOW_SECONDS, min(NAME_WINDOW_SECONDS, self.LATENCY_TARGET - LIVE_MARGIN_SECONDS))
+        next_lag_report = self.start_seconds + LAG_REPORT_INTERVAL
+
+        # Open a dictionary of known usernames and aliases
+        if self.USERNAMES is not None:
+            self.usernames_dict = self.USERNAMES
+        else:
+            with open("config/usernames.json", "r") as f:
+                self.usernames_dict = json.load(f)
+
+        # Manual start time for debugging
+        # start_hours, start_minutes, start_seconds = 0, 0, 0
+        # seconds = start_hours*3600 + start_minutes*60 + start_seconds
+        # Start at the point on the slider selected by the user
+        seconds = self.start_seconds
+        self.set_length = 1
+        csv_list = [twb_csv_header()]
+        timestamp_list = []
+
+        # Threads for running Tesseract on name plates
+        self.ocr_pool = ThreadPoolExecutor(max_workers=self.OCR_THREADS)
+
+        # Names and teams get worked out on their own thread while the main
+        # scan carries on looking for round starts. (seconds, future) for
+        # each game that hasn't been recorded yet, in order.
+        enrich_pool = ThreadPoolExecutor(max_workers=1)
+        enriching = deque()
+        self.last_enriched = None
+
+        # Decode and look for round starts ahead of the main scan
+        scan_pipeline = self.restart_scan(None, seconds)
+
+        # Once a game has been found, skims through it until it's over
+        game_tracker = GameTracker(self.GAME_SIZE, self.SKIP_STRIDE)
+
+        # Where the names and portraits are, worked out once up front
+        self.layout = hud_layout(self.GAME_SIZE)
+
+        # What the last game's name plates looked like
+        self.name_plates = NamePlateFingerprints()
+
+        # Showtime. Try to find round starts and guess who's playing and what team
+        self.print_line("\nProcessing video...")
+        while self.scanning(seconds):
+            timestamp = display_timestamp(seconds, self.display_total)
+
+            # Monitor regularly for stop signal
+            if self.stop:
+                break
+
+            # Whatever's finished enriching since last time
+            self.catch_up(seconds, enriching, game_tracker, csv_list, timestamp_list)
+            if self.capture_pool.growing_at_open and seconds >= next_lag_report:
+                self.print_line(f"Live: up to {timestamp}, {self.lag(seconds)}s behind")
+                next_lag_report = seconds + LAG_REPORT_INTERVAL
+
+            # Decoding and round start detection already happened in the
+            # background while we were busy with the previous seconds
+            stage_started = time.perf_counter()
+            scan_result = scan_pipeline.get(
+                seconds,
+                lambda: self.catch_up(seconds, enriching, game_tracker, csv_list, timestamp_list)
+            )
+            self.add_stage_time("scan", stage_started)
+            if scan_result is None:
+                break
+            # Every second asked for is one the pipeline was started on, so
+            # anything else means the two have got out of step
+            if scan_result.seconds != seconds:
+                logging.warning(f"Scan pipeline gave t = {scan_result.seconds} when asked for t = {seconds}, carrying on from there")
+                seconds = scan_result.seconds
+                timestamp = display_timestamp(seconds, self.display_total)
+            if scan_result.image is None:
+                self.print_line(f"Failed to read frame at t = {seconds} from capture!")
+                break
+            image = scan_result.image
+            round_start = scan_result.round_start
+            # The frame gets decoded over once the pipeline comes back around
+            # its ring, and the GUI may not have drawn it by then
+            self.show_frame(np.copy(image))
+            self.update_slider(seconds)
+
+            if self.timeline:
+                self.timeline.record_bar_diffs(seconds, scan_result.diffs, round_start)
+
+            # Going back over the seconds the last skip went over, in case
+            # another game started in there
+            if game_tracker.checking_gap:
+                if round_start:
+                    # It did, and this is its round start
+                    game_tracker.end_game()
+                elif seconds + 1 < game_tracker.gap_end:
+                    seconds += 1
+                    continue
+                else:
+                    # Nothing, so it was the same game all along
+                    seconds = game_tracker.gap_checked()
+                    scan_pipeline = self.restart_scan(scan_pipeline, seconds, game_tracker.stride)
+                    continue
+            # In the middle of a game, only sampling every few seconds
+            elif game_tracker.in_game:
+                if not game_tracker.update(seconds, image, round_start, scan_result.diffs):
+                    # It ended some time since the last sample, so go back
+                    # there and look for the next round start second by second
+                    seconds = game_tracker.resume_seconds
+                    scan_pipeline = self.restart_scan(scan_pipeline, seconds)
+                elif game_tracker.checking_gap:
+                    seconds = game_tracker.gap_start
+                    scan_pipeline = self.restart_scan(scan_pipeline, seconds)
+                else:
+                    seconds += game_tracker.stride
+                continue
+
+            if round_start:
+                # Out of the scan pipeline's ring and into the frame cache,
+                # where the name window starts from it
+                round_start_image = self.frame_cache.put(seconds, image)
+
+                # self.show_frame(np.copy(image))
+
+                # cv.imwrite(f"""green_bars_samples/{timestamp.replace(':','-')}.jpg""", image)
+
+                # Names and teams take a while, so say something straight
+                # away and fill them in once they're done
+                self.print_line(f"{timestamp} (round start, checking names...)")
+                enriching.append((seconds, enrich_pool.submit(self.enrich_game, seconds, round_start_image)))
+                # Don't get so far ahead that the frames they need are gone
+                while len(enriching) > MAX_ENRICHING_GAMES and not self.stop:
+                    wait_for_futures([enriching[0][1]], timeout=ENRICH_POLL_INTERVAL)
+                    self.catch_up(seconds, enriching, game_tracker, csv_list, timestamp_list)
+
+                # No single game of SG is going to take less than 20 seconds,
+                # so don't bother decoding any of that
+                seconds += 20
+                # And most take minutes, so skim through the rest of it
+                if game_tracker.enabled:
+                    game_tracker.start_game(seconds, round_start_image)
+                    scan_pipeline = self.restart_scan(scan_pipeline, seconds, game_tracker.stride)
+                else:
+                    scan_pipeline = self.restart_scan(scan_pipeline, seconds)
+            else:
+                seconds += 1
+
+        # Anything still going gets finished off, unless we're stopping
+        self.record_enriched(enriching, csv_list, timestamp_list, wait=True)
+        enrich_pool.shutdown(cancel_futures=True)
+
+        # Monitor regularly for stop signal
+        if self.stop:
+            self.print_line("Processing halted early!")
+        else:
+            self.print_line("Finished!")
+
+        # Save the csv at the very end after all data is collected
+        self.write_outputs(csv_list, timestamp_list)
+        if self.MAKE_CSV:
+            self.print_line(f"CSV data written to {self.outfile_name}.")
+        # Shards only have part of a video, the coordinator has the rest
+        if self.EXPORT_DIR and self.end_seconds is None:
+            # utils.export needs things from this module
+            from utils.export import export_detections
+            export_path = export_detections(self.EXPORT_DIR, self.capture_pool.filename, self)
+            self.print_line(f"Detections exported to {export_path}.")
+        scan_pipeline.close()
+        self.ocr_pool.shutdown(cancel_futures=True)
+        self.capture_pool.release(self.capture)
+        if self.timeline:
+            self.timeline.flush()
+        timestamp_data = "\n".join(timestamp_list)
+        self.print_line("\nSummary:\n" + timestamp_data)
+        return timestamp_data
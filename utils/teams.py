@@ -0,0 +1,66 @@
+import numpy as np
+from utils.ml import char1_list, char23_list
+
+# Never let the models claim anything is less likely than this, so one
+# confidently wrong frame can't rule out the right character forever
+MIN_PROBABILITY = 1e-4
+
+# Stop looking at more frames once the best team is this likely...
+CONFIDENCE = 0.99
+# ...but always look at at least this many
+MIN_FRAMES = 3
+
+
+# Which (point, mid, anchor) combinations are real teams: no duplicate
+# characters, and no anchor without a mid. Point characters can't be "N".
+def valid_team_mask():
+    char1 = np.array(char1_list)[:, None, None]
+    char2 = np.array(char23_list)[None, :, None]
+    char3 = np.array(char23_list)[None, None, :]
+    return (
+        (char1 != char2)
+        & (char1 != char3)
+        & ((char2 != char3) | (char2 == "N"))
+        & ~((char2 == "N") & (char3 != "N"))
+    )
+
+valid_teams = valid_team_mask()
+
+
+# Works out one player's team from several frames at once. Rather than taking
+# a vote of each frame's best guess per slot, this adds up the models' log
+# probabilities across frames and picks the most likely *valid* team overall.
+class TeamInference:
+    def __init__(self):
+        self.char1_log_probs = np.zeros(len(char1_list))
+        self.char2_log_probs = np.zeros(len(char23_list))
+        self.char3_log_probs = np.zeros(len(char23_list))
+        self.frames = 0
+
+    def add(self, char1_probs, char2_probs, char3_probs):
+        self.char1_log_probs += np.log(np.clip(char1_probs, MIN_PROBABILITY, 1.0))
+        self.char2_log_probs += np.log(np.clip(char2_probs, MIN_PROBABILITY, 1.0))
+        self.char3_log_probs += np.log(np.clip(char3_probs, MIN_PROBABILITY, 1.0))
+        self.frames += 1
+
+    # Probability of every (point, mid, anchor) combination, given the frames
+    # seen so far. Invalid teams are always 0.
+    def posterior(self):
+        scores = (
+            self.char1_log_probs[:, None, None]
+            + self.char2_log_probs[None, :, None]
+            + self.char3_log_probs[None, None, :]
+        )
+        scores = np.where(valid_teams, scores, -np.inf)
+        scores = np.exp(scores - scores.max())
+        return scores / scores.sum()
+
+    # The most likely team as (char1, char2, char3, probability)
+    def best(self):
+        posterior = self.posterior()
+        (i, j, k) = np.unravel_index(np.argmax(posterior), posterior.shape)
+        return (char1_list[i], char23_list[j], char23_list[k], float(posterior[i, j, k]))
+
+    # Whether there's any point looking at more frames
+    def confident(self) -> bool:
+        return self.frames >= MIN_FRAMES and self.best()[3] >= CONFIDENCE
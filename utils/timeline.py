@@ -0,0 +1,129 @@
+import os
+import json
+import logging
+import numpy as np
+from utils.cv2 import HEALTH_BAR_THRESHOLD
+from utils.ml import char1_list, char23_list
+
+# Bump this whenever timeline_dtype changes
+TIMELINE_VERSION = 1
+
+# Raw OCR text gets truncated to this many bytes
+OCR_TEXT_LENGTH = 32
+
+# One record per second of video. Everything is half precision or bytes to
+# keep a timeline around 1MB per hour of video.
+timeline_dtype = np.dtype([
+    # Whether the main scan looked at this second at all
+    ('sampled',      'u1'),
+    # Distance of each health bar slice from full health green, in the order
+    # of health_bar_slice_names
+    ('bar_diffs',    'f2', (4,)),
+    ('round_start',  'u1'),
+    # Raw OCR text from each name plate, before matching against aliases
+    ('ocr_sampled',  'u1'),
+    ('p1_ocr',       f'S{OCR_TEXT_LENGTH}'),
+    ('p2_ocr',       f'S{OCR_TEXT_LENGTH}'),
+    # Model output for each player's characters
+    ('chars_sampled', 'u1'),
+    ('char1_probs',  'f2', (2, len(char1_list))),
+    ('char23_probs', 'f2', (2, 2, len(char23_list))),
+])
+
+
+# Timelines live right next to the video they describe
+def timeline_paths(filename: str):
+    return (f"{filename}.timeline.npy", f"{filename}.timeline.json")
+
+
+# Everything the pipeline measured for a video, indexed by second and memory
+# mapped from disk. Lets detection be re-run with different thresholds or
+# voting rules without touching the video again.
+class Timeline:
+    # Open the timeline for a video, starting a fresh one if there isn't one
+    # yet or the old one was made with different settings
+    def __init__(self, filename: str, total_seconds: int, GAME_X, GAME_Y, GAME_SIZE, mode="r+"):
+        self.path, self.meta_path = timeline_paths(filename)
+        self.meta = {
+            "version":   TIMELINE_VERSION,
+            "GAME_X":    GAME_X,
+            "GAME_Y":    GAME_Y,
+            "GAME_SIZE": GAME_SIZE,
+        }
+
+        self.data = None
+        if os.path.isfile(self.path) and os.path.isfile(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                old_meta = json.load(f)
+            if old_meta == self.meta:
+                data = np.load(self.path, mmap_mode=mode)
+                if data.dtype == timeline_dtype and data.shape == (total_seconds,):
+                    self.data = data
+        if self.data is None:
+            if mode == "r":
+                raise FileNotFoundError(f"No matching timeline for {filename}")
+            logging.info(f"Starting a new timeline at {self.path}")
+            self.data = np.lib.format.open_memmap(
+                self.path, mode="w+", dtype=timeline_dtype, shape=(total_seconds,)
+            )
+            with open(self.meta_path, "w") as f:
+                json.dump(self.meta, f)
+
+    # Open an existing timeline without being able to change it
+    @classmethod
+    def load(cls, filename: str, total_seconds: int, GAME_X, GAME_Y, GAME_SIZE):
+        return cls(filename, total_seconds, GAME_X, GAME_Y, GAME_SIZE, mode="r")
+
+    def record_bar_diffs(self, seconds, diffs, round_start):
+        if 0 <= seconds < len(self.data):
+            record = self.data[seconds]
+            record['sampled']     = 1
+            record['bar_diffs']   = diffs
+            record['round_start'] = round_start
+
+    def record_names(self, seconds, p1_text, p2_text):
+        if 0 <= seconds < len(self.data):
+            record = self.data[seconds]
+            record['ocr_sampled'] = 1
+            record['p1_ocr']      = p1_text.encode("utf-8")[:OCR_TEXT_LENGTH]
+            record['p2_ocr']      = p2_text.encode("utf-8")[:OCR_TEXT_LENGTH]
+
+    # char1_probs is [p1, p2], char23_probs is [[p1char2, p1char3], [p2char2, p2char3]]
+    def record_chars(self, seconds, char1_probs, char23_probs):
+        if 0 <= seconds < len(self.data):
+            record = self.data[seconds]
+            record['chars_sampled'] = 1
+            record['char1_probs']   = char1_probs
+            record['char23_probs']  = char23_probs
+
+    def flush(self):
+        if isinstance(self.data, np.memmap) and self.data.mode != "r":
+            self.data.flush()
+
+    ###########################################################################
+    ### Re-analysis from a stored timeline
+
+    # Seconds that would count as round starts with a different threshold
+    def round_starts(self, threshold=HEALTH_BAR_THRESHOLD):
+        hits = (self.data['sampled'] == 1) & np.all(
+            self.data['bar_diffs'].astype(np.float32) <= threshold, axis=1
+        )
+        return np.flatnonzero(hits)
+
+    # Raw OCR text for each player over a window of seconds
+    def ocr_texts(self, start, end):
+        window = self.data[start:end]
+        window = window[window['ocr_sampled'] == 1]
+        return (
+            [text.decode("utf-8", "replace") for text in window['p1_ocr']],
+            [text.decode("utf-8", "replace") for text in window['p2_ocr']]
+        )
+
+    # Model output for each player's characters over a window of seconds
+    def char_probs(self, start, end):
+        window = self.data[start:end]
+        window = window[window['chars_sampled'] == 1]
+        return (
+            window['char1_probs'].astype(np.float32),
+            window['char23_probs'].astype(np.float32)
+        )